@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+"""
+bench_phases
+----------------------------------
+
+Builds a synthetic repository (see synthetic.py) and times each phase
+of a git-lint run in it separately: finding the repository, loading
+the configuration, listing the files for each of the working,
+staging, all, and revision modes, classifying them, running the
+linters, and printing the report.  Prints the results as JSON, with
+the commit of git-lint that was measured, so runs from different
+commits can be compared offline with compare.py.
+
+    python benchmarks/bench_phases.py --files 5000 --latency 0.01 > after.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+package = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path[0:0] = [package, os.path.join(package, 'git_lint'), os.path.dirname(os.path.abspath(__file__))]
+
+from git_lint.git_lint import (repository, load_config, get_filelist, select_linters,  # noqa: E402
+                               get_job_count, DispatchIndex, Linters)
+from git_lint.reporters import print_report  # noqa: E402
+from synthetic import make_repository  # noqa: E402
+
+
+FILELIST_MODES = [
+    ('working', {}),
+    ('staging', {'staging': True}),
+    ('all', {'all': True}),
+    ('revision', {'revision': 'HEAD~1'})
+]
+
+
+def measure(function, repeat):
+    """ Runs function repeat times; returns its timings and its last result """
+    outcome = []
+
+    def run():
+        outcome[:] = [function()]
+
+    timings = timeit.repeat(run, number=1, repeat=repeat)
+    return ({'min': min(timings), 'median': sorted(timings)[len(timings) // 2],
+             'runs': repeat}, outcome[0])
+
+
+def silently(function):
+    """ Runs function with its standard output thrown away """
+    stdout = sys.stdout
+    try:
+        sys.stdout = open(os.devnull, 'w')
+        return function()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def git_lint_commit():
+    try:
+        return subprocess.check_output(['git', '-C', package, 'rev-parse', 'HEAD'],
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def time_phases(arguments):
+    phases = {}
+    counts = {}
+    options = {}
+
+    def discover():
+        repository.__dict__.clear()
+        return (repository.base, repository.git_dir, repository.head)
+
+    (phases['discovery'], found) = measure(discover, arguments.repeat)
+    (phases['load_config'], config) = measure(lambda: load_config(options, repository.base),
+                                              arguments.repeat)
+
+    for (mode, mode_options) in FILELIST_MODES:
+        def listing():
+            repository.refresh()
+            return get_filelist(dict(mode_options), [])
+        (phases['get_filelist_' + mode], (filenames, unfindable)) = measure(listing, arguments.repeat)
+        counts['files_' + mode] = len(filenames)
+
+    (filenames, unfindable) = get_filelist({}, [])
+    (phases['classify'], classification) = measure(
+        lambda: DispatchIndex(config).classify(sorted(set(filenames))), arguments.repeat)
+    counts['jobs'] = len(classification.pairs)
+
+    (working_config, broken_linter_names) = select_linters(options, config)
+    working_linters = dict([(linter.name, linter) for linter in working_config])
+    pairs = [(working_linters[linter.name], filename) for (linter, filename) in classification.pairs
+             if linter.name in working_linters]
+    lintable = sorted(set([filename for (linter, filename) in pairs]))
+    jobs = arguments.jobs or get_job_count({})
+    (phases['lint'], results) = measure(
+        lambda: Linters(working_config, lintable, jobs, pairs=pairs)(), arguments.repeat)
+    counts['results'] = len(results)
+    counts['output_lines'] = sum([len(result[3]) for result in results])
+
+    (phases['print_report'], unused) = measure(
+        lambda: silently(lambda: print_report(results, set(classification.unlintable), [],
+                                              broken_linter_names, unfindable, {'bylinter': True})),
+        arguments.repeat)
+    return (phases, counts, jobs)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Times each phase of git-lint in a synthetic repository.')
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--changed', type=float, default=0.05, help='fraction of files changed in the workspace')
+    parser.add_argument('--staged', type=float, default=0.02, help='fraction of files changed and staged')
+    parser.add_argument('--untracked', type=float, default=0.02, help='untracked files, as a fraction of files')
+    parser.add_argument('--renames', type=float, default=0.01, help='fraction of files renamed')
+    parser.add_argument('--submodules', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0, help='seconds each stub linter run sleeps')
+    parser.add_argument('--lines', type=int, default=2, help='lines of output per file linted')
+    parser.add_argument('--jobs', type=int, default=0, help='linter jobs at once; defaults to the CPU count')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep', action='store_true', help='leave the synthetic repository behind')
+    arguments = parser.parse_args(argv[1:])
+
+    path = tempfile.mkdtemp(prefix='git-lint-bench-')
+    cwd = os.getcwd()
+    try:
+        repo = make_repository(path, files=arguments.files, depth=arguments.depth,
+                               changed=arguments.changed, staged=arguments.staged,
+                               untracked=arguments.untracked, renames=arguments.renames,
+                               submodules=arguments.submodules, latency=arguments.latency,
+                               lines=arguments.lines, seed=arguments.seed)
+        os.chdir(path)
+        (phases, counts, jobs) = time_phases(arguments)
+    finally:
+        os.chdir(cwd)
+        if arguments.keep:
+            print(path, file=sys.stderr)
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+
+    repo['jobs'] = jobs
+    print(json.dumps({
+        'benchmark': 'phases',
+        'commit': git_lint_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repository': repo,
+        'counts': counts,
+        'phases': phases
+    }, indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+"""
+bench_startup
+----------------------------------
+
+Measures what ``git lint --help`` costs before it does any work: how
+many processes it starts, and how long it takes.  Prints the results
+as JSON.
+
+    python benchmarks/bench_startup.py [runs]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import timeit
+
+package = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path[0:0] = [package, os.path.join(package, 'git_lint')]
+
+
+def count_help_subprocesses():
+    """ Runs --help in this process and counts every process it starts """
+    spawned = []
+    real_popen = subprocess.Popen
+
+    class CountingPopen(real_popen):
+        def __init__(self, *args, **kwargs):
+            spawned.append(args[0] if args else kwargs.get('args'))
+            real_popen.__init__(self, *args, **kwargs)
+
+    subprocess.Popen = CountingPopen
+    stdout = sys.stdout
+    argv = sys.argv
+    try:
+        sys.stdout = open(os.devnull, 'w')
+        sys.argv = ['git-lint', '--help']
+        from git_lint.__main__ import main
+        main()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        sys.argv = argv
+        subprocess.Popen = real_popen
+    return spawned
+
+
+def time_help(runs):
+    """ Runs --help in a fresh interpreter, the way a hook would """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([package, os.path.join(package, 'git_lint')])
+    with open(os.devnull, 'w') as devnull:
+        def run():
+            subprocess.check_call([sys.executable, '-m', 'git_lint', '--help'],
+                                  env=env, stdout=devnull)
+        return min(timeit.repeat(run, number=1, repeat=runs))
+
+
+def main(argv):
+    runs = (len(argv) > 1 and int(argv[1])) or 10
+    spawned = count_help_subprocesses()
+    print(json.dumps({
+        'benchmark': 'startup',
+        'help_subprocesses': len(spawned),
+        'help_seconds_min': time_help(runs),
+        'runs': runs
+    }, indent=2, sort_keys=True))
+    return (len(spawned) and 1) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+"""
+bench_status_parse
+----------------------------------
+
+Times parse_porcelain_status over synthetic 'git status -z' output of
+growing size, up to 100,000 changed paths, one in ten of them renames.
+Linear parsing shows up as a constant time per path.  Prints the
+results as JSON.
+
+    python benchmarks/bench_status_parse.py [largest]
+"""
+
+import json
+import os
+import sys
+import timeit
+
+package = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path[0:0] = [package, os.path.join(package, 'git_lint')]
+
+from git_lint.git_lint import parse_porcelain_status  # noqa: E402
+
+
+def synthetic_status(count):
+    """ Returns the entries of a status with count changed paths """
+    def entry(i):
+        path = 'src/module{}/file{}.py'.format(i % 97, i)
+        if i % 10 == 0:
+            return ['R  ' + path, 'old/' + path]
+        return [(' M ', 'M  ', '?? ')[i % 3] + path]
+    return [part for i in range(count) for part in entry(i)]
+
+
+def time_parse(count):
+    entries = synthetic_status(count)
+    parsed = []
+
+    def run():
+        parsed[:] = [len(list(parse_porcelain_status(entries)))]
+
+    seconds = min(timeit.repeat(run, number=1, repeat=3))
+    assert parsed[0] == count
+    return {'paths': count, 'seconds': seconds,
+            'microseconds_per_path': 1e6 * seconds / count}
+
+
+def main(argv):
+    largest = (len(argv) > 1 and int(argv[1])) or 100000
+    sizes = [size for size in [1000, 10000, 100000, 1000000] if size <= largest]
+    print(json.dumps({
+        'benchmark': 'status_parse',
+        'runs': [time_parse(size) for size in sizes]
+    }, indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+"""
+compare
+----------------------------------
+
+Compares two runs of bench_phases.py, phase by phase, using the best
+time of each.  Exits non-zero if any phase got slower by more than the
+threshold, so it can gate a change.
+
+    python benchmarks/compare.py before.json after.json [threshold]
+"""
+
+import json
+import sys
+
+
+def main(argv):
+    if len(argv) < 3:
+        print(__doc__.strip().splitlines()[-1].strip(), file=sys.stderr)
+        return 2
+    with open(argv[1]) as before_file, open(argv[2]) as after_file:
+        (before, after) = (json.load(before_file), json.load(after_file))
+    threshold = (len(argv) > 3 and float(argv[3])) or 1.25
+
+    if before.get('repository') != after.get('repository'):
+        print('warning: the runs used different synthetic repositories', file=sys.stderr)
+
+    print('{:<24} {:>12} {:>12} {:>8}'.format('phase', before.get('commit', '')[:10],
+                                              after.get('commit', '')[:10], 'ratio'))
+    regressed = []
+    for phase in sorted(set(before['phases']) & set(after['phases'])):
+        (old, new) = (before['phases'][phase]['min'], after['phases'][phase]['min'])
+        ratio = (old and new / old) or 1.0
+        flag = ''
+        if ratio > threshold:
+            regressed.append(phase)
+            flag = ' *'
+        print('{:<24} {:>12.6f} {:>12.6f} {:>8.2f}{}'.format(phase, old, new, ratio, flag))
+    return (len(regressed) and 1) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+"""
+synthetic
+----------------------------------
+
+Builds synthetic git repositories for benchmarking git-lint: a given
+number of files spread over a directory tree of a given depth, with a
+history of two commits, some files changed in the workspace, some
+staged, some renamed, some untracked, and some submodule entries.
+The repository is configured with stub linters whose latency and
+volume of output are controlled, so the cost of git-lint itself can
+be told apart from the cost of real linters.
+"""
+
+import copy
+import os
+import random
+import subprocess
+
+
+environment = copy.copy(os.environ)
+environment.update({
+    'LANG': 'C',
+    'LC_ALL': 'C',
+    'GIT_AUTHOR_NAME': 'Bench Mark',
+    'GIT_AUTHOR_EMAIL': 'bench@example.com',
+    'GIT_COMMITTER_NAME': 'Bench Mark',
+    'GIT_COMMITTER_EMAIL': 'bench@example.com'
+})
+
+
+stub_lint_script = """#!/bin/sh
+# stub-lint LATENCY LINES file...
+#   Sleeps LATENCY seconds, then prints LINES lines of complaint about
+#   every file.  Fails if it complained.
+latency=$1
+lines=$2
+shift 2
+[ "$latency" = "0" ] || sleep "$latency"
+for f in "$@"; do
+    i=0
+    while [ $i -lt $lines ]; do
+        echo "$f:$i: stub complaint"
+        i=$((i + 1))
+    done
+done
+[ "$lines" -eq 0 ]
+"""
+
+stub_config = """
+[stubpy]
+command = %(repodir)s/.bench/stub-lint {latency} {lines}
+match = .py
+condition = error
+
+[stubjs]
+command = %(repodir)s/.bench/stub-lint {latency} {lines}
+match = .js, jsx
+condition = error
+
+[stubjson]
+command = %(repodir)s/.bench/stub-lint {latency} 0
+match = .json
+condition = error
+"""
+
+EXTENSIONS = ['py', 'js', 'json', 'txt', 'jsx', 'md']
+
+
+def git(path, *args):
+    return subprocess.check_output(('git',) + args, cwd=path, env=environment,
+                                   universal_newlines=True)
+
+
+def write(path, text):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as handle:
+        handle.write(text)
+
+
+def synthetic_paths(files, depth, seed=0):
+    """ Returns files paths spread over a tree of directories depth deep """
+    generator = random.Random(seed)
+
+    def path(i):
+        levels = generator.randint(0, depth)
+        directories = ['dir{}'.format(generator.randint(0, 9)) for level in range(levels)]
+        return '/'.join(directories + ['file{}.{}'.format(i, EXTENSIONS[i % len(EXTENSIONS)])])
+
+    return [path(i) for i in range(files)]
+
+
+def make_repository(path, files=1000, depth=3, changed=0.05, staged=0.02, untracked=0.02,
+                    renames=0.01, submodules=2, latency=0, lines=0, seed=0):
+    """Builds a synthetic repository at path, and returns a description of it.
+
+    The ratios are fractions of files.  'changed' files are modified in
+    the workspace, 'staged' files are modified and added to the index,
+    'renames' are moved with 'git mv', and 'untracked' adds that many
+    new files git doesn't know about.
+    """
+    generator = random.Random(seed)
+    paths = synthetic_paths(files, depth, seed)
+    git(path, 'init', '-q')
+    write(os.path.join(path, '.bench', 'stub-lint'), stub_lint_script)
+    os.chmod(os.path.join(path, '.bench', 'stub-lint'), 0o755)
+    write(os.path.join(path, '.git-lint'), stub_config.format(latency=latency, lines=lines))
+    for name in paths:
+        write(os.path.join(path, name), 'original = "{}"\n'.format(name))
+    git(path, 'add', '-A')
+    git(path, 'commit', '-q', '-m', 'Initial')
+
+    for name in generator.sample(paths, max(1, int(files * changed))):
+        write(os.path.join(path, name), 'committed = "{}"\n'.format(name))
+    git(path, 'commit', '-q', '-a', '-m', 'Second')
+
+    head = git(path, 'rev-parse', 'HEAD').strip()
+    for i in range(submodules):
+        git(path, 'update-index', '--add', '--cacheinfo',
+            '160000,{},vendor/module{}'.format(head, i))
+
+    candidates = list(paths)
+    generator.shuffle(candidates)
+
+    def take(ratio):
+        count = int(files * ratio)
+        taken = candidates[:count]
+        candidates[:count] = []
+        return taken
+
+    for name in take(renames):
+        git(path, 'mv', name, name + '.renamed.py')
+    for name in take(staged):
+        write(os.path.join(path, name), 'staged = "{}"\n'.format(name))
+        git(path, 'add', name)
+    for name in take(changed):
+        write(os.path.join(path, name), 'changed = "{}"\n'.format(name))
+    for i in range(int(files * untracked)):
+        write(os.path.join(path, 'untracked', 'new{}.{}'.format(i, EXTENSIONS[i % len(EXTENSIONS)])),
+              'new = {}\n'.format(i))
+
+    return {'files': files, 'depth': depth, 'changed': changed, 'staged': staged,
+            'untracked': untracked, 'renames': renames, 'submodules': submodules,
+            'latency': latency, 'lines': lines, 'seed': seed}
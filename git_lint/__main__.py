@@ -2,8 +2,9 @@
 from __future__ import print_function
 from .options import OPTIONS
 from .option_handler import cleanup_options
-from .reporters import print_report, print_help, print_linters
-from .git_lint import load_config, run_linters, git_base
+from .reporters import print_report, stream_report, print_help, print_linters
+from .git_lint import load_config, run_linters, repository, get_revision
+from .trace import tracer
 from getopt import GetoptError
 import sys
 
@@ -14,10 +15,59 @@ NAME = 'git-lint'
 VERSION = '0.0.7'
 
 
-def main():
-    if git_base is None:
-        sys.exit(_('A git repository was not found.'))
+def report(results, unlintable_filenames, cant_lint_filenames,
+           broken_linter_names, unfindable_filenames, options):
+    """ Prints the report, and returns the exit status: the worst return code """
+    with tracer.span('report'):
+        results = print_results(results, unlintable_filenames, cant_lint_filenames,
+                                broken_linter_names, unfindable_filenames, options)
+
+    if 'timings' in options:
+        from .reporters import print_timings
+        print_timings(tracer.jobs())
+
+    if not len(results):
+        return 0
+
+    return max([i[2] for i in results if len(i)])
+
 
+def print_results(results, unlintable_filenames, cant_lint_filenames,
+                  broken_linter_names, unfindable_filenames, options):
+    """ Prints the report, returning the results it was given """
+    if 'stream' in options:
+        results = stream_report(results,
+                                unlintable_filenames,
+                                cant_lint_filenames,
+                                broken_linter_names,
+                                unfindable_filenames,
+                                options)
+    else:
+        print_report(results,
+                     unlintable_filenames,
+                     cant_lint_filenames,
+                     broken_linter_names,
+                     unfindable_filenames,
+                     options)
+    return results
+
+
+def run_linters_here(options, config, filenames):
+    """ Runs the linters, handing the jobs to workers if --serve-jobs asks for it """
+    if 'serve-jobs' not in options:
+        return run_linters(options, config, filenames)
+
+    from .distribute import Coordinator
+    coordinator = Coordinator(options, config)
+    print(_('Serving lint jobs on {}').format(coordinator.address), file=sys.stderr)
+    sys.stderr.flush()
+    try:
+        return run_linters(options, config, filenames, pool=coordinator)
+    finally:
+        coordinator.close()
+
+
+def main():
     (options, filenames, excluded_commands) = cleanup_options(OPTIONS, sys.argv)
 
     if len(excluded_commands) > 0:
@@ -26,8 +76,6 @@ def main():
             print("\t{}".format(exc))
 
     try:
-        config = load_config(options, git_base)
-
         if 'help' in options:
             print_help(OPTIONS, NAME)
             return 0
@@ -37,33 +85,104 @@ def main():
             print_version(NAME, VERSION)
             return 0
 
+        if 'merge-results' in options:
+            from .shard import load_documents, merge_documents
+            (results,
+             unlintable_filenames,
+             cant_lint_filenames,
+             broken_linter_names,
+             unfindable_filenames) = merge_documents(load_documents(filenames))
+            return report(results,
+                          unlintable_filenames,
+                          cant_lint_filenames,
+                          broken_linter_names,
+                          unfindable_filenames,
+                          options)
+
+        if 'worker' in options:
+            from .distribute import work
+            return work(options)
+
+        if 'trace' in options or 'timings' in options:
+            tracer.enable()
+
+        results = None
+        if not ('daemon' in options or 'no-daemon' in options or 'linters' in options or
+                'watch' in options or 'shard' in options or 'serve-jobs' in options or
+                tracer.enabled):
+            from .daemon import find_socket, request, DaemonUnavailable
+            socket_path = find_socket()
+            try:
+                results = socket_path and request(socket_path, options, filenames)
+            except DaemonUnavailable:
+                pass
+
+        if results:
+            (results,
+             unlintable_filenames,
+             cant_lint_filenames,
+             broken_linter_names,
+             unfindable_filenames) = results
+            return report(results,
+                          unlintable_filenames,
+                          cant_lint_filenames,
+                          broken_linter_names,
+                          unfindable_filenames,
+                          options)
+
+        with tracer.span('find_repository'):
+            base = repository.base
+        if base is None:
+            sys.exit(_('A git repository was not found.'))
+        if repository.bare and repository.revision_range(get_revision(options)) is None:
+            sys.exit(_('A bare repository can only be linted across a revision range, '
+                       'as with --revision A..B or --pr.'))
+
+        if 'daemon' in options:
+            from .daemon import serve
+            return serve(options)
+
+        with tracer.span('load_config'):
+            config = load_config(options, repository.base)
+
         if 'linters' in options:
             from .git_lint import get_linter_status
             working_linter_names, broken_linter_names = get_linter_status(config)
             print_linters(config, broken_linter_names)
             return 0
 
+        if 'watch' in options:
+            from .watch import watch
+            return watch(options, config, filenames)
+
         (results,
          unlintable_filenames,
          cant_lint_filenames,
          broken_linter_names,
-         unfindable_filenames) = run_linters(options, config, filenames)
-        
-        print_report(results,
-                     unlintable_filenames,
-                     cant_lint_filenames,
-                     broken_linter_names,
-                     unfindable_filenames,
-                     options)
-        
-        if not len(results):
-            return 0
-        
-        return max([i[2] for i in results if len(i)])
+         unfindable_filenames) = run_linters_here(options, config, filenames)
+
+        if 'shard' in options:
+            from .reporters import print_shard_results
+            from .shard import parse_shard
+            print_shard_results(parse_shard(options['shard']), options['partition'],
+                                [linter.name for linter in config], results, unlintable_filenames,
+                                cant_lint_filenames, broken_linter_names, unfindable_filenames)
+            return max([0] + [result[2] for result in results])
+
+        return report(results,
+                      unlintable_filenames,
+                      cant_lint_filenames,
+                      broken_linter_names,
+                      unfindable_filenames,
+                      options)
 
     except GetoptError as err:
         print_help(OPTIONS)
         return 1
+
+    finally:
+        if 'trace' in options:
+            tracer.write(options['trace'])
     
 
 if __name__ == '__main__':
@@ -0,0 +1,191 @@
+# Copyright (C) 2016 Elf M. Sternberg
+# Author: Elf M. Sternberg
+
+import inspect
+import re
+
+try:  # noqa: F401
+    from typing import Dict, List, Text, Any, Optional, Union, Callable, Tuple  # noqa: F401
+except:  # noqa: F401
+    pass  # noqa: F401
+
+import gettext
+_ = gettext.gettext
+
+
+# A builtin linter is a Python function that git-lint calls directly,
+# instead of starting a process for every file.  A linter section
+# asks for one with 'command = builtin:NAME', and the function is
+# called once for every file the linter handles:
+#
+#     check(linter, filename, content) -> (out, err, returncode)
+#
+# 'linter' is the section's configuration, as a dictionary, so a
+# builtin takes its parameters from keys of its own; 'content' is the
+# file's content, as bytes or a read-only memory map.  The result is
+# what the process would have printed to stdout and stderr, and its
+# exit status, and is judged by 'condition' as any linter's would be.
+#
+# A package registers its builtins with register(), or by naming them
+# in the 'git_lint.builtins' entry point group:
+#
+#     entry_points={'git_lint.builtins': ['todo = mychecks:todo']}
+#
+# A builtin registered with a validate function has its section checked
+# before the run starts: validate(linter) raises ValueError for settings
+# the builtin can't use.
+
+BUILTIN_PREFIX = 'builtin:'
+ENTRY_POINT_GROUP = 'git_lint.builtins'
+
+registry = {}  # type: Dict[str, Any]
+validators = {}  # type: Dict[str, Callable[[Dict[str, str]], None]]
+loaded = False
+
+
+#  ___          _    _
+# | _ \___ __ _(_)__| |_ _ _ _  _
+# |   / -_) _` | (_-<  _| '_| || |
+# |_|_\___\__, |_/__/\__|_|  \_, |
+#         |___/              |__/
+
+def register(name, check, validate=None):
+    # type: (str, Callable[..., Tuple[str, str, int]], Optional[Callable[[Dict[str, str]], None]]) -> None
+    """ Makes check available to linter sections as 'command = builtin:name'
+
+    Sections naming it have their settings checked by validate, if given.
+    """
+    registry[name] = check
+    if validate is not None:
+        validators[name] = validate
+
+
+def builtin(name, validate=None):
+    """ A decorator that registers the function it decorates under the name """
+    def decorate(check):
+        register(name, check, validate)
+        return check
+    return decorate
+
+
+def is_builtin(linter):
+    # type: (Dict[str, str]) -> bool
+    """ Returns true if the linter's command names a builtin """
+    return linter['command'].strip().startswith(BUILTIN_PREFIX)
+
+
+def load_entry_points():
+    """ Adds the builtins named by installed packages, once, without yet importing them """
+    global loaded
+    if loaded:
+        return
+    loaded = True
+    try:
+        from importlib.metadata import entry_points
+        found = entry_points()
+        if hasattr(found, 'select'):
+            points = found.select(group=ENTRY_POINT_GROUP)
+        else:
+            points = found.get(ENTRY_POINT_GROUP, [])
+    except ImportError:
+        try:
+            import pkg_resources
+            points = pkg_resources.iter_entry_points(ENTRY_POINT_GROUP)
+        except ImportError:
+            return
+    for point in points:
+        registry.setdefault(point.name, point)
+
+
+def find_builtin(command):
+    # type: (str) -> Optional[Callable[[Dict[str, str], str, Any], Tuple[str, str, int]]]
+    """ Returns the builtin a 'builtin:NAME' command names, or None """
+    name = command.strip()[len(BUILTIN_PREFIX):].split(' ')[0]
+    if name not in registry:
+        load_entry_points()
+    check = registry.get(name, None)
+    if check is not None and not callable(check) and hasattr(check, 'load'):
+        try:
+            check = registry[name] = check.load()
+        except Exception:
+            return None
+    return check
+
+
+def validate_builtin(linter):
+    # type: (Dict[str, str]) -> None
+    """ Raises ValueError if the builtin a linter section names can't use the section's settings """
+    name = linter['command'].strip()[len(BUILTIN_PREFIX):].split(' ')[0]
+    if find_builtin(linter['command']) is not None and name in validators:
+        validators[name](linter)
+
+
+def builtin_source(command):
+    # type: (str) -> Optional[str]
+    """ Returns the source file of the builtin a command names, or None if there's no such builtin
+
+    It stands in for the linter's executable: changing it changes the
+    linter, as far as the result cache is concerned.
+    """
+    check = find_builtin(command)
+    if check is None:
+        return None
+    try:
+        return inspect.getsourcefile(check) or inspect.getfile(check)
+    except TypeError:
+        return inspect.getsourcefile(type(check))
+
+
+#  ___      _ _ _   _
+# | _ )_  _(_) | |_(_)_ _  ___
+# | _ \ || | | |  _| | ' \(_-<
+# |___/\_,_|_|_|\__|_|_||_/__/
+#
+
+patterns = {}  # type: Dict[str, Any]
+
+
+def compile_pattern(pattern):
+    if pattern not in patterns:
+        patterns[pattern] = re.compile(pattern.encode('utf-8'), re.MULTILINE)
+    return patterns[pattern]
+
+
+def validate_regex(linter):
+    # type: (Dict[str, str]) -> None
+    if not linter.get('pattern', ''):
+        raise ValueError(_('The regex builtin needs a pattern.'))
+    try:
+        compile_pattern(linter['pattern'])
+    except re.error as error:
+        raise ValueError(str(error))
+
+
+@builtin('regex', validate_regex)
+def regex(linter, filename, content):
+    """Reports the lines that match the linter's 'pattern', as 'grep -n' would.
+
+    Each matching line is reported once, as 'number:line', and the
+    return code is 0 if any line matched and 1 if none did.  The
+    pattern is a Python regular expression.  It is looked for in the
+    whole file at once, so the file is read in a single pass, but a
+    line only counts if the pattern matches within it, so that, as
+    with grep, no match runs on from one line to the next.
+    """
+    validate_regex(linter)
+    pattern = compile_pattern(linter['pattern'])
+    lines = []
+    (position, line_number, counted) = (0, 1, 0)
+    match = pattern.search(content, position)
+    while match is not None:
+        start = content.rfind(b'\n', 0, match.start()) + 1
+        end = content.find(b'\n', match.start())
+        if end == -1:
+            end = len(content)
+        if pattern.search(content, start, end) is not None:
+            line_number = line_number + content[counted:start].count(b'\n')
+            counted = start
+            lines.append('{}:{}'.format(line_number, content[start:end].decode('utf-8', 'replace')))
+        position = end + 1
+        match = (position < len(content) and pattern.search(content, position)) or None
+    return ((len(lines) and '\n'.join(lines) + '\n') or '', '', (not len(lines) and 1) or 0)
@@ -0,0 +1,380 @@
+# Copyright (C) 2016 Elf M. Sternberg
+# Author: Elf M. Sternberg
+
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+try:
+    from urllib.request import Request, urlopen
+    from urllib.error import URLError
+except ImportError:
+    from urllib2 import Request, urlopen, URLError
+
+try:  # noqa: F401
+    from typing import Dict, List, Text, Any, Optional, Union, Callable, Tuple  # noqa: F401
+except:  # noqa: F401
+    pass  # noqa: F401
+
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+#  ___             _ _      ___         _
+# | _ \___ ____  _| | |_   / __|__ _ __| |_  ___
+# |   / -_|_-< || | |  _| | (__/ _` / _| ' \/ -_)
+# |_|_\___/__/\_,_|_|\__|  \___\__,_\__|_||_\___|
+#
+
+def make_key(*parts):
+    # type: (*Any) -> str
+    """ Returns a stable hex digest of any JSON-serializable parts """
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ResultCache(object):
+    """A store of lint results, one file per entry, kept in a directory.
+
+    Entries are content-addressed by whatever key the caller computes,
+    and hold the (filename, linter name, return code, output) tuple of
+    a single lint job.  Every hit refreshes the entry's modification
+    time, so when the store grows past its size limit the least
+    recently used entries are discarded first.
+
+    The store's size is kept as a running total in a small index file
+    beside the entries, so a run only walks the store when the total
+    says it has outgrown its limit.  Runs that write at once may each
+    miss the other's entries in the total; the walk sets it right.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        # type: (str, int) -> None
+        self.path = path
+        self.max_bytes = max_bytes
+        self.dirty = False
+        self.added = 0
+
+    def entry_path(self, key):
+        # type: (str) -> str
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def get(self, key):
+        # type: (str) -> Optional[Tuple[str, str, int, List[str]]]
+        path = self.entry_path(key)
+        try:
+            with open(path, 'r') as entry:
+                (filename, linter_name, returncode, output) = json.load(entry)
+            os.utime(path, None)
+        except (IOError, OSError, ValueError, TypeError):
+            return None
+        return (filename, linter_name, returncode, output)
+
+    def put(self, key, result):
+        # type: (str, Tuple[str, str, int, List[str]]) -> None
+        """ Writes an entry atomically; failures to write are not errors. """
+        path = self.entry_path(key)
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            try:
+                replaced = os.stat(path).st_size
+            except OSError:
+                replaced = 0
+            (handle, temporary) = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(handle, 'w') as entry:
+                json.dump(list(result), entry)
+            size = os.stat(temporary).st_size
+            os.rename(temporary, path)
+            self.added = self.added + size - replaced
+            self.dirty = True
+        except (IOError, OSError):
+            pass
+
+    def index_path(self):
+        # type: () -> str
+        return os.path.join(self.path, 'size.json')
+
+    def load_total(self):
+        # type: () -> Optional[int]
+        """ Returns the size of the store as last recorded, or None if it has to be measured """
+        try:
+            with open(self.index_path(), 'r') as index:
+                return int(json.load(index)['bytes'])
+        except (IOError, OSError, ValueError, TypeError, KeyError):
+            return None
+
+    def save_total(self, total):
+        # type: (int) -> None
+        try:
+            write_atomically(self.index_path(), json.dumps({'bytes': total}).encode('utf-8'))
+        except (IOError, OSError):
+            pass
+
+    def prune(self):
+        # type: () -> None
+        """ Discards the least recently used entries until the store fits its limit.
+
+        Unless the running total is missing or over the limit, only the
+        total is written.
+        """
+        if not self.dirty:
+            return
+        recorded = self.load_total()
+        if recorded is not None and recorded + self.added <= self.max_bytes:
+            self.save_total(max(recorded + self.added, 0))
+            (self.added, self.dirty) = (0, False)
+            return
+
+        def entry_stats():
+            for (dirpath, dirnames, filenames) in os.walk(self.path):
+                if dirpath == self.path:
+                    continue
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stats = os.stat(path)
+                    except OSError:
+                        continue
+                    yield (stats.st_mtime, stats.st_size, path)
+
+        entries = sorted(entry_stats())
+        total = sum([size for (mtime, size, path) in entries])
+        for (mtime, size, path) in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total = total - size
+        self.save_total(total)
+        (self.added, self.dirty) = (0, False)
+
+
+#   ___ _                _____
+#  / __| |___ __ _ _ _  |_   _| _ ___ ___ ___
+# | (__| / -_) _` | ' \   | || '_/ -_) -_|_-<
+#  \___|_\___\__,_|_||_|  |_||_| \___\___/__/
+#
+
+DEFAULT_CLEAN_TREES = 64
+
+
+class CleanTreeStore(object):
+    """The trees that were linted and found clean, and under what configuration.
+
+    Each entry is a (tree hash, configuration key) pair, most recent
+    first, in one small JSON file; only the most recent entries are
+    kept.  A tree found here, under the same configuration, has nothing
+    left to find wrong with it.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_CLEAN_TREES):
+        # type: (str, int) -> None
+        self.path = path
+        self.max_entries = max_entries
+
+    def load(self):
+        # type: () -> List[List[str]]
+        try:
+            with open(self.path, 'r') as store:
+                return [list(entry) for entry in json.load(store)]
+        except (IOError, OSError, ValueError, TypeError):
+            return []
+
+    def known(self, tree, key):
+        # type: (str, str) -> bool
+        return [tree, key] in self.load()
+
+    def remember(self, tree, key):
+        # type: (str, str) -> None
+        """ Records a clean tree atomically; failures to write are not errors. """
+        entries = [[tree, key]] + [entry for entry in self.load() if entry != [tree, key]]
+        try:
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            (handle, temporary) = tempfile.mkstemp(dir=os.path.dirname(self.path))
+            with os.fdopen(handle, 'w') as store:
+                json.dump(entries[:self.max_entries], store)
+            os.rename(temporary, self.path)
+        except (IOError, OSError):
+            pass
+
+
+#  ___ _                   _    ___         _
+# / __| |_  __ _ _ _ ___ __| |  / __|__ _ __| |_  ___
+# \__ \ ' \/ _` | '_/ -_) _` | | (__/ _` / _| ' \/ -_)
+# |___/_||_\__,_|_| \___\__,_|  \___\__,_\__|_||_\___|
+#
+
+SHARED_TIMEOUT_SECONDS = 5
+SHARED_CONNECTIONS = 8
+
+
+def write_atomically(path, content):
+    # type: (str, bytes) -> None
+    """ Writes the file, readable by everyone, by renaming a complete temporary file over it """
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    (handle, temporary) = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(handle, 'wb') as entry:
+            entry.write(content)
+        os.chmod(temporary, 0o644)
+        os.rename(temporary, path)
+    except (IOError, OSError):
+        os.unlink(temporary)
+        raise
+
+
+class DirectoryBackend(object):
+    """Shared entries kept as files in a directory, such as one on NFS.
+
+    Every entry is written to a temporary file beside it and renamed
+    into place, so no reader, on any machine, sees half an entry.
+    """
+
+    def __init__(self, path):
+        # type: (str) -> None
+        self.path = path
+
+    def get(self, key):
+        # type: (str) -> Optional[bytes]
+        try:
+            with open(os.path.join(self.path, key[:2], key[2:]), 'rb') as entry:
+                return entry.read()
+        except (IOError, OSError):
+            return None
+
+    def put(self, key, content):
+        # type: (str, bytes) -> None
+        try:
+            write_atomically(os.path.join(self.path, key[:2], key[2:]), content)
+        except (IOError, OSError):
+            pass
+
+
+class HTTPBackend(object):
+    """Shared entries kept by a web server, as GET and PUT of URL/key.
+
+    Any server that stores what is PUT, and returns it on a GET, will
+    do.  The first time the server can't be reached, it is left alone
+    for the rest of the run, so an unreachable server costs one timeout.
+    """
+
+    def __init__(self, url, timeout=SHARED_TIMEOUT_SECONDS):
+        # type: (str, float) -> None
+        self.url = url.rstrip('/') + '/'
+        self.timeout = timeout
+        self.reachable = True
+
+    def request(self, key, content=None):
+        if not self.reachable:
+            return None
+        request = Request(self.url + key, data=content)
+        if content is not None:
+            request.add_header('Content-Type', 'application/json')
+            request.get_method = lambda: 'PUT'
+        try:
+            response = urlopen(request, timeout=self.timeout)
+            try:
+                return response.read()
+            finally:
+                response.close()
+        except URLError as error:
+            # A 404 is only a miss; anything else means the server isn't there.
+            if getattr(error, 'code', None) is None:
+                self.reachable = False
+            return None
+        except (IOError, OSError, ValueError):
+            self.reachable = False
+            return None
+
+    def get(self, key):
+        # type: (str) -> Optional[bytes]
+        return self.request(key)
+
+    def put(self, key, content):
+        # type: (str, bytes) -> None
+        self.request(key, content)
+
+
+def make_backend(location):
+    """ Returns the backend for a shared cache at a URL or in a directory """
+    if location.startswith('http://') or location.startswith('https://'):
+        return HTTPBackend(location)
+    return DirectoryBackend(os.path.abspath(os.path.expanduser(location)))
+
+
+class SharedCache(object):
+    """Lint results shared between machines, signed so they can be trusted.
+
+    Every entry carries an HMAC-SHA256 of its key and its result, made
+    with a secret the team shares.  An entry that doesn't verify, as
+    one put there by anyone without the secret would not, is treated as
+    missing, so a forged passing result can't hide a failure.  Entries
+    are written at the end of the run, several at a time.
+    """
+
+    def __init__(self, backend, secret):
+        # type: (Any, bytes) -> None
+        self.backend = backend
+        self.secret = secret
+        self.pending = []
+
+    def sign(self, key, result):
+        # type: (str, List[Any]) -> str
+        message = json.dumps([key, result], sort_keys=True).encode('utf-8')
+        return hmac.new(self.secret, message, hashlib.sha256).hexdigest()
+
+    def get(self, key):
+        # type: (str) -> Optional[Tuple[str, str, int, List[str]]]
+        content = self.backend.get(key)
+        if content is None:
+            return None
+        try:
+            entry = json.loads(content.decode('utf-8'))
+            (filename, linter_name, returncode, output) = entry['result']
+            if not hmac.compare_digest(str(entry['signature']), self.sign(key, entry['result'])):
+                return None
+        except (ValueError, TypeError, KeyError, UnicodeDecodeError):
+            return None
+        return (filename, linter_name, returncode, output)
+
+    def get_many(self, keys):
+        # type: (List[str]) -> Dict[str, Tuple[str, str, int, List[str]]]
+        """ Returns the entries found for the keys, fetching several at a time """
+        if not len(keys):
+            return {}
+        pool = ThreadPool(min(SHARED_CONNECTIONS, len(keys)))
+        try:
+            found = pool.map(self.get, keys)
+        finally:
+            pool.terminate()
+            pool.join()
+        return dict([(key, result) for (key, result) in zip(keys, found) if result is not None])
+
+    def put(self, key, result):
+        # type: (str, Tuple[str, str, int, List[str]]) -> None
+        self.pending.append((key, list(result)))
+
+    def write_entry(self, entry):
+        (key, result) = entry
+        self.backend.put(key, json.dumps({'result': result, 'signature': self.sign(key, result)},
+                                         sort_keys=True).encode('utf-8'))
+
+    def flush(self):
+        # type: () -> None
+        """ Writes every entry put since the last flush """
+        (pending, self.pending) = (self.pending, [])
+        if not len(pending):
+            return
+        pool = ThreadPool(min(SHARED_CONNECTIONS, len(pending)))
+        try:
+            pool.map(self.write_entry, pending)
+        finally:
+            pool.terminate()
+            pool.join()
@@ -0,0 +1,259 @@
+# Copyright (C) 2016 Elf M. Sternberg
+# Author: Elf M. Sternberg
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+try:  # noqa: F401
+    from typing import Dict, List, Text, Any, Optional, Union, Callable, Tuple  # noqa: F401
+except:  # noqa: F401
+    pass  # noqa: F401
+
+import gettext
+_ = gettext.gettext
+
+
+DEFAULT_MAX_OUTPUT = 1024 * 1024
+DEFAULT_MAX_TOTAL_OUTPUT = 16 * 1024 * 1024
+READ_SIZE = 65536
+MARKER = '[git-lint: '
+SPILL_SECONDS = 24 * 60 * 60
+
+
+#  _    _       _ _
+# | |  (_)_ __ (_) |_ ___
+# | |__| | '  \| |  _(_-<
+# |____|_|_|_|_|_|\__/__/
+#
+
+def parse_output_cap(value):
+    # type: (str) -> Tuple[Optional[int], Optional[int]]
+    """ Parses a cap such as '65536', '200 lines', or '65536, 200 lines' into (characters, lines)
+
+    Either part may be left out, and is then None, for no limit.
+    Raises ValueError for anything else.
+    """
+    (size, lines) = (None, None)
+    for part in value.split(','):
+        words = part.split()
+        if len(words) == 1:
+            size = max(int(words[0]), 0)
+        elif len(words) == 2 and words[1] in ['line', 'lines']:
+            lines = max(int(words[0]), 0)
+        elif len(words):
+            raise ValueError(value)
+    return (size, lines)
+
+
+class OutputLimit(object):
+    """The characters and lines of output that may still be kept.
+
+    A limit may have a parent, such as the limit on a whole run, that
+    whatever it lets through must also fit.  Where a limit is reached,
+    output is cut at the end of a line, unless no whole line fits.
+    Limits are shared by the threads reading a process's stdout and
+    stderr, and by every job of a run, so taking from one is locked.
+    """
+
+    def __init__(self, size=None, lines=None, parent=None):
+        # type: (Optional[int], Optional[int], Optional[OutputLimit]) -> None
+        self.size = size
+        self.lines = lines
+        self.parent = parent
+        self.lock = threading.Lock()
+
+    def fit(self, text):
+        # type: (str) -> str
+        if self.size is not None and len(text) > self.size:
+            text = text[:self.size]
+            if '\n' in text:
+                text = text[:text.rfind('\n') + 1]
+        if self.lines is not None and text.count('\n') > self.lines:
+            end = 0
+            for line in range(self.lines):
+                end = text.index('\n', end) + 1
+            text = text[:end]
+        return text
+
+    def take(self, text):
+        # type: (str) -> str
+        """ Returns as much of the start of the text as may be kept, and counts it as kept """
+        with self.lock:
+            kept = self.fit(text)
+            if self.parent is not None:
+                kept = self.parent.take(kept)
+            if self.size is not None:
+                self.size = self.size - len(kept)
+            if self.lines is not None:
+                self.lines = self.lines - kept.count('\n')
+            return kept
+
+
+#   ___         _
+#  / __|__ _ __| |_ _  _ _ _ ___
+# | (__/ _` | '_ \  _| || | '_/ -_)
+#  \___\__,_| .__/\__|\_,_|_| \___|
+#           |_|
+
+class Capture(object):
+    """The output of one linter job, kept up to the job's limit.
+
+    The output is read a piece at a time; once the limit is reached,
+    the rest of that stream is counted and dropped, rather than held.
+    Given a function that returns a directory, the whole of any stream
+    that didn't fit is written to a file there, so the report can say
+    where to find it.
+    """
+
+    def __init__(self, limit, spills_to=None, name='output'):
+        # type: (OutputLimit, Optional[Callable[[], Optional[str]]], str) -> None
+        self.limit = limit
+        self.spills_to = spills_to
+        self.name = name
+        self.dropped = 0
+        self.lost = set()  # type: Any
+        self.spills = []  # type: List[str]
+        self.lock = threading.Lock()
+
+    def open_spill(self):
+        directory = self.spills_to and self.spills_to()
+        if directory is None:
+            return None
+        try:
+            (handle, path) = tempfile.mkstemp(prefix=self.name + '-', suffix='.log', dir=directory)
+        except (IOError, OSError):
+            return None
+        with self.lock:
+            self.spills.append(path)
+        return os.fdopen(handle, 'w')
+
+    def consume(self, chunks, stream='out'):
+        """ Returns what is kept of the chunks of one stream, spilling the whole of it if any is dropped
+
+        A stream ('out' or 'err') with output of which nothing at all
+        was kept is noted as lost, so it can still count as output.
+        """
+        kept = []
+        (truncated, spill) = (False, None)
+        try:
+            for chunk in chunks:
+                part = (not truncated and self.limit.take(chunk)) or ''
+                if len(part) < len(chunk):
+                    with self.lock:
+                        self.dropped = self.dropped + len(chunk) - len(part)
+                    if not truncated:
+                        truncated = True
+                        spill = self.open_spill()
+                        if spill is not None:
+                            spill.write(''.join(kept))
+                    if spill is not None:
+                        spill.write(chunk)
+                if len(part):
+                    kept.append(part)
+        finally:
+            if spill is not None:
+                spill.close()
+        if truncated and not len(kept):
+            with self.lock:
+                self.lost.add(stream)
+        return ''.join(kept)
+
+    def read(self, source, stream='out'):
+        """ Reads a process's stdout, or stderr, to its end, returning the part of it that is kept """
+        return self.consume(iter(lambda: source.read(READ_SIZE), ''), stream)
+
+    def keep(self, text, stream='out'):
+        # type: (str, str) -> str
+        """ Returns the part of output already in hand that is kept """
+        return self.consume([text], stream)
+
+    def marker(self):
+        # type: () -> Optional[str]
+        """ Returns the line that says output was left out, and where to find it, or None """
+        if not self.dropped:
+            return None
+        if not len(self.spills):
+            return MARKER + _('{} more characters of output not shown]').format(self.dropped)
+        return MARKER + _('{} more characters of output not shown; all of it is in {}]').format(
+            self.dropped, ' and '.join(self.spills))
+
+
+def is_truncated(output):
+    # type: (List[str]) -> bool
+    """ Returns true if the lines of a result's output end with a truncation marker """
+    return len(output) > 0 and MARKER in output[-1]
+
+
+#  ___
+# | _ \_  _ _ _
+# |   / || | ' \
+# |_|_\\_,_|_||_|
+#
+
+def prune_spills(directory, seconds=SPILL_SECONDS):
+    # type: (str, float) -> None
+    """ Removes what runs spilled into the directory more than so many seconds ago """
+    if not os.path.isdir(directory):
+        return
+    oldest = time.time() - seconds
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.stat(path).st_mtime >= oldest:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif name.endswith('.log'):
+                os.unlink(path)
+        except OSError:
+            pass
+
+
+class RunOutput(object):
+    """The limit on the output kept by a whole run, and where output that doesn't fit goes.
+
+    Until started, there is no limit on the run as a whole and nothing
+    is spilled; each job is still held to its own limit.  A run spills
+    into a directory of its own, made the first time it's needed, so
+    runs at the same time never remove what another's report points
+    to; what runs spilled more than SPILL_SECONDS ago is removed as
+    each run starts.
+    """
+
+    def __init__(self):
+        self.total = OutputLimit()
+        self.spill_parent = None  # type: Optional[str]
+        self.spill_directory = None  # type: Optional[str]
+        self.lock = threading.Lock()
+
+    def start(self, size=None, lines=None, spill_parent=None):
+        # type: (Optional[int], Optional[int], Optional[str]) -> None
+        """ Sets the limit for a new run, spilling under the parent directory """
+        self.total = OutputLimit(size, lines)
+        (self.spill_parent, self.spill_directory) = (spill_parent, None)
+        if spill_parent is not None:
+            prune_spills(spill_parent)
+
+    def spills_to(self):
+        # type: () -> Optional[str]
+        """ Returns the run's own spill directory, making it the first time, or None """
+        with self.lock:
+            if self.spill_directory is None and self.spill_parent is not None:
+                try:
+                    if not os.path.isdir(self.spill_parent):
+                        os.makedirs(self.spill_parent)
+                    self.spill_directory = tempfile.mkdtemp(prefix='run-', dir=self.spill_parent)
+                except (IOError, OSError):
+                    return None
+            return self.spill_directory
+
+    def capture(self, size=None, lines=None, name='output'):
+        # type: (Optional[int], Optional[int], str) -> Capture
+        """ Returns a Capture for one job, held to its own limit and to the run's """
+        return Capture(OutputLimit(size, lines, self.total), self.spills_to, name)
+
+
+run_output = RunOutput()
@@ -0,0 +1,246 @@
+# Copyright (C) 2016 Elf M. Sternberg
+# Author: Elf M. Sternberg
+
+from __future__ import print_function
+from multiprocessing.pool import ThreadPool
+import json
+import os
+import signal
+import socket
+import sys
+
+from .git_lint import (repository, find_config_file, load_config, run_linters,
+                       find_git_directories, DispatchIndex, ResultStream, get_job_count)
+
+try:  # noqa: F401
+    from typing import Dict, List, Text, Any, Optional, Union, Callable, Tuple  # noqa: F401
+except:  # noqa: F401
+    pass  # noqa: F401
+
+import gettext
+_ = gettext.gettext
+
+
+# The daemon speaks newline-delimited JSON over a Unix socket in the git
+# directory.  A client sends one request:
+#
+#     {"cwd": ..., "environment": {...}, "options": {...}, "filenames": [...]}
+#
+# where the environment holds the client's git variables and PATH, which
+# the daemon takes on for the run: a commit hook, for one, is pointed at
+# the index to lint by GIT_INDEX_FILE.
+#
+# and receives, one message per line:
+#
+#     {"expected": [[filename, linter], ...]}
+#     {"result": [filename, linter, returncode, [output, ...]]}  (repeated)
+#     {"done": [unlintable, cant_lint, broken, unfindable]}
+#
+# or at any point {"error": message, "status": code}, if the run was
+# abandoned the way the command line would have exited.
+
+SOCKET_NAME = os.path.join('git-lint', 'daemon.sock')
+
+
+class DaemonUnavailable(Exception):
+    pass
+
+
+def get_client_environment():
+    """ Returns the variables of the environment that change what a run lints: git's, and the PATH """
+    return dict([(name, value) for (name, value) in os.environ.items()
+                 if name.startswith('GIT_') or name == 'PATH'])
+
+
+def set_client_environment(environment):
+    """ Replaces git's variables and the PATH with those given, returning the ones replaced """
+    replaced = get_client_environment()
+    for name in replaced:
+        os.environ.pop(name)
+    os.environ.update(environment)
+    return replaced
+
+
+#  ___              _
+# |   \ __ _ ___ __| |___ _ _
+# | |) / _` / -_) '  \/ _ \ ' \
+# |___/\__,_\___|_|_|_\___/_||_|
+#
+
+def send(connection, message):
+    connection.sendall((json.dumps(message) + '\n').encode('utf-8'))
+
+
+class Daemon(object):
+    """Keeps everything git-lint can reuse between runs, and serves runs.
+
+    The parsed configuration and its dispatch index are kept until the
+    configuration file changes; the repository's location, the linter
+    locations, and a pool of worker threads are kept for as long as
+    the daemon runs.  Requests are handled one at a time, in the
+    client's working directory and with the client's git variables
+    and PATH.
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.path = os.path.join(repository.git_dir, SOCKET_NAME)
+        self.pool = ThreadPool(get_job_count(options))
+        self.loaded = {}
+
+    def get_config(self, options):
+        """ Returns the configuration and its dispatch index, reloading them if the file has changed """
+        path = find_config_file(options, repository.base)
+        stamp = os.stat(path).st_mtime
+        if self.loaded.get(path, (None,))[0] != stamp:
+            config = load_config(options, repository.base)
+            self.loaded[path] = (stamp, config, DispatchIndex(config))
+        return self.loaded[path][1:]
+
+    def handle(self, connection):
+        request = json.loads(connection.makefile('r').readline())
+        options = dict(request['options'])
+        options['stream'] = True
+        replaced = set_client_environment(request.get('environment', get_client_environment()))
+        try:
+            os.chdir(request['cwd'])
+            repository.refresh()
+            (config, dispatch) = self.get_config(options)
+            (results, unlintable_filenames, cant_lint_filenames,
+             broken_linter_names, unfindable_filenames) = run_linters(
+                 options, config, request['filenames'], dispatch, self.pool)
+            send(connection, {'expected': results.expected})
+            for result in results:
+                send(connection, {'result': result})
+            send(connection, {'done': [sorted(unlintable_filenames), list(cant_lint_filenames),
+                                       sorted(broken_linter_names), sorted(unfindable_filenames)]})
+        except SystemExit as exit:
+            send(connection, {'error': (not isinstance(exit.code, int) and str(exit.code)) or '',
+                              'status': (isinstance(exit.code, int) and exit.code) or 1})
+        except Exception as error:
+            send(connection, {'error': str(error) or repr(error), 'status': 1})
+        finally:
+            set_client_environment(replaced)
+
+    def listen(self):
+        if os.path.exists(self.path):
+            try:
+                connect(self.path).close()
+                sys.exit(_('A git-lint daemon is already running for this repository.'))
+            except DaemonUnavailable:
+                os.unlink(self.path)
+        if not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.path)
+        server.listen(8)
+        return server
+
+    def serve(self):
+        server = self.listen()
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            while True:
+                (connection, address) = server.accept()
+                try:
+                    self.handle(connection)
+                except Exception:
+                    pass
+                finally:
+                    connection.close()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            os.unlink(self.path)
+            self.pool.terminate()
+        return 0
+
+
+def serve(options):
+    """ Runs the daemon for the current repository until interrupted """
+    return Daemon(options).serve()
+
+
+#   ___ _ _         _
+#  / __| (_)___ _ _| |_
+# | (__| | / -_) ' \  _|
+#  \___|_|_\___|_||_\__|
+#
+
+def find_socket():
+    """Returns the path to the daemon's socket, if there is one.
+
+    Finds the git directory by walking up from the current directory,
+    without running git, so asking a daemon costs no processes.
+    """
+    (base, git_dir) = find_git_directories()
+    if git_dir is None:
+        return None
+    path = os.path.join(git_dir, SOCKET_NAME)
+    return (os.path.exists(path) and path) or None
+
+
+def connect(path):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except socket.error:
+        client.close()
+        raise DaemonUnavailable(path)
+    return client
+
+
+def request(path, options, filenames):
+    """Asks the daemon to lint, returning what run_linters would have.
+
+    If the options ask for --stream, the results are a ResultStream
+    read from the daemon as they arrive; otherwise they are a list in
+    report order.  If the daemon abandoned the run, this exits the
+    way git-lint would have.
+    """
+    client = connect(path)
+    client.sendall((json.dumps({'cwd': os.getcwd(), 'environment': get_client_environment(),
+                                'options': options, 'filenames': filenames}) + '\n').encode('utf-8'))
+    replies = client.makefile('r')
+
+    def receive():
+        line = replies.readline()
+        if not line:
+            sys.exit(_('The git-lint daemon went away.'))
+        message = json.loads(line)
+        if 'error' in message:
+            if message['error']:
+                print(message['error'], file=sys.stderr)
+            sys.exit(message['status'])
+        return message
+
+    expected = [tuple(key) for key in receive()['expected']]
+    outcome = []
+
+    def results():
+        while True:
+            message = receive()
+            if 'done' in message:
+                outcome[:] = message['done']
+                client.close()
+                return
+            yield tuple(message['result'])
+
+    if 'stream' in options:
+        stream = results()
+        # The summary isn't known until the results have all arrived, so
+        # the reporter is given lists that are filled in at the end.
+        (unlintable, cant_lint, broken, unfindable) = ([], [], [], [])
+
+        def finish():
+            for result in stream:
+                yield result
+            for (target, source) in zip([unlintable, cant_lint, broken, unfindable], outcome):
+                target.extend(source)
+
+        return (ResultStream(finish(), expected), unlintable, cant_lint, broken, unfindable)
+
+    order = dict([(key, position) for (position, key) in enumerate(expected)])
+    collected = sorted(results(), key=lambda result: order.get((result[0], result[1]), 0))
+    return tuple([collected] + [list(part) for part in outcome])
@@ -0,0 +1,487 @@
+# Copyright (C) 2016 Elf M. Sternberg
+# Author: Elf M. Sternberg
+
+from __future__ import print_function
+from collections import namedtuple, deque
+import base64
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from .git_lint import repository, get_content_hashes, get_linted_range, resolve_linter_command, Linters, BlobReader
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:  # noqa: F401
+    from typing import Dict, List, Text, Any, Optional, Union, Callable, Tuple  # noqa: F401
+except:  # noqa: F401
+    pass  # noqa: F401
+
+import gettext
+_ = gettext.gettext
+
+
+# The coordinator and its workers speak newline-delimited JSON over TCP.
+# Each first proves to the other that it knows the secret they share,
+# answering a random challenge with an HMAC-SHA256 of it:
+#
+#     coordinator: {"challenge": c1}
+#     worker:      {"hello": hmac("worker:" + c1), "challenge": c2}
+#     coordinator: {"hello": hmac("coordinator:" + c2)}
+#
+# so no one without the secret can take jobs, read the blobs handed
+# out, or return results, and no one can hand a worker commands to
+# run.  A coordinator that turns a worker away answers {"error": ...}.
+# The traffic itself isn't encrypted.
+#
+# A worker holds one connection open, and repeatedly asks for work:
+#
+#     {"want": "job"}
+#
+# to which the coordinator answers with one of:
+#
+#     {"job": id, "name": ..., "linter": {...}, "base": ...,
+#      "files": [[path, sha, mode], ...], "support": [[path, sha, mode], ...]}
+#     {"wait": seconds}     (nothing to hand out now, but jobs are still out)
+#     {"done": true}        (every job is finished)
+#
+# Paths are relative to the repository.  'support' lists files in the
+# repository that the linter's command names, such as its configuration.
+# A worker fetches the content of any blob it doesn't have:
+#
+#     {"blob": sha}   ->   {"blob": sha, "content": base64}
+#
+# and returns the results of a job, in the order of its files:
+#
+#     {"result": id, "results": [[filename, linter, returncode, [output, ...]], ...]}
+#
+# Jobs held by a worker whose connection drops are handed out again, up
+# to MAX_LEASES times in all; a job whose every worker drops it, or that
+# is still waiting ORPHAN_SECONDS after the last worker left, fails.  A
+# job that can't be run on a worker, for want of its linter or its
+# content, comes back as failed results, and the worker asks for more.
+
+Linter = namedtuple('Linter', ['name', 'linter'])
+
+WAIT_SECONDS = 0.2
+CONNECT_SECONDS = 10
+MAX_LEASES = 3
+ORPHAN_SECONDS = 60
+SECRET_VARIABLES = ['GIT_LINT_JOBS_SECRET', 'GIT_LINT_CACHE_SECRET']
+
+
+def parse_address(address):
+    """ Parses 'host:port', or just 'port', into a (host, port) pair """
+    (host, colon, port) = address.rpartition(':')
+    try:
+        return (host or 'localhost', int(port))
+    except ValueError:
+        sys.exit(_('The address must be HOST:PORT: {}').format(address))
+
+
+def send(connection, message):
+    connection.sendall((json.dumps(message) + '\n').encode('utf-8'))
+
+
+def get_secret():
+    """ Returns the secret the coordinator and its workers share, from GIT_LINT_JOBS_SECRET
+
+    GIT_LINT_CACHE_SECRET will do instead, if that isn't set.
+    """
+    for variable in SECRET_VARIABLES:
+        if os.environ.get(variable, None):
+            return os.environ[variable].encode('utf-8')
+    sys.exit(_('Handing out lint jobs needs a secret shared with the workers, in GIT_LINT_JOBS_SECRET.'))
+
+
+def make_challenge():
+    return base64.b16encode(os.urandom(16)).decode('ascii').lower()
+
+
+def prove(secret, role, challenge):
+    # type: (bytes, str, str) -> str
+    """ Returns the answer to a challenge, from one who knows the secret and is in the role """
+    return hmac.new(secret, (role + ':' + challenge).encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+class CoordinatorGone(IOError):
+    """ The connection to the coordinator was lost, or the coordinator turned the worker away """
+    pass
+
+
+def failed_results(filenames, linter, linter_name, message, root=None):
+    """ Returns the results of a job that couldn't be run: every file fails with the message """
+    return [list(Linters.make_result(filename, linter, linter_name, '', message, 1, root))
+            for filename in filenames]
+
+
+def blob_hash(content):
+    """ Returns the git blob hash of the content """
+    return hashlib.sha1(('blob {}\0'.format(len(content))).encode('ascii') + content).hexdigest()
+
+
+#   ___                _ _           _
+#  / __|___  ___ _ _ __| (_)_ _  __ _| |_ ___ _ _
+# | (__/ _ \/ _ \ '_/ _` | | ' \/ _` |  _/ _ \ '_|
+#  \___\___/\___/_| \__,_|_|_||_\__,_|\__\___/_|
+#
+
+class Coordinator(object):
+    """Hands lint jobs out to workers, and collects their results.
+
+    It stands in for the pool of threads that would otherwise run the
+    jobs, so everything else about a run (the cache, the runner, the
+    order of the report) is as it would be without it.  The content of
+    the files is served by blob hash: from the index when linting the
+    staging area, from the object store when linting a revision range,
+    and from the workspace otherwise.  Files with no content to serve,
+    such as those deleted since they were listed, are found before the
+    jobs are made, and reported as unfindable.
+    """
+
+    def __init__(self, options, config):
+        self.options = options
+        self.secret = get_secret()
+        self.reader = BlobReader()
+        self.config = dict([(linter.name, linter.linter) for linter in config])
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(parse_address(options['serve-jobs']))
+        self.server.listen(16)
+        self.address = '{}:{}'.format(*self.server.getsockname()[:2])
+        self.lock = threading.Condition()
+        self.pending = deque()
+        self.jobs = {}
+        self.leases = {}
+        self.hashes = None
+        self.orphaned = None
+        self.outstanding = set()
+        self.blobs = {}
+        self.finished = queue.Queue()
+        self.submitted = False
+        self.closed = False
+        self.workers = 0
+        accepter = threading.Thread(target=self.accept)
+        accepter.daemon = True
+        accepter.start()
+
+    def accept(self):
+        while not self.closed:
+            try:
+                (connection, address) = self.server.accept()
+            except (socket.error, OSError):
+                return
+            connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            with self.lock:
+                self.workers = self.workers + 1
+                self.orphaned = None
+            handler = threading.Thread(target=self.serve_worker, args=(connection,))
+            handler.daemon = True
+            handler.start()
+
+    def relative(self, filename):
+        return os.path.relpath(os.path.abspath(filename), repository.base)
+
+    def support_files(self, linter):
+        """ Returns the files in the repository that the linter's command names """
+        tokens = linter.linter.get('argv', None) or linter.linter['command'].split(' ')
+        paths = [self.relative(token) for token in tokens
+                 if token.startswith(repository.base + '/') and os.path.isfile(token)]
+        return [[path, repository.index[path][1], repository.index[path][0]] for path in paths
+                if path in repository.index]
+
+    def find(self, pairs):
+        """ Returns the (linter, filename) pairs whose content can be handed out, and the files that can't """
+        filenames = sorted(set([filename for (linter, filename) in pairs]))
+        self.hashes = get_content_hashes(self.options, filenames)
+        return ([(linter, filename) for (linter, filename) in pairs if filename in self.hashes],
+                set([filename for filename in filenames if filename not in self.hashes]))
+
+    def fail(self, number, message):
+        """ Finishes a job, held by no worker, as failed on every file """
+        (job, files, support_files, started) = self.jobs[number]
+        (linter, job_filenames) = job
+        if started is None:
+            self.jobs[number] = (job, files, support_files, time.time())
+        self.outstanding.discard(number)
+        self.finished.put((number, failed_results(job_filenames, linter.linter, linter.name, message)))
+
+    def collect(self):
+        """ Returns the next finished job, failing every job left once workers have been gone too long """
+        while True:
+            try:
+                return self.finished.get(timeout=WAIT_SECONDS)
+            except queue.Empty:
+                pass
+            with self.lock:
+                if self.orphaned is None or time.time() - self.orphaned < ORPHAN_SECONDS:
+                    continue
+                while self.pending:
+                    self.fail(self.pending.popleft(),
+                              _('No worker was left to run this job.'))
+
+    def imap_unordered(self, function, jobs, chunksize=1):
+        """ Yields (job, results, seconds) for every job, as workers finish them """
+        hashes = self.hashes
+        if hashes is None:
+            hashes = get_content_hashes(self.options, sorted(set(
+                [filename for (linter, job_filenames) in jobs for filename in job_filenames])))
+        self.from_workspace = not ('staging' in self.options or get_linted_range(self.options))
+        support = {}
+        with self.lock:
+            for (number, job) in enumerate(jobs):
+                (linter, job_filenames) = job
+                if linter.name not in support:
+                    support[linter.name] = self.support_files(linter)
+                files = [[self.relative(filename), hashes[filename], '100644']
+                         for filename in job_filenames]
+                for (path, sha, mode) in files:
+                    self.blobs[sha] = path
+                for (path, sha, mode) in support[linter.name]:
+                    self.blobs[sha] = path
+                self.jobs[number] = (job, files, support[linter.name], None)
+                self.pending.append(number)
+                self.outstanding.add(number)
+            self.submitted = True
+
+        for i in range(len(jobs)):
+            (number, results) = self.collect()
+            (job, files, support_files, started) = self.jobs.pop(number)
+            (linter, job_filenames) = job
+            yield (job, [(filename.replace(repository.base + '/', '', 1), linter_name, returncode, output)
+                         for (filename, (unused, linter_name, returncode, output))
+                         in zip(job_filenames, results)], time.time() - started)
+
+    def lease(self, held):
+        """ Returns the reply to a worker asking for a job """
+        with self.lock:
+            if self.pending:
+                number = self.pending.popleft()
+                held.add(number)
+                self.leases[number] = self.leases.get(number, 0) + 1
+                # The job is timed from when a worker takes it, not from when it was queued.
+                (job, files, support_files, unused) = self.jobs[number]
+                self.jobs[number] = (job, files, support_files, time.time())
+                (linter, job_filenames) = job
+                return {'job': number, 'name': linter.name, 'linter': self.config.get(linter.name, linter.linter),
+                        'base': repository.base, 'files': files, 'support': support_files}
+            if self.outstanding or not (self.submitted or self.closed):
+                return {'wait': WAIT_SECONDS}
+            return {'done': True}
+
+    def content(self, sha):
+        """ Returns the content of a blob that was handed out, or None
+
+        The workspace is read first, when it's what is being linted;
+        anything not found there is read from the object store.
+        """
+        path = self.blobs.get(sha, None)
+        if path is None:
+            return None
+        if self.from_workspace:
+            try:
+                with open(os.path.join(repository.base, path), 'rb') as blob:
+                    content = blob.read()
+                if blob_hash(content) == sha:
+                    return content
+            except (IOError, OSError):
+                pass
+        return self.reader.read(sha)
+
+    def introduce(self, connection, requests):
+        """ Returns true if the worker knows the secret, having shown it that the coordinator does too """
+        challenge = make_challenge()
+        send(connection, {'challenge': challenge})
+        hello = json.loads(requests.readline() or '{}')
+        if not hmac.compare_digest(str(hello.get('hello', '')), prove(self.secret, 'worker', challenge)):
+            send(connection, {'error': _('The worker does not know the secret.')})
+            return False
+        send(connection, {'hello': prove(self.secret, 'coordinator', str(hello.get('challenge', '')))})
+        return True
+
+    def serve_worker(self, connection):
+        held = set()
+        requests = connection.makefile('r')
+        try:
+            if not self.introduce(connection, requests):
+                return
+            for line in iter(requests.readline, ''):
+                message = json.loads(line)
+                if 'want' in message:
+                    send(connection, self.lease(held))
+                elif 'blob' in message:
+                    content = self.content(message['blob'])
+                    send(connection, {'blob': message['blob'],
+                                      'content': content is not None and base64.b64encode(content).decode('ascii')})
+                elif 'result' in message:
+                    with self.lock:
+                        if message['result'] in held:
+                            held.discard(message['result'])
+                            self.outstanding.discard(message['result'])
+                            self.finished.put((message['result'], message['results']))
+        except (IOError, OSError, ValueError, KeyError, socket.error):
+            pass
+        finally:
+            requests.close()
+            connection.close()
+            # Whatever the worker was still holding goes to the next worker to ask,
+            # unless it has already been the last job of too many workers.
+            with self.lock:
+                for number in sorted(held):
+                    if self.leases[number] >= MAX_LEASES:
+                        self.fail(number, _('Every worker given this job, {} in all, stopped.').format(
+                            self.leases[number]))
+                        continue
+                    self.pending.appendleft(number)
+                self.workers = self.workers - 1
+                if self.workers == 0 and self.outstanding:
+                    self.orphaned = time.time()
+                self.lock.notify_all()
+
+    def close(self, seconds=CONNECT_SECONDS):
+        """ Stops taking workers, giving those connected a moment to be told there's nothing left """
+        deadline = time.time() + seconds
+        with self.lock:
+            self.closed = True
+            while self.workers > 0 and time.time() < deadline:
+                self.lock.wait(WAIT_SECONDS)
+        self.server.close()
+        self.reader.close()
+
+
+#  __      __       _
+#  \ \    / /__ _ _| |_____ _ _
+#   \ \/\/ / _ \ '_| / / -_) '_|
+#    \_/\_/\___/_| |_\_\___|_|
+#
+
+class Worker(object):
+    """Runs jobs for a coordinator, in a scratch copy of the files it needs.
+
+    Blobs are fetched once each, checked against their hash, and kept
+    for as long as the worker runs.  Each linter is found on this
+    machine's PATH, not the coordinator's.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.replies = connection.makefile('r')
+        self.scratch = tempfile.mkdtemp(prefix='git-lint-worker-')
+        self.root = os.path.join(self.scratch, 'tree')
+        self.written = {}
+        self.linters = {}
+
+    def read_reply(self):
+        try:
+            line = self.replies.readline()
+        except (IOError, OSError, socket.error) as error:
+            raise CoordinatorGone(str(error))
+        if not line:
+            raise CoordinatorGone(_('The coordinator went away.'))
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise CoordinatorGone(reply['error'])
+        return reply
+
+    def ask(self, message):
+        try:
+            send(self.connection, message)
+        except (IOError, OSError, socket.error) as error:
+            raise CoordinatorGone(str(error))
+        return self.read_reply()
+
+    def introduce(self, secret):
+        """ Shows the coordinator that the worker knows the secret, and has it show the same """
+        challenge = make_challenge()
+        reply = self.ask({'hello': prove(secret, 'worker', str(self.read_reply().get('challenge', ''))),
+                          'challenge': challenge})
+        if not hmac.compare_digest(str(reply.get('hello', '')), prove(secret, 'coordinator', challenge)):
+            raise IOError(_('The coordinator does not know the secret.'))
+
+    def fetch(self, path, sha, mode):
+        """ Puts the blob's content at path under the root, unless it's already there """
+        if self.written.get(path, None) == sha:
+            return
+        reply = self.ask({'blob': sha})
+        content = reply.get('content') and base64.b64decode(reply['content'].encode('ascii'))
+        if content is None or content is False or blob_hash(content) != sha:
+            raise IOError(_('The coordinator sent the wrong content for {}').format(path))
+        target = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(target)):
+            os.makedirs(os.path.dirname(target))
+        with open(target, 'wb') as blob:
+            blob.write(content)
+        os.chmod(target, (mode.endswith('755') and 0o755) or 0o644)
+        self.written[path] = sha
+
+    def linter(self, name, config, base):
+        """ Returns the linter, with its command pointed at the scratch copy and resolved here """
+        key = (name, json.dumps(config, sort_keys=True))
+        if key not in self.linters:
+            linter = dict([(k, v) for (k, v) in config.items() if k != 'argv'])
+            linter['command'] = linter['command'].replace(base + '/', self.root + '/')
+            self.linters[key] = resolve_linter_command(Linter(name, linter))
+        return self.linters[key]
+
+    def run(self, job):
+        """ Returns the results of the job; if it can't be run here, every file fails with the reason """
+        copies = [os.path.join(self.root, path) for (path, sha, mode) in job['files']]
+        try:
+            for (path, sha, mode) in job['support'] + job['files']:
+                self.fetch(path, sha, mode)
+            linter = self.linter(job['name'], job['linter'], job['base'])
+            results = Linters.run_job((linter, copies), self.root)
+        except CoordinatorGone:
+            raise
+        except (Exception, SystemExit) as error:
+            results = failed_results(copies, job['linter'], job['name'], str(error), self.root)
+        return [[filename, linter_name, returncode,
+                 [line.replace(self.root + '/', job['base'] + '/') for line in output]]
+                for (filename, linter_name, returncode, output) in results]
+
+    def work(self, secret):
+        try:
+            self.introduce(secret)
+            while True:
+                reply = self.ask({'want': 'job'})
+                if 'done' in reply:
+                    return 0
+                if 'wait' in reply:
+                    time.sleep(reply['wait'])
+                    continue
+                send(self.connection, {'result': reply['job'], 'results': self.run(reply)})
+        finally:
+            self.replies.close()
+            self.connection.close()
+            shutil.rmtree(self.scratch, ignore_errors=True)
+
+
+def connect(address, seconds=CONNECT_SECONDS):
+    """ Connects to the coordinator, waiting for it to start if need be """
+    deadline = time.time() + seconds
+    while True:
+        try:
+            return socket.create_connection(parse_address(address))
+        except (socket.error, OSError):
+            if time.time() > deadline:
+                sys.exit(_('Could not connect to a coordinator at {}').format(address))
+            time.sleep(WAIT_SECONDS)
+
+
+def work(options):
+    """ Runs jobs for the coordinator at the --worker address until it has none left """
+    secret = get_secret()
+    try:
+        return Worker(connect(options['worker'])).work(secret)
+    except (IOError, OSError, ValueError, socket.error) as error:
+        sys.exit(_('The worker stopped: {}').format(error))
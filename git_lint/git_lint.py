@@ -1,20 +1,49 @@
-from functools import reduce
+from functools import reduce, partial
+from contextlib import contextmanager
 from collections import namedtuple
+from itertools import islice
+from multiprocessing.pool import ThreadPool
 import getopt
 import gettext
+import hashlib
+import io
+import json
+import mmap
 import operator
 import os
 import shutil
 import re
+import shlex
 import subprocess
 import sys
 import pprint
+import multiprocessing
+import tempfile
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .builtins import is_builtin, find_builtin, builtin_source, validate_builtin
+from .cache import ResultCache, CleanTreeStore, SharedCache, make_backend, make_key
+from .capture import DEFAULT_MAX_OUTPUT, DEFAULT_MAX_TOTAL_OUTPUT, parse_output_cap, is_truncated, run_output
+from .history import JobHistory
+from .shard import parse_shard, partition, partition_digest
+from .trace import tracer, communicate_with_usage, read_output
 
 try:
     import configparser
 except ImportError as e:
     import ConfigParser as configparser
 
+try:
+    from shlex import quote as shell_quote
+except ImportError:
+    from pipes import quote as shell_quote
+
 try:  # noqa: F401
     from typing import Dict, List, Text, Any, Optional, Union, Callable, Tuple  # noqa: F401
 except:  # noqa: F401
@@ -31,6 +60,63 @@ _ = gettext.gettext
 #                     |___/
 
 
+def find_config_file(options, base):
+    """ Returns the configuration file from a prioritized list of locations.
+
+    Locations are prioritized as:
+        1. From the command line. Fail if specified but not found
+        2. The repository's root directory, as the file .git-lint
+        3. The repository's root directory, as the file .git-lint/config
+        4. The user's home directory, as file .git-lint
+        5. The user's home directory, as the file .git-lint/config
+
+    If no configuration file is found, this is an error.
+    """
+
+    if 'config' in options:
+        config = options['config']
+        configpath = os.path.abspath(config)
+        if not os.path.isfile(configpath):
+            sys.exit(_('Configuration file not found: {}\n').format(config))
+        return configpath
+
+    home = os.environ.get('HOME', None)
+    possibles = [os.path.join(base, '.git-lint'),
+                 os.path.join(base, '.git-lint/config')] + ((home and [
+                     os.path.join(home, '.git-lint'),
+                     os.path.join(home, '.git-lint/config')]) or [])
+
+    matches = [p for p in possibles if os.path.isfile(p)]
+    if len(matches) == 0:
+        sys.exit(_('No configuration file found, tried: {}').format(':'.join(possibles)))
+
+    return matches[0]
+
+
+PR_REVISION = 'HEAD^..HEAD'
+
+
+def get_revision(options):
+    """ Returns the revision, or range, asked for with --revision or --pr, or None """
+    return options.get('revision', ('pr' in options and PR_REVISION) or None)
+
+
+def read_committed_config(options):
+    """ Returns the text of the .git-lint committed at the end of the revision range, or None
+
+    A bare repository has no working tree to keep a configuration in,
+    so the one committed along with the code being linted is used.
+    """
+    span = repository.revision_range(get_revision(options))
+    if span is None:
+        return None
+    for name in ['.git-lint', '.git-lint/config']:
+        (out, err, returncode) = get_git_response_raw(['cat-file', 'blob', '{}:{}'.format(span[1], name)])
+        if returncode == 0:
+            return out
+    return None
+
+
 # (commandLineDictionary, repositoryLocation) -> (configurationDictionary | exit)
 def load_config(options, base):
     """Loads the git-lint configuration file.
@@ -41,45 +127,20 @@ def load_config(options, base):
     will be replaced with the base directory of the repository.
     Combined with the option to specify the .git-lint configuration as
     a directory, this allows users to keep per-project configuration
-    files for specific linters.
+    files for specific linters.  In a bare repository, the configuration
+    committed at the end of the revision range is used, unless one is
+    given on the command line.
     """
 
-    def find_config_file(options, base):
-        """ Returns the configuration file from a prioritized list of locations.
-
-        Locations are prioritized as:
-            1. From the command line. Fail if specified but not found
-            2. The repository's root directory, as the file .git-lint
-            3. The repository's root directory, as the file .git-lint/config
-            4. The user's home directory, as file .git-lint
-            5. The user's home directory, as the file .git-lint/config
-
-        If no configuration file is found, this is an error.
-        """
-
-        if 'config' in options:
-            config = options['config']
-            configpath = os.path.abspath(config)
-            if not os.path.isfile(configpath):
-                sys.exit(_('Configuration file not found: {}\n').format(config))
-            return configpath
-
-        home = os.environ.get('HOME', None)
-        possibles = [os.path.join(base, '.git-lint'),
-                     os.path.join(base, '.git-lint/config')] + ((home and [
-                         os.path.join(home, '.git-lint'),
-                         os.path.join(home, '.git-lint/config')]) or [])
-
-        matches = [p for p in possibles if os.path.isfile(p)]
-        if len(matches) == 0:
-            sys.exit(_('No configuration file found, tried: {}').format(':'.join(possibles)))
-
-        return matches[0]
-
     Linter = namedtuple('Linter', ['name', 'linter'])
-    path = find_config_file(options, base)
+    committed = ('config' not in options and repository.bare and read_committed_config(options)) or None
     configloader = configparser.SafeConfigParser()
-    configloader.read(path)
+    if committed is None:
+        configloader.read(find_config_file(options, base))
+    elif hasattr(configloader, 'read_string'):
+        configloader.read_string(committed)
+    else:
+        configloader.readfp(io.BytesIO(committed))
     configloader.set('DEFAULT', 'repodir', base)
     return [Linter(section, {k: v for (k, v) in configloader.items(section)})
             for section in configloader.sections()]
@@ -91,13 +152,14 @@ def load_config(options, base):
 #  \___|_|\__|
 #
 
-def get_git_response_raw(cmd):
+def get_git_response_raw(cmd, input=None):
     fullcmd = (['git'] + cmd)
     process = subprocess.Popen(fullcmd,
+                               stdin=((input is not None and subprocess.PIPE) or None),
                                stdout=subprocess.PIPE,
                                stderr=subprocess.PIPE,
                                universal_newlines=True)
-    (out, err) = process.communicate()
+    (out, err) = process.communicate(input)
     return (out, err, process.returncode)
 
 
@@ -111,6 +173,35 @@ def split_git_response(cmd):
     return out.splitlines()
 
 
+def stream_git_response(cmd, separator=u'\x00', chunk_size=65536):
+    """ Yields the separator-terminated entries of git's output as they arrive.
+
+    The output is read from the pipe a chunk at a time, so entries are
+    available before git has finished, and the whole of the output is
+    never held in memory at once.
+    """
+    fullcmd = (['git'] + cmd)
+    devnull = open(os.devnull, 'w')
+    process = subprocess.Popen(fullcmd,
+                               stdout=subprocess.PIPE,
+                               stderr=devnull,
+                               universal_newlines=True)
+    try:
+        pending = u''
+        for chunk in iter(lambda: process.stdout.read(chunk_size), u''):
+            entries = (pending + chunk).split(separator)
+            pending = entries.pop()
+            for entry in entries:
+                if len(entry) > 0:
+                    yield entry
+        if len(pending) > 0:
+            yield pending
+    finally:
+        process.stdout.close()
+        process.wait()
+        devnull.close()
+
+
 def run_git_command(cmd):
     fullcmd = (['git'] + cmd)
     return subprocess.call(fullcmd,
@@ -119,13 +210,78 @@ def run_git_command(cmd):
                            universal_newlines=True)
 
 
-def get_shell_response(fullcmd):
-    process = subprocess.Popen(fullcmd,
+def get_shell_response(fullcmd, content=None, capture=None):
+    return get_process_response(fullcmd, shell=True, content=content, capture=capture)
+
+
+def get_command_response(argv, content=None, capture=None):
+    """ Runs a command given as a list of arguments, without a shell.
+
+    On Python 3, where file descriptors are not inherited unless asked
+    for, leaving close_fds off with an absolute path to the executable
+    lets subprocess start the child with posix_spawn instead of
+    fork/exec.
+    """
+    return get_process_response(argv, close_fds=(sys.version_info[0] < 3), content=content,
+                                capture=capture)
+
+
+def feed_process(stdin, content):
+    """ Writes the content, as bytes, to a child's stdin, and closes it
+
+    A child may exit without reading all of its input; that's not an
+    error here, and its exit status will tell.
+    """
+    try:
+        getattr(stdin, 'buffer', stdin).write(content)
+        stdin.close()
+    except (IOError, OSError, ValueError):
+        pass
+
+
+def get_process_response(cmd, shell=False, close_fds=True, content=None, capture=None):
+    """ Runs the command, returning (out, err, returncode)
+
+    If there is content, as bytes, it is written to the command's
+    stdin from a thread of its own, so a command that writes before it
+    has read everything can't stall.  Given a Capture, the output is
+    read a piece at a time, and only what the capture keeps is held.
+    """
+    process = subprocess.Popen(cmd,
+                               stdin=((content is not None and subprocess.PIPE) or None),
                                stdout=subprocess.PIPE,
                                stderr=subprocess.PIPE,
-                               shell=True,
+                               shell=shell,
+                               close_fds=close_fds,
                                universal_newlines=True)
-    (out, err) = process.communicate()
+    feeder = None
+    if content is not None:
+        feeder = threading.Thread(target=feed_process, args=(process.stdin, content))
+        process.stdin = None
+        feeder.start()
+
+    read = None
+    if capture is not None:
+        read = (lambda source: capture.read(source, (source is process.stderr and 'err') or 'out'))
+    if not (tracer.enabled and hasattr(os, 'wait4')):
+        if read is None:
+            (out, err) = process.communicate()
+        else:
+            (out, err) = read_output(process, read)
+            process.wait()
+        if feeder is not None:
+            feeder.join()
+        return (out, err, process.returncode)
+
+    (out, err, usage) = communicate_with_usage(process, read)
+    if feeder is not None:
+        feeder.join()
+    tracer.annotate(returncode=process.returncode,
+                    output_bytes=len(out) + len(err),
+                    cpu_seconds=usage.ru_utime + usage.ru_stime,
+                    user_seconds=usage.ru_utime,
+                    system_seconds=usage.ru_stime,
+                    max_rss_kb=usage.ru_maxrss)
     return (out, err, process.returncode)
 
 
@@ -142,8 +298,303 @@ def get_git_head():
     return ((err and empty_repository_hash) or 'HEAD')
 
 
-git_base = get_git_base()
-git_head = get_git_head()
+def get_git_dir():
+    (out, error, returncode) = get_git_response_raw(
+        ['rev-parse', '--git-dir'])
+    return (returncode == 0 and os.path.abspath(out.rstrip())) or None
+
+
+def find_git_directories():
+    """Returns (working tree, git directory), found without running git.
+
+    Walks up from the current directory looking for '.git', which is
+    all git itself does in the common case.  Returns (None, None) if
+    the environment points git elsewhere, or if no '.git' is found, and
+    git must be asked instead.
+    """
+    if 'GIT_DIR' in os.environ or 'GIT_WORK_TREE' in os.environ:
+        return (None, None)
+    directory = os.path.abspath(os.getcwd())
+    if '.git' in directory.split(os.sep):
+        return (None, None)
+    while True:
+        dotgit = os.path.join(directory, '.git')
+        if os.path.isfile(dotgit):
+            with open(dotgit) as gitfile:
+                line = gitfile.readline().strip()
+            if line.startswith('gitdir:'):
+                dotgit = os.path.normpath(os.path.join(directory, line[len('gitdir:'):].strip()))
+        if os.path.isdir(dotgit):
+            return (directory, dotgit)
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return (None, None)
+        directory = parent
+
+
+def get_git_bare():
+    (out, error, returncode) = get_git_response_raw(
+        ['rev-parse', '--is-bare-repository'])
+    return returncode == 0 and out.strip() == 'true'
+
+
+def get_index_tree():
+    """ Returns the hash of the tree the index would commit, or None if it can't be written """
+    (out, err, returncode) = get_git_response_raw(['write-tree'])
+    return (returncode == 0 and out.strip()) or None
+
+
+def get_index_entries(paths):
+    """ Returns the index entries of only the given repository paths, as a dictionary of path to (mode, blob hash) """
+    if not len(paths):
+        return {}
+    return dict([(path, (mode, sha)) for (mode, sha, stage, path) in
+                 parse_index_entries(stream_git_response(
+                     ['--literal-pathspecs', '-C', repository.base, 'ls-files', '--stage', '-z', '--'] + paths))
+                 if stage == '0'])
+
+
+def get_modified_paths(paths):
+    """ Returns the set of those repository paths that are tracked and differ from the index """
+    if not len(paths):
+        return set()
+    return set([path for path in
+                stream_git_response(['--literal-pathspecs', '-C', repository.base,
+                                     'diff-files', '--name-only', '-z', '--'] + paths)
+                if len(path) > 0])
+
+
+def get_blob_hashes(filenames, staged, listed=False):
+    """ Returns a dictionary of filename to the git blob hash of its content.
+
+    Tracked files that git already knows to be unchanged take their
+    hash from the index, so only new and modified files need to be
+    read and hashed.  When linting the staging area the index is the
+    content, and files not in the index are left out.  With listed,
+    git is asked about only these files, rather than the index being
+    read whole, so hashing a window of files holds only its entries.
+    """
+    paths = dict([(filename, os.path.relpath(os.path.abspath(filename), repository.base))
+                  for filename in filenames])
+    wanted = sorted(set(paths.values()))
+    if listed:
+        index = get_index_entries(wanted)
+    else:
+        index = repository.index
+    if staged:
+        return dict([(filename, index[path][1]) for (filename, path) in paths.items()
+                     if path in index])
+
+    if listed:
+        modified = get_modified_paths(wanted)
+    else:
+        modified = repository.modified
+    hashes = dict([(filename, index[path][1]) for (filename, path) in paths.items()
+                   if path in index and path not in modified])
+    unhashed = sorted([filename for filename in filenames if filename not in hashes])
+    if len(unhashed):
+        (out, error, returncode) = get_git_response_raw(
+            ['hash-object', '--stdin-paths'], '\n'.join(unhashed) + '\n')
+        shas = out.splitlines()
+        if returncode == 0 and len(shas) == len(unhashed):
+            hashes.update(dict(zip(unhashed, shas)))
+    return hashes
+
+
+REGULAR_MODES = ('100644', '100755')
+
+
+def get_revision_range(revision):
+    """ Returns the (start, end) commits of a range, 'A..B' or 'A...B', or None for a single revision
+
+    A side left out is HEAD, as it is to git.  The start of 'A...B' is
+    the commit where A and B diverged.  Both are resolved to commit
+    hashes, so a branch that moves while git-lint runs doesn't change
+    what is linted.
+    """
+    if revision is None or '..' not in revision:
+        return None
+    symmetric = '...' in revision
+    (start, end) = [(side or 'HEAD') for side in revision.split((symmetric and '...') or '..', 1)]
+    (out, err, returncode) = get_git_response_raw(
+        ['rev-parse', start + '^{commit}', end + '^{commit}'])
+    if returncode != 0:
+        sys.exit(_('Not a revision range git understands: {}\n{}').format(revision, err.strip()))
+    (start, end) = out.split()
+    if symmetric:
+        (out, err, returncode) = get_git_response_raw(['merge-base', start, end])
+        if returncode != 0:
+            sys.exit(_('The two sides of {} have no common history.').format(revision))
+        start = out.strip()
+    return (start, end)
+
+
+def get_revision_changes(start, end):
+    """ Returns the regular files changed between two commits, as a dictionary of path to (mode, blob hash) at the end
+
+    Asks only the object store, with 'git diff-tree', so neither the
+    workspace nor the index is consulted.  Deleted files, submodules
+    and symbolic links have nothing to lint, and are left out.
+    """
+    cmd = ['diff-tree', '-r', '-z', '--raw', '--no-renames', start, end]
+    return dict([(path, (new_mode, new_sha)) for (old_mode, new_mode, old_sha, new_sha, status, path)
+                 in parse_raw_diff(stream_git_response(cmd))
+                 if new_mode in REGULAR_MODES])
+
+
+class BlobReader(object):
+    """Reads blobs from the object store through one 'git cat-file --batch'.
+
+    The process is started on the first read and kept until the reader
+    is closed, so reading any number of blobs costs one process.  Reads
+    are taken one at a time, so threads may share a reader.
+    """
+
+    def __init__(self):
+        self.process = None
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def read(self, sha):
+        # type: (str) -> Optional[bytes]
+        """ Returns the content of the blob, or None if there's no such blob """
+        with self.lock:
+            if self.process is None:
+                self.process = subprocess.Popen(['git', 'cat-file', '--batch'],
+                                                stdin=subprocess.PIPE,
+                                                stdout=subprocess.PIPE)
+            self.process.stdin.write((sha + '\n').encode('ascii'))
+            self.process.stdin.flush()
+            header = self.process.stdout.readline().decode('ascii').split()
+            if len(header) != 3:
+                return None
+            (found, kind, size) = header
+            content = self.process.stdout.read(int(size))
+            self.process.stdout.read(1)
+            return ((kind == 'blob') and content) or None
+
+    def close(self):
+        with self.lock:
+            if self.process is not None:
+                self.process.stdin.close()
+                self.process.stdout.close()
+                self.process.wait()
+                self.process = None
+
+
+class memoized_property(object):
+    """ A property that is computed on first use and then remembered """
+
+    def __init__(self, function):
+        self.function = function
+        self.__doc__ = function.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.function.__name__] = self.function(instance)
+        return value
+
+
+class Repository(object):
+    """The repository git-lint is running in.
+
+    Nothing is asked of git until a property is first used, so merely
+    importing git-lint, or asking it for --help, costs no processes.
+    """
+
+    @memoized_property
+    def found(self):
+        """ The working tree and git directory, where they can be found without git """
+        return find_git_directories()
+
+    @memoized_property
+    def base(self):
+        """ The top level directory of the working tree, or None; for a bare repository, the git directory """
+        return self.found[0] or get_git_base() or (self.bare and self.git_dir) or None
+
+    @memoized_property
+    def bare(self):
+        """ Whether the repository has no working tree """
+        return self.found[0] is None and get_git_bare()
+
+    @memoized_property
+    def head(self):
+        """ HEAD, or the empty tree if there are no commits yet """
+        return get_git_head()
+
+    @memoized_property
+    def index(self):
+        """ The index, as a dictionary of repository path to (mode, blob hash) """
+        return dict([(path, (mode, sha)) for (mode, sha, stage, path) in
+                     parse_index_entries(stream_git_response(
+                         ['-C', self.base, 'ls-files', '--stage', '-z']))
+                     if stage == '0'])
+
+    @memoized_property
+    def modified(self):
+        """ The set of repository paths of tracked files that differ from the index """
+        return set([path for path in
+                    get_git_response(['-C', self.base, 'diff-files', '--name-only', '-z']).split(u'\x00')
+                    if len(path) > 0])
+
+    @memoized_property
+    def gitlinks(self):
+        """ The set of paths of the submodules recorded in the index
+
+        Unless the whole index is already in hand, it is streamed, so
+        only the submodules are held.
+        """
+        if 'index' in self.__dict__:
+            return set([path for (path, (mode, sha)) in self.index.items()
+                        if mode == GITLINK_MODE])
+        return set([path for (mode, sha, stage, path) in
+                    parse_index_entries(stream_git_response(['-C', self.base, 'ls-files', '--stage', '-z']))
+                    if mode == GITLINK_MODE])
+
+    @memoized_property
+    def git_dir(self):
+        """ The absolute path to the repository's git directory, or None """
+        return self.found[1] or get_git_dir()
+
+    @memoized_property
+    def resolver(self):
+        """ The LinterResolver, saving its findings in the git directory """
+        return LinterResolver(self.git_dir and os.path.join(self.git_dir, 'git-lint', 'linters.json'))
+
+    def revision_range(self, revision):
+        """ The (start, end) commits of the revision range, or None if it's a single revision """
+        ranges = self.__dict__.setdefault('revision_ranges', {})
+        if revision not in ranges:
+            ranges[revision] = get_revision_range(revision)
+        return ranges[revision]
+
+    def changes(self, revision):
+        """ The files changed across the revision range, as a dictionary of path to (mode, blob hash) at its end """
+        changes = self.__dict__.setdefault('revision_changes', {})
+        if revision not in changes:
+            changes[revision] = get_revision_changes(*self.revision_range(revision))
+        return changes[revision]
+
+    def refresh(self):
+        """ Forgets everything that may have changed since it was first asked for.
+
+        The repository's location stays; HEAD, the index and any revision
+        ranges are asked for again, and the linter locations are checked
+        against the PATH.
+        """
+        for name in ['head', 'index', 'modified', 'gitlinks', 'revision_ranges', 'revision_changes']:
+            self.__dict__.pop(name, None)
+        if 'resolver' in self.__dict__:
+            self.resolver.refresh()
+
+
+repository = Repository()
 
 
 #  _   _ _   _ _ _ _   _
@@ -152,20 +603,68 @@ git_head = get_git_head()
 #  \___/ \__|_|_|_|\__|_\___/__/
 #
 
-class MatchFilter:
+Classification = namedtuple('Classification', ['pairs', 'unlintable'])
 
-    def __init__(self, config):
-        self.matcher = self.make_match_filter_matcher([v.linter.get('match', '') for v in config])
 
-    def __call__(self, path):
-        return self.matcher.search(path)
+class DispatchIndex(object):
+    """Maps paths to the linters that handle them.
 
-    @staticmethod
-    def make_match_filter_matcher(extensions):
-        trimmed = [s.strip() for s in reduce(operator.add,
-                                             [ex.split(',') for ex in extensions], [])]
-        cleaned = [re.sub(r'^\.', '', s) for s in trimmed]
-        return re.compile(r'\.' + '|'.join(cleaned) + r'$')
+    Plain extensions from each linter's 'match' list, including dotted
+    ones like 'min.js', go into a table keyed by extension, so finding
+    a path's linters costs one lookup per dot in its name.  Anything
+    that isn't a plain extension is treated as a regular expression
+    for the end of the path, and tried against every path.
+    """
+
+    PLAIN_EXTENSION = re.compile(r'^[\w.+-]+$')
+
+    def __init__(self, config):
+        self.config = list(config)
+        self.extensions = {}
+        self.patterns = []
+        for (position, linter) in enumerate(self.config):
+            for match in linter.linter.get('match', '').split(','):
+                match = re.sub(r'^\.', '', match.strip())
+                if not len(match):
+                    continue
+                if self.PLAIN_EXTENSION.match(match):
+                    self.extensions.setdefault(match, set()).add(position)
+                else:
+                    self.patterns.append((re.compile(r'\.(?:' + match + r')$'), position))
+
+    def positions_for(self, path):
+        """ Returns the positions in the configuration of the linters for a path """
+        basename = path.rsplit('/', 1)[-1]
+        positions = set()
+        dot = basename.find('.')
+        while dot >= 0:
+            positions.update(self.extensions.get(basename[dot + 1:], ()))
+            dot = basename.find('.', dot + 1)
+        for (pattern, position) in self.patterns:
+            if position not in positions and pattern.search(path):
+                positions.add(position)
+        return sorted(positions)
+
+    def linters_for(self, path):
+        """ Returns the linters for a path, in configuration order """
+        return [self.config[position] for position in self.positions_for(path)]
+
+    def classify(self, filenames):
+        """ Sorts filenames into (linter, filename) pairs, and those no linter handles.
+
+        The pairs are in configuration order, and then in the order
+        the filenames were given.  Each filename is looked at once.
+        """
+        buckets = [[] for linter in self.config]
+        unlintable = []
+        for filename in filenames:
+            positions = self.positions_for(filename)
+            if not len(positions):
+                unlintable.append(filename)
+            for position in positions:
+                buckets[position].append(filename)
+        return Classification([(linter, filename) for (linter, bucket) in zip(self.config, buckets)
+                               for filename in bucket], unlintable)
 
 
 #   ___ _           _     _ _     _
@@ -174,27 +673,187 @@ class MatchFilter:
 #  \___|_||_\___\__|_\_\ |_|_|_||_\__\___|_| /__/
 #
 
+def is_executable(path):
+    return os.path.exists(path) and os.access(path, os.X_OK)
+
+
+class LinterResolver(object):
+    """Finds linter executables on the PATH, remembering what it found.
+
+    What was found is saved to a file in the git directory, along with
+    the PATH it was found on and the modification times of the PATH's
+    directories.  As long as neither changes, no executable could have
+    appeared or disappeared, and the saved answers are used as-is.
+    """
+
+    def __init__(self, statefile=None):
+        self.statefile = statefile
+        self.search_path = LinterResolver.get_search_path()
+        self.directories = LinterResolver.get_directories(self.search_path)
+        self.commands = self.load()
+        self.dirty = False
+
+    @staticmethod
+    def get_search_path():
+        return [path for path in os.environ.get('PATH', '').split(':') if len(path)]
+
+    @staticmethod
+    def get_directories(search_path):
+        return [[path, LinterResolver.mtime(path)] for path in search_path]
+
+    def refresh(self):
+        """ Forgets what was found if the PATH or its directories have changed """
+        search_path = LinterResolver.get_search_path()
+        directories = LinterResolver.get_directories(search_path)
+        if directories != self.directories:
+            (self.search_path, self.directories, self.commands) = (search_path, directories, {})
+
+    @staticmethod
+    def mtime(path):
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def load(self):
+        if self.statefile is None:
+            return {}
+        try:
+            with open(self.statefile, 'r') as state:
+                saved = json.load(state)
+        except (IOError, OSError, ValueError):
+            return {}
+        if saved.get('directories') != self.directories:
+            return {}
+        return saved.get('commands', {})
+
+    def save(self):
+        if self.statefile is None or not self.dirty:
+            return
+        try:
+            if not os.path.isdir(os.path.dirname(self.statefile)):
+                os.makedirs(os.path.dirname(self.statefile))
+            (handle, temporary) = tempfile.mkstemp(dir=os.path.dirname(self.statefile))
+            with os.fdopen(handle, 'w') as state:
+                json.dump({'directories': self.directories, 'commands': self.commands}, state)
+            os.rename(temporary, self.statefile)
+            self.dirty = False
+        except (IOError, OSError):
+            pass
+
+    def resolve(self, lintername):
+        """ Returns the absolute path to the executable, or None """
+        if lintername.startswith('/'):
+            return (is_executable(lintername) and lintername) or None
+
+        if lintername not in self.commands:
+            # shutil.which() doesn't appear until Python 3, darnit.
+            possibles = [path for path in
+                         [os.path.join(path, lintername) for path in self.search_path]
+                         if is_executable(path)]
+            self.commands[lintername] = (len(possibles) and possibles.pop(0)) or None
+            self.dirty = True
+        return self.commands[lintername]
+
+
 def linter_exists(linter, label):
     if not len(linter):
         sys.exit(_('Syntax error in linter configuration for {} ').format(label))
 
+    if is_builtin({'command': linter}):
+        return builtin_source(linter) or False
+
     lintername = linter.split(' ').pop(0)
     if not len(lintername):
         sys.exit(_('Syntax error in linter configuration for {} ').format(label))
 
-    def is_executable(path):
-        return os.path.exists(path) and os.access(path, os.X_OK)
+    return repository.resolver.resolve(lintername) or False
+
+
+def uses_shell(linter):
+    """ Returns true if the linter's command is to be run by /bin/sh """
+    return linter.get('shell', 'false').strip().lower() == 'true'
+
+
+def split_linter_command(command, label):
+    """ Splits a linter's command into arguments, the way the shell would """
+    try:
+        return shlex.split(command)
+    except ValueError:
+        sys.exit(_('Syntax error in linter configuration for {} ').format(label))
+
+
+def resolve_linter_command(linter):
+    """ Returns the linter with its command made ready to run.
+
+    The executable is made absolute, so it isn't searched for on the
+    PATH again for every file, and unless the linter asks for a shell,
+    the command is split into its arguments once, here, as 'argv'.
+    A builtin is run as it is.
+    """
+    if is_builtin(linter.linter):
+        return linter
+    (lintername, space, arguments) = linter.linter['command'].partition(' ')
+    executable = repository.resolver.resolve(lintername) or lintername
+    command = dict(linter.linter)
+    command['command'] = executable + space + arguments
+    if not uses_shell(linter.linter):
+        command['argv'] = [executable] + split_linter_command(arguments, linter.name)
+    return linter._replace(linter=command)
+
+
+def takes_stdin(linter):
+    """ Returns true if the linter reads the content to lint from stdin """
+    return linter.get('stdin', 'false').strip().lower() == 'true'
+
+
+def reads_content(linter):
+    """ Returns true if the linter is handed the content to lint, rather than a path to it """
+    return takes_stdin(linter) or is_builtin(linter)
+
+
+def get_stdin_filename_arguments(linter, linter_name, filename):
+    """ Returns the arguments that tell a linter reading stdin what file it's reading
+
+    These are the linter's 'stdin-filename', split like the command,
+    with every '{filename}' replaced by the path of the file.
+    """
+    return [token.replace('{filename}', filename) for token in
+            split_linter_command(linter.get('stdin-filename', ''), linter_name)]
+
+
+def get_output_cap(linter, linter_name):
+    """ Returns the (characters, lines) of its output one run of the linter may keep """
+    try:
+        return parse_output_cap(linter.get('max-output', str(DEFAULT_MAX_OUTPUT)))
+    except ValueError:
+        sys.exit(_('Syntax error in linter configuration for {} ').format(linter_name))
 
-    if lintername.startswith('/'):
-        return (is_executable(lintername) and lintername) or None
 
-    # shutil.which() doesn't appear until Python 3, darnit.
-    possibles = [path for path in
-                 [os.path.join(path, lintername)
-                  for path in os.environ.get('PATH').split(':')]
-                 if is_executable(path)]
+def make_capture(linter, linter_name):
+    """ Returns the Capture that holds one run of the linter to its 'max-output' """
+    (size, lines) = get_output_cap(linter, linter_name)
+    return run_output.capture(size, lines, linter_name)
 
-    return (len(possibles) and possibles.pop(0)) or False
+
+def get_linter_response(linter, linter_name, filenames, content=None, capture=None):
+    """Runs the linter against the files, returning (out, err, returncode).
+
+    The files are handed to the linter as arguments of their own, so
+    no quoting is needed, and no shell is started unless the linter
+    asks for one with 'shell = true'.  Given content, the linter is
+    handed that on stdin instead, and only its 'stdin-filename'
+    arguments name the one file.  Given a Capture, only the output it
+    keeps is returned.
+    """
+    arguments = list(filenames)
+    if content is not None:
+        arguments = get_stdin_filename_arguments(linter, linter_name, filenames[0])
+    if uses_shell(linter):
+        command = ' '.join([linter['command']] + [shell_quote(argument) for argument in arguments])
+        return get_shell_response(command, content, capture)
+    argv = linter.get('argv', None) or split_linter_command(linter['command'], linter_name)
+    return get_command_response(argv + arguments, content, capture)
 
 
 def get_linter_status(config):
@@ -204,6 +863,7 @@ def get_linter_status(config):
 
     working_linter_names = get_working_linter_names(config)
     broken_linter_names = (set([i.name for i in config]) - set(working_linter_names))
+    repository.resolver.save()
     return working_linter_names, broken_linter_names
 
 
@@ -213,98 +873,134 @@ def get_linter_status(config):
 #  \___\___|\__| |_|_/__/\__| \___/_|   |_| |_|_\___/__/
 #
 
-def get_filelist(options, extras):
-    """ Returns the list of files against which we'll run the linters. """
+def parse_porcelain_status(entries):
+    """Parse the entries of 'git status -z --porcelain' into (index, workspace, filename).
+
+    The entries are null-terminated, but are not columnar.  If there's
+    an 'R' (or a 'C') in the index state, the file was renamed (or
+    copied) and the old name follows as an entry of its own, so it's a
+    special case as we go through the list of files.  This is a
+    generator, so it takes constant stack and linear time, and can
+    consume git's output as it is produced.
+    """
+    entries = iter(entries)
+    for entry in entries:
+        (index, workspace, filename) = (entry[0], entry[1], entry[3:])
+        if index in 'RC':
+            next(entries, None)
+        yield (index, workspace, filename)
+
+
+GITLINK_MODE = '160000'
+
+
+def parse_index_entries(entries):
+    """ Parse the entries of 'git ls-files --stage -z' into (mode, sha, stage, path) """
+    for entry in entries:
+        (info, path) = entry.split('\t', 1)
+        (mode, sha, stage) = info.split(' ')
+        yield (mode, sha, stage, path)
+
+
+def parse_tree_entries(entries):
+    """ Parse the entries of 'git ls-tree -z' into (mode, type, sha, path) """
+    for entry in entries:
+        (info, path) = entry.split('\t', 1)
+        (mode, kind, sha) = info.split(' ')
+        yield (mode, kind, sha, path)
+
+
+def parse_raw_diff(entries):
+    """Parse the entries of 'git diff --raw -z' into (old mode, new mode, old sha, new sha, status, path).
+
+    Each change is a ':'-prefixed entry of modes, hashes and status,
+    followed by the path as an entry of its own.  Renames and copies
+    are followed by two paths, the old one and then the new one; only
+    the new one is reported.
+    """
+    entries = iter(entries)
+    for entry in entries:
+        (old_mode, new_mode, old_sha, new_sha, status) = entry.lstrip(':').split(' ')
+        path = next(entries)
+        if status[0] in 'RC':
+            path = next(entries)
+        yield (old_mode, new_mode, old_sha, new_sha, status, path)
+
+
+def stream_filelist(options):
+    """ Yields the files against which we'll run the linters, as git lists them.
+
+    Every stage, from git's output through the submodule and working
+    directory filters, is a generator, so the first files are ready
+    before git has finished listing the rest, and no stage holds the
+    whole list.
+    """
 
     def base_file_filter(files):
         """ Return the full path for all files """
-        return [os.path.join(git_base, file) for file in files]
+        for file in files:
+            yield os.path.join(repository.base, file)
 
     def cwd_file_filter(filenames):
         """ Return the full path for only those files in the cwd and down """
-        if os.path.samefile(os.getcwd(), git_base):
+        if os.path.samefile(os.getcwd(), repository.base):
             return base_file_filter(filenames)
-        gitcwd = os.path.join(os.path.relpath(os.getcwd(), git_base), '')
-        return base_file_filter([filename for filename in filenames
-                                 if filename.startswith(gitcwd)])
+        gitcwd = os.path.join(os.path.relpath(os.getcwd(), repository.base), '')
+        return base_file_filter(filename for filename in filenames
+                                if filename.startswith(gitcwd))
 
     def check_for_conflicts(filesets):
         """ Scan list of porcelain files for merge conflic state. """
         MERGE_CONFLICT_PAIRS = set(['DD', 'DU', 'AU', 'AA', 'UD', 'UA', 'UU'])
-        status_pairs = set(['' + f[0] + f[1] for f in filesets])
-        if len(status_pairs & MERGE_CONFLICT_PAIRS):
-            sys.exit(
-                _('Current repository contains merge conflicts. Linters will not be run.'))
-        return filesets
+        for fileset in filesets:
+            if (fileset[0] + fileset[1]) in MERGE_CONFLICT_PAIRS:
+                sys.exit(
+                    _('Current repository contains merge conflicts. Linters will not be run.'))
+            yield fileset
 
     def remove_submodules(files):
         """ Remove all submodules from the list of files git-lint cares about. """
-
-        fixer_re = re.compile('^(\\.\\.\\/)+')
-        submodules = split_git_response(['submodule', 'status'])
-        submodule_names = [fixer_re.sub('', submodule.split(' ')[2])
-                           for submodule in submodules]
-        return [file for file in files if (file not in submodule_names)]
+        return (file for file in files if (file not in repository.gitlinks))
 
     def get_porcelain_status():
         """ Return the status of all files in the system. """
         cmd = ['status', '-z', '--porcelain',
                '--untracked-files=all', '--ignore-submodules=all']
-        stream = [entry for entry in get_git_response(cmd).split(u'\x00')
-                  if len(entry) > 0]
-
-        # Yeah, baby, recursion, the way this is meant to be handled.
-        # If you have more than 999 files that need linting, you have
-        # a bigger problem...
-        def parse_stream(acc, stream):
-            """Parse the list of files.  T
-
-            The list is null-terminated, but is not columnar.  If
-            there's an 'R' in the index state, it means the file was
-            renamed and the old name is added as a column, so it's a
-            special case as we accumulate the list of files.
-            """
-
-            if len(stream) == 0:
-                return acc
-            entry = stream.pop(0)
-            (index, workspace, filename) = (entry[0], entry[1], entry[3:])
-            if index == 'R':
-                stream.pop(0)
-            return parse_stream(acc + [(index, workspace, filename)], stream)
-
-        return check_for_conflicts(parse_stream([], stream))
+        return check_for_conflicts(parse_porcelain_status(stream_git_response(cmd)))
 
     def revision_list():
-        cmd = ['diff', '--name-only', '-z', options.get('revision')]
-        return [entry for entry in get_git_response(cmd).split(u'\x00')
-                if len(entry) > 0]
+        """ Return the files changed between revisions, except for submodules.
+
+        Across a range, these are the files changed by its commits, and
+        they will be linted as they are at its end, from the object
+        store.  A single revision is compared with the workspace.
+        """
+        if repository.revision_range(options['revision']) is not None:
+            return iter(sorted(repository.changes(options['revision']).keys()))
+        cmd = ['diff', '--raw', '-z', options.get('revision')]
+        return (path for (old_mode, new_mode, old_sha, new_sha, status, path)
+                in parse_raw_diff(stream_git_response(cmd))
+                if new_mode != GITLINK_MODE and old_mode != GITLINK_MODE)
 
     def staging_list():
         """ Return the list of files added or modified to the stage """
 
-        return [filename for (index, workspace, filename) in get_porcelain_status()
-                if index in ['A', 'M']]
+        return remove_submodules(filename for (index, workspace, filename) in get_porcelain_status()
+                                 if index in ['A', 'M'])
 
     def working_list():
         """ Return the list of files that have been modified in the workspace.
 
         Includes the '?' to include files that git is not currently tracking.
         """
-        return [filename for (index, workspace, filename) in get_porcelain_status()
-                if workspace in ['A', 'M', '?']]
+        return remove_submodules(filename for (index, workspace, filename) in get_porcelain_status()
+                                 if workspace in ['A', 'M', '?'])
 
     def all_list():
-        """ Return all the files git is currently tracking for this repository. """
-        cmd = ['ls-tree', '--name-only', '--full-tree', '-r', '-z', git_head]
-        return [file for file in get_git_response(cmd).split(u'\x00')
-                if len(file) > 0]
-
-    if len(extras):
-        cwd = os.path.abspath(os.getcwd())
-        extras_fullpathed = set([os.path.abspath(os.path.join(cwd, f)) for f in extras])
-        not_found = set([f for f in extras_fullpathed if not os.path.isfile(f)])
-        return ([os.path.relpath(f, cwd) for f in (extras_fullpathed - not_found)], not_found)
+        """ Return all the files git is currently tracking for this repository, except for submodules. """
+        cmd = ['ls-tree', '--full-tree', '-r', '-z', repository.head]
+        return (path for (mode, kind, sha, path) in parse_tree_entries(stream_git_response(cmd))
+                if mode != GITLINK_MODE)
 
     working_directory_trans = cwd_file_filter
     if 'base' in options or 'every' in options:
@@ -319,7 +1015,19 @@ def get_filelist(options, extras):
     if 'staging' in options:
         file_list_generator = staging_list
 
-    return (working_directory_trans(remove_submodules(file_list_generator())), [])
+    return working_directory_trans(file_list_generator())
+
+
+def get_filelist(options, extras):
+    """ Returns the list of files against which we'll run the linters. """
+
+    if len(extras):
+        cwd = os.path.abspath(os.getcwd())
+        extras_fullpathed = set([os.path.abspath(os.path.join(cwd, f)) for f in extras])
+        not_found = set([f for f in extras_fullpathed if not os.path.isfile(f)])
+        return ([os.path.relpath(f, cwd) for f in (extras_fullpathed - not_found)], not_found)
+
+    return (list(stream_filelist(options)), [])
 
 
 #  ___ _             _
@@ -337,14 +1045,84 @@ class StagingRunner:
         def time_gather(f):
             stats = os.stat(f)
             return (f, (stats.st_atime, stats.st_mtime))
-        self.times = [time_gather(filename) for filename in self.filenames]
-        run_git_command(['stash', '--keep-index'])
+        with tracer.span('stash'):
+            self.times = [time_gather(filename) for filename in self.filenames]
+            run_git_command(['stash', '--keep-index'])
 
     def __exit__(self, type, value, traceback):
-        run_git_command(['reset', '--hard'])
-        run_git_command(['stash', 'pop', '--quiet', '--index'])
-        for (filename, timepair) in self.times:
-            os.utime(filename, timepair)
+        with tracer.span('unstash'):
+            run_git_command(['reset', '--hard'])
+            run_git_command(['stash', 'pop', '--quiet', '--index'])
+            for (filename, timepair) in self.times:
+                os.utime(filename, timepair)
+
+
+class SnapshotRunner(object):
+    """Lints the staging area from a copy of the staged files.
+
+    Only the staged content of the files to be linted is checked out,
+    into a temporary directory (in memory, where the system has a
+    tmpfs), and the linters are run there.  The workspace is never
+    touched, so there's nothing to stash or restore.
+    """
+
+    def __init__(self, filenames):
+        self.filenames = filenames
+
+    @staticmethod
+    def temporary_parent():
+        shm = '/dev/shm'
+        return ((os.path.isdir(shm) and os.access(shm, os.W_OK)) and shm) or None
+
+    def __enter__(self):
+        self.root = tempfile.mkdtemp(prefix='git-lint-', dir=SnapshotRunner.temporary_parent())
+        paths = [os.path.relpath(os.path.abspath(filename), repository.base) for filename in self.filenames]
+        if len(paths):
+            with tracer.span('snapshot', files=len(paths)):
+                (out, err, returncode) = get_git_response_raw(
+                    ['-C', repository.base, 'checkout-index', '--prefix=' + self.root + '/', '-z', '--stdin'],
+                    u'\x00'.join(paths) + u'\x00')
+            if returncode != 0:
+                self.__exit__(None, None, None)
+                sys.exit(_('Could not copy the staged files: {}').format(err.strip()))
+        return self.root
+
+    def __exit__(self, type, value, traceback):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class RevisionRunner(SnapshotRunner):
+    """Lints the files as they are at the end of a revision range.
+
+    Their content is read from the object store, through one
+    long-lived 'git cat-file --batch', into a temporary directory, and
+    the linters are run there.  Neither the workspace nor the index is
+    touched, so this works in a bare repository, and any number of
+    runs, over any number of commits, can share a repository at once.
+    """
+
+    def __init__(self, filenames, changes):
+        self.filenames = filenames
+        self.changes = changes
+
+    def __enter__(self):
+        self.root = tempfile.mkdtemp(prefix='git-lint-', dir=SnapshotRunner.temporary_parent())
+        paths = [os.path.relpath(os.path.abspath(filename), repository.base) for filename in self.filenames]
+        if len(paths):
+            with tracer.span('snapshot', files=len(paths)), BlobReader() as reader:
+                for path in paths:
+                    (mode, sha) = self.changes[path]
+                    content = reader.read(sha)
+                    if content is None:
+                        self.__exit__(None, None, None)
+                        sys.exit(_('Could not read {} ({}) from the repository.').format(path, sha))
+                    target = os.path.join(self.root, path)
+                    if not os.path.isdir(os.path.dirname(target)):
+                        os.makedirs(os.path.dirname(target))
+                    with open(target, 'wb') as blob:
+                        blob.write(content)
+                    os.chmod(target, ((mode == '100755') and 0o755) or 0o644)
+        return self.root
 
 
 class WorkspaceRunner(object):
@@ -358,16 +1136,209 @@ class WorkspaceRunner(object):
         pass
 
 
+class ContentReader(object):
+    """Reads the content of files for linters that take it on stdin.
+
+    Given the blob hash of each file, as when linting the staging area
+    or a revision range, the content is read from the object store,
+    through one long-lived 'git cat-file --batch', and never written
+    to disk; otherwise each file is read where it is.
+    """
+
+    def __init__(self, hashes=None):
+        self.hashes = hashes
+        self.blobs = BlobReader()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.blobs.close()
+
+    @staticmethod
+    def read_file(filename):
+        with open(filename, 'rb') as source:
+            return source.read()
+
+    def read(self, filename):
+        # type: (str) -> bytes
+        if self.hashes is None:
+            return ContentReader.read_file(filename)
+        content = self.blobs.read(self.hashes.get(filename, ''))
+        if content is None:
+            raise IOError(_('Could not read {} from the repository.').format(filename))
+        return content
+
+    @contextmanager
+    def mapped(self, filename):
+        """ Yields the content, with a file in the workspace mapped into memory rather than read """
+        if self.hashes is not None:
+            yield self.read(filename)
+            return
+        with open(filename, 'rb') as source:
+            if os.fstat(source.fileno()).st_size == 0:
+                yield b''
+                return
+            content = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield content
+            finally:
+                content.close()
+
+
 #  ___             _ _     _
 # | _ \_  _ _ _   | (_)_ _| |_   _ __  __ _ ______
 # |   / || | ' \  | | | ' \  _| | '_ \/ _` (_-<_-<
 # |_|_\\_,_|_||_| |_|_|_||_\__| | .__/\__,_/__/__/
 #                               |_|
 
+REPODIR = '%(repodir)s'
+
+
+class LintCache(object):
+    """Looks up and records lint results in a ResultCache.
+
+    A result is keyed by the blob hash of the file's content, the
+    file's name, the linter's fully interpolated configuration, and
+    the identity of the linter executable and of any files named on
+    its command line, so that changing any of them re-lints the file.
+    Results with output left out, which may depend on the rest of the
+    run, are not recorded.
+
+    Results may also be shared, through a SharedCache, with every
+    other clone of the repository.  Those are keyed by what is the
+    same in every clone: the repository's location is left out, and
+    the linter and the files it names are known by their content.
+    Results found there are copied into the local store before the
+    run starts.
+    """
+
+    def __init__(self, store, hashes, shared=None):
+        self.store = store
+        self.hashes = hashes
+        self.shared = shared
+        self.identities = {}
+        self.portable_identities = {}
+
+    @staticmethod
+    def linter_identity(linter):
+        def file_identity(path):
+            stats = os.stat(path)
+            return [path, stats.st_size, stats.st_mtime]
+
+        executable = linter_exists(linter.linter['command'], linter.name)
+        return [file_identity(path) for path in
+                ([executable] + [token for token in
+                                 linter.linter.get('argv', linter.linter['command'].split(' '))[1:]
+                                 if os.path.isfile(token)])]
+
+    @staticmethod
+    def portable_identity(linter):
+        """ Returns what identifies the linter alike in every clone, on every machine """
+        def portable(value):
+            if value == repository.base:
+                return REPODIR
+            return value.replace(repository.base + '/', REPODIR + '/')
+
+        def file_digest(path):
+            digest = hashlib.sha1()
+            with open(path, 'rb') as source:
+                for chunk in iter(lambda: source.read(65536), b''):
+                    digest.update(chunk)
+            return digest.hexdigest()
+
+        executable = linter_exists(linter.linter['command'], linter.name)
+        arguments = linter.linter.get('argv', linter.linter['command'].split(' '))[1:]
+        return [sorted([(key, portable(value)) for (key, value) in linter.linter.items()
+                        if key not in ['command', 'argv']]),
+                [os.path.basename(executable)] + [portable(argument) for argument in arguments],
+                [file_digest(path) for path in
+                 [executable] + [argument for argument in arguments if os.path.isfile(argument)]]]
+
+    def key(self, linter, filename):
+        sha = self.hashes.get(filename, None)
+        if sha is None:
+            return None
+        if linter.name not in self.identities:
+            self.identities[linter.name] = LintCache.linter_identity(linter)
+        return make_key(sha, filename.replace(repository.base + '/', '', 1), linter.name,
+                        sorted(linter.linter.items()), self.identities[linter.name])
+
+    def shared_key(self, linter, filename):
+        sha = self.hashes.get(filename, None)
+        if sha is None:
+            return None
+        if linter.name not in self.portable_identities:
+            self.portable_identities[linter.name] = LintCache.portable_identity(linter)
+        return make_key(sha, filename.replace(repository.base + '/', '', 1), linter.name,
+                        self.portable_identities[linter.name])
+
+    @staticmethod
+    def to_shared(result):
+        (filename, linter_name, returncode, output) = result
+        return (filename, linter_name, returncode,
+                [line.replace(repository.base + '/', REPODIR + '/') for line in output])
+
+    @staticmethod
+    def from_shared(result):
+        (filename, linter_name, returncode, output) = result
+        return (filename, linter_name, returncode,
+                [line.replace(REPODIR + '/', repository.base + '/') for line in output])
+
+    def fetch(self, pairs):
+        """ Copies the shared results for the (linter, filename) pairs not in the local store into it """
+        if self.shared is None:
+            return
+        missing = [(linter, filename) for (linter, filename) in pairs
+                   if self.key(linter, filename) and self.get(linter, filename) is None]
+        keys = dict([(self.shared_key(linter, filename), (linter, filename)) for (linter, filename) in missing])
+        with tracer.span('fetch_shared', files=len(keys)):
+            found = self.shared.get_many(sorted(keys.keys()))
+        for (shared_key, result) in found.items():
+            (linter, filename) = keys[shared_key]
+            self.store.put(self.key(linter, filename), LintCache.from_shared(result))
+
+    def get(self, linter, filename):
+        key = self.key(linter, filename)
+        return (key and self.store.get(key)) or None
+
+    def put(self, linter, filename, result):
+        key = self.key(linter, filename)
+        if key and not is_truncated(result[3]):
+            self.store.put(key, result)
+            if self.shared is not None:
+                self.shared.put(self.shared_key(linter, filename), LintCache.to_shared(result))
+
+    def close(self):
+        self.store.prune()
+        if self.shared is not None:
+            self.shared.flush()
+
+
+class JobAborted(Exception):
+    """ Carries what a job raised, other than an Exception, out of a pool's thread """
+
+    def __init__(self, error):
+        Exception.__init__(self, error)
+        self.error = error
+
+
+PIPELINE_WINDOW = 1024
+PIPELINE_BACKLOG = 4
+
+
 class Linters:
-    def __init__(self, linters, filenames):
+    def __init__(self, linters, filenames, jobs=1, cache=None, pairs=None, pool=None):
         self.linters = linters
         self.filenames = filenames
+        self.jobs = jobs
+        self.cache = cache
+        self.root = None
+        self.classified = pairs
+        self.pool = pool
+        self.history = None
+        self.content = None
+        self.held = {}
 
     @staticmethod
     def encode_shell_messages(prefix, messages):
@@ -375,81 +1346,541 @@ class Linters:
                 for line in messages.splitlines()]
 
     @staticmethod
-    def run_external_linter(filename, linter, linter_name):
-        """Run one linter against one file.
+    def make_result(filename, linter, linter_name, out, err, returncode, root=None, capture=None):
+        """ Turns the output of a linter on one file into a result tuple
 
-        If the result matches the error condition specified in the configuration file,
-        return the error code and messages, otherwise return nothing.
+        Filenames are reported relative to the root, which is the base
+        of the repository unless the files were copied elsewhere.  If
+        the capture left some of the output out, a failure ends with the
+        line saying so, and a stream left out entirely still counts.
         """
-
-        cmd = linter['command'] + ' "' + filename + '"'
-        (out, err, returncode) = get_shell_response(cmd)
-        failed = ((out and (linter.get('condition', 'error') == 'output')) or err or (not (returncode == 0)))
-        trimmed_filename = filename.replace(git_base + '/', '', 1)
+        lost = (capture is not None and capture.lost) or set()
+        failed = (((out or 'out' in lost) and (linter.get('condition', 'error') == 'output')) or
+                  err or 'err' in lost or (not (returncode == 0)))
+        trimmed_filename = filename.replace((root or repository.base) + '/', '', 1)
         if not failed:
             return (trimmed_filename, linter_name, 0, [])
 
         prefix = (((linter.get('print', 'false').strip().lower() != 'true') and '  ') or
                   '   {}: '.format(trimmed_filename))
         output = (Linters.encode_shell_messages(prefix, out) +
-                  ((err and Linters.encode_shell_messages(prefix, err)) or []))
+                  ((err and Linters.encode_shell_messages(prefix, err)) or []) +
+                  ((capture is not None and capture.dropped and [prefix + capture.marker()]) or []))
         return (trimmed_filename, linter_name, (returncode or 1), output)
 
+    @staticmethod
+    def run_external_linter(filename, linter, linter_name, root=None, reader=None):
+        """Run one linter against one file.
+
+        If the result matches the error condition specified in the configuration file,
+        return the error code and messages, otherwise return nothing.  A linter that
+        takes its input on stdin is handed the file's content, as read by the reader.
+        """
+
+        content = None
+        if takes_stdin(linter):
+            try:
+                content = (reader or ContentReader()).read(filename)
+            except (IOError, OSError) as error:
+                return Linters.make_result(filename, linter, linter_name, '', str(error), 1, root)
+        capture = make_capture(linter, linter_name)
+        with tracer.span(linter_name, 'job', linter=linter_name, files=[filename]):
+            (out, err, returncode) = get_linter_response(linter, linter_name, [filename], content, capture)
+        return Linters.make_result(filename, linter, linter_name, out, err, returncode, root, capture)
+
+    @staticmethod
+    def attribute_output(linter, linter_name, filenames, out, err):
+        """ Splits the output of a batch run into per-file output.
+
+        Every line must start with the name of one of the files in the
+        batch, as found by the linter's batch-pattern.  Returns a
+        dictionary of filename to (stdout lines, stderr lines), or None
+        if any line could not be attributed to a file.
+        """
+        pattern = get_batch_pattern(linter, linter_name)
+        known = dict([(os.path.abspath(filename), filename) for filename in filenames])
+        attributed = dict([(filename, ([], [])) for filename in filenames])
+
+        def attribute(stream, lines):
+            for line in lines.splitlines():
+                match = pattern.search(line)
+                if not match:
+                    return False
+                filename = known.get(os.path.abspath(match.group('filename')), None)
+                if filename is None:
+                    return False
+                attributed[filename][stream].append(line)
+            return True
+
+        if not (attribute(0, out) and attribute(1, err)):
+            return None
+        return attributed
+
+    @staticmethod
+    def run_batch(filenames, linter, linter_name, root=None):
+        """Run one linter against several files in one invocation.
+
+        The output is split back into per-file results.  If the linter
+        failed but the failure cannot be attributed file by file, or
+        some of the output was left out, so that the files it was about
+        can't be known, the batch is run again one file at a time.
+        """
+
+        capture = make_capture(linter, linter_name)
+        with tracer.span(linter_name, 'job', linter=linter_name, files=filenames):
+            (out, err, returncode) = get_linter_response(linter, linter_name, filenames, capture=capture)
+        attributed = Linters.attribute_output(linter, linter_name, filenames, out, err)
+        if (attributed is None) or (returncode != 0 and not (out or err)) or capture.dropped:
+            return [Linters.run_external_linter(filename, linter, linter_name, root)
+                    for filename in filenames]
+
+        def file_result(filename):
+            (file_out, file_err) = attributed[filename]
+            return Linters.make_result(filename, linter, linter_name,
+                                       '\n'.join(file_out), '\n'.join(file_err),
+                                       ((file_out or file_err) and returncode) or 0, root)
+
+        return [file_result(filename) for filename in filenames]
+
+    @staticmethod
+    def files_for_linter(linter, filenames):
+        """ Returns those filenames, in order, that the linter handles """
+        return [filename for (pair_linter, filename) in DispatchIndex([linter]).classify(filenames).pairs]
+
+    @staticmethod
+    def batches_for_linter(linter, filenames):
+        """ Splits the linter's files into batches of the configured size """
+        size = get_batch_size(linter)
+        return [filenames[i:i + size] for i in range(0, len(filenames), size)]
+
+    @staticmethod
+    def run_builtin(filenames, linter, linter_name, root=None, reader=None):
+        """Runs a builtin linter over every file of a job, in this process.
+
+        Each file's content is mapped into memory, or read from the
+        object store, and handed to the builtin, whose output is kept
+        and judged as a process's would be.
+        """
+        check = find_builtin(linter['command'])
+        reader = reader or ContentReader()
+
+        def run(filename):
+            capture = make_capture(linter, linter_name)
+            try:
+                with reader.mapped(filename) as content:
+                    (out, err, returncode) = check(linter, filename, content)
+            except (IOError, OSError, ValueError) as error:
+                (out, err, returncode) = ('', str(error), 2)
+            return Linters.make_result(filename, linter, linter_name, capture.keep(out), capture.keep(err, 'err'),
+                                       returncode, root, capture)
+
+        with tracer.span(linter_name, 'job', linter=linter_name, files=filenames):
+            return [run(filename) for filename in filenames]
+
+    @staticmethod
+    def run_job(job, root=None, reader=None):
+        """ Runs a single (linter, filenames) job, returning a list of results """
+        (linter, filenames) = job
+        if is_builtin(linter.linter):
+            return Linters.run_builtin(filenames, linter.linter, linter.name, root, reader)
+        if len(filenames) == 1:
+            return [Linters.run_external_linter(filenames[0], linter.linter, linter.name, root, reader)]
+        return Linters.run_batch(filenames, linter.linter, linter.name, root)
+
+    def run_job_in_root(self, job):
+        """ Runs a job, against the copies of its files under the root if there is one
+
+        Results, and any paths in the linter's output, are mapped back
+        to the files in the repository.  Linters that are handed their
+        content get it from the content reader, if there is one, and
+        need no copies.
+        """
+        if self.root is None or (self.content is not None and reads_content(job[0].linter)):
+            return Linters.run_job(job, reader=self.content)
+
+        (linter, filenames) = job
+        copies = [os.path.join(self.root, os.path.relpath(os.path.abspath(filename), repository.base))
+                  for filename in filenames]
+        return [(filename.replace(repository.base + '/', '', 1), linter_name, returncode,
+                 [line.replace(self.root + '/', repository.base + '/') for line in output])
+                for (filename, (copy, linter_name, returncode, output))
+                in zip(filenames, Linters.run_job((linter, copies), self.root))]
+
     @staticmethod
     def run_one_linter(linter, filenames):
         """ Runs one linter against a set of files
 
-        Creates a match filter for the linter, extract the files to be
+        Picks out the files the linter handles, by its match setting, to be
         linted, and runs the linter against each file, returning the
         result as a list of successes and failures.  Failures have a
         return code and the output of the lint process.
         """
-        match_filter = MatchFilter([linter])
-        files = set([filename for filename in filenames if match_filter(filename)])
-        return [Linters.run_external_linter(filename, linter.linter, linter.name) for filename in files]
+        return reduce(operator.add,
+                      [Linters.run_job((linter, batch)) for batch in
+                       Linters.batches_for_linter(linter, Linters.files_for_linter(linter, filenames))],
+                      [])
+
+    def pairs(self):
+        """ Returns every (linter, filename) pair to lint, in report order
+
+        The pairs may have been classified already by the caller;
+        otherwise the filenames are classified here.
+        """
+        if self.classified is None:
+            self.classified = DispatchIndex(self.linters).classify(self.filenames).pairs
+        return self.classified
+
+    def plan(self, pairs=None):
+        """ Returns the list of (linter, filenames) jobs to run.
+
+        The jobs are ordered by linter, as they appear in the
+        configuration file, and then by filename.  That order is the
+        order in which results are reported, no matter in what order
+        the jobs actually finish.  Unless the linter is configured to
+        take files in batches, each job holds exactly one file.
+        """
+        if pairs is None:
+            pairs = self.pairs()
+        filenames = dict([(linter.name, []) for linter in self.linters])
+        for (linter, filename) in pairs:
+            filenames[linter.name].append(filename)
+        return [(linter, batch) for linter in self.linters
+                for batch in Linters.batches_for_linter(linter, filenames[linter.name])]
+
+    def run_job_in_order(self, job):
+        """ Runs a job, returning the job along with its results and how long it took """
+        started = time.time()
+        results = self.run_job_in_root(job)
+        return (job, results, time.time() - started)
+
+    def run_job_in_pool(self, job):
+        """ Runs a job on a pool's thread, where only an Exception is handed back to the caller
+
+        Anything else, such as the SystemExit of a configuration error,
+        would end the thread and leave the caller waiting for it, so it
+        is carried back inside a JobAborted.
+        """
+        try:
+            return self.run_job_in_order(job)
+        except Exception:
+            raise
+        except BaseException as error:
+            raise JobAborted(error)
+
+    @staticmethod
+    def reraise_aborted(finished):
+        """ Yields the finished jobs, raising whatever aborted one of them again here """
+        try:
+            for done in finished:
+                yield done
+        except JobAborted as aborted:
+            raise aborted.error
+
+    @staticmethod
+    def file_size(filename):
+        try:
+            return os.path.getsize(filename)
+        except OSError:
+            return 0
+
+    def schedule(self, jobs):
+        """ Orders the jobs longest first, as far as the history can tell.
+
+        Starting the longest jobs first keeps one slow job from being
+        left to run alone at the end.  The order of the results, once
+        reported, doesn't depend on the order the jobs are run in.
+        """
+        if self.history is None or len(jobs) < 2:
+            return jobs
+
+        def estimate(job):
+            (linter, filenames) = job
+            return sum([self.history.estimate(linter.name, filename.replace(repository.base + '/', '', 1),
+                                              Linters.file_size(filename))
+                        for filename in filenames])
+
+        return sorted(jobs, key=lambda job: -estimate(job))
+
+    def remember(self, job, seconds):
+        """ Records how long a job took, sharing a batch's time out among its files by size """
+        (linter, filenames) = job
+        sizes = [Linters.file_size(filename) for filename in filenames]
+        total = sum(sizes)
+        for (filename, size) in zip(filenames, sizes):
+            share = ((total and float(size) / total) or 1.0 / len(filenames))
+            self.history.record(linter.name, filename.replace(repository.base + '/', '', 1),
+                                size, seconds * 1000.0 * share)
+
+    def stream_jobs(self, jobs):
+        """ Runs a list of jobs, in parallel if permitted
+
+        Linters are external processes, so the work is done by the
+        children and a pool of threads is enough to keep every core
+        busy.  Yields each job with its results as soon as the job
+        finishes, which may not be the order in which they were given.
+        A pool that outlives this run may be supplied instead.
+        """
+        if self.pool is not None:
+            for finished in Linters.reraise_aborted(self.pool.imap_unordered(self.run_job_in_pool, jobs, 1)):
+                yield finished
+            return
+
+        workers = min(self.jobs, len(jobs))
+        if workers < 2:
+            for job in jobs:
+                yield self.run_job_in_order(job)
+            return
+
+        pool = ThreadPool(workers)
+        try:
+            for finished in Linters.reraise_aborted(pool.imap_unordered(self.run_job_in_pool, jobs, 1)):
+                yield finished
+        finally:
+            pool.terminate()
+            pool.join()
+
+    @staticmethod
+    def result_key(linter, filename):
+        """ Returns the (trimmed filename, linter name) that identifies a result """
+        return (filename.replace(repository.base + '/', '', 1), linter.name)
+
+    def expected(self):
+        """ Returns the keys of the results to come, in report order """
+        return [Linters.result_key(linter, filename) for (linter, filename) in self.pairs()]
+
+    def lookup(self, pairs):
+        """ Returns the cached results for the (linter, filename) pairs, and the pairs not cached """
+        if self.cache is None:
+            return ([], pairs)
+        self.cache.fetch(pairs)
+        (cached, uncached) = ([], [])
+        for (linter, filename) in pairs:
+            result = self.cache.get(linter, filename)
+            if result is None:
+                uncached.append((linter, filename))
+                continue
+            cached.append(result)
+        return (cached, uncached)
+
+    def finish(self, finished):
+        """ Records a finished job in the history and the cache, returning its results """
+        (job, results, seconds) = finished
+        (linter, filenames) = job
+        if self.history is not None:
+            self.remember(job, seconds)
+        if self.cache is not None:
+            for (filename, result) in zip(filenames, results):
+                self.cache.put(linter, filename, result)
+        return results
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+        if self.history is not None:
+            self.history.save()
+
+    def stream(self):
+        """ Yields results as they become available.
+
+        Cached results come first, then the rest as their jobs finish.
+        """
+        (cached, uncached) = self.lookup(self.pairs())
+        for result in cached:
+            yield result
+
+        for finished in self.stream_jobs(self.schedule(self.plan(uncached))):
+            for result in self.finish(finished):
+                yield result
+
+        self.close()
+
+    def run_job_reporting(self, job, finished):
+        """ Runs a job, putting it on the queue with its results, or what went wrong, when it's done """
+        try:
+            finished.put((self.run_job_in_order(job), None))
+        except BaseException as error:
+            finished.put((None, error))
+
+    def hold(self, window, uncached):
+        """ Counts, by file, the window's results still to come, forgetting the hashes of files with none """
+        for (linter, filename) in uncached:
+            self.held[filename] = self.held.get(filename, 0) + 1
+        self.release([filename for (linter, filename) in window if filename not in self.held])
+
+    def release(self, filenames, finished=False):
+        """ Forgets the blob hashes of the files, once every result for them has come """
+        for filename in filenames:
+            if finished:
+                self.held[filename] = self.held[filename] - 1
+            if self.held.get(filename, 0) > 0:
+                continue
+            self.held.pop(filename, None)
+            if self.cache is not None:
+                self.cache.hashes.pop(filename, None)
+
+    def settle(self, finished):
+        """ Records a job of the pipeline as finished, returning its results """
+        results = self.finish(finished)
+        self.release(finished[0][1], True)
+        return results
+
+    @staticmethod
+    def wait(finished):
+        (done, error) = finished.get()
+        if error is not None:
+            raise error
+        return done
+
+    def pipeline(self, windows):
+        """ Yields results as the (linter, filename) pairs arrive, a window at a time.
+
+        Each window's cached results are yielded at once, and its jobs,
+        longest first, handed to the workers while the next window is
+        still being listed.  No more than PIPELINE_BACKLOG jobs per
+        worker wait to be run; when that many do, listing waits for a
+        job to finish, so the pairs are read no faster than they can be
+        linted.  Results come in the order the jobs finish.  The blob
+        hashes of a window's files are forgotten as their results come,
+        so the cache holds no more of them than the windows in flight.
+        """
+        workers = self.jobs
+        pool = (workers > 1 and ThreadPool(workers)) or None
+        finished = queue.Queue()
+        running = 0
+        try:
+            for window in windows:
+                (cached, uncached) = self.lookup(window)
+                self.hold(window, uncached)
+                for result in cached:
+                    yield result
+                for job in self.schedule(self.plan(uncached)):
+                    if pool is None:
+                        for result in self.settle(self.run_job_in_order(job)):
+                            yield result
+                        continue
+                    while running >= workers * PIPELINE_BACKLOG:
+                        running = running - 1
+                        for result in self.settle(Linters.wait(finished)):
+                            yield result
+                    pool.apply_async(self.run_job_reporting, (job, finished))
+                    running = running + 1
+            while running > 0:
+                running = running - 1
+                for result in self.settle(Linters.wait(finished)):
+                    yield result
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        self.close()
 
     def __call__(self):
         """ Returns a function to run a set of linters against a set of filenames
 
         This returns a function because it's going to be wrapped in a
         runner to better handle stashing and restoring a staged commit.
+        The results are in report order: by linter, as they appear in
+        the configuration file, and then by filename.
         """
-        return reduce(operator.add,
-                      [Linters.run_one_linter(linter, self.filenames) for linter in self.linters], [])
+        order = dict([(key, position) for (position, key) in enumerate(self.expected())])
+        return sorted(self.stream(), key=lambda result: order[(result[0], result[1])])
 
     def dryrun(self):
 
         def dryrunonefile(filename, linter):
-            trimmed_filename = filename.replace(git_base + '/', '', 1)
+            trimmed_filename = filename.replace(repository.base + '/', '', 1)
             return (trimmed_filename, linter.name, 0, ['    {}'.format(trimmed_filename)])
 
-        def dryrunonce(linter, filenames):
-            match_filter = MatchFilter([linter])
-            files_to_check = [filename for filename in filenames if match_filter(filename)]
-            return [dryrunonefile(filename, linter) for filename in files_to_check]
+        return [dryrunonefile(filename, linter) for (linter, filenames) in self.plan()
+                for filename in filenames]
 
-        return reduce(operator.add, [dryrunonce(linter, self.filenames) for linter in self.linters], [])
 
+class ResultStream(object):
+    """Lint results that are produced as the linters finish.
 
-def run_linters(options, config, extras=[]):
-    if 'pr' in options:
-        options.pop('pr')
-        options['revision'] = 'HEAD^..HEAD'
+    Iterating over it runs the linters.  'expected' holds the (filename,
+    linter name) keys of every result to come, in report order, so a
+    reporter can tell when a group of results is complete.
+    """
 
-    def build_config_subset(keys):
-        """ Returns a subset of the configuration, with only those linters mentioned in keys """
-        return [item for item in config if item.name in keys]
+    def __init__(self, results, expected):
+        self.results = results
+        self.expected = expected
 
-    """ Runs the requested linters """
-    all_filenames, unfindable_filenames = get_filelist(options, extras)
+    def __iter__(self):
+        return iter(self.results)
 
-    is_lintable = MatchFilter(config)
-    lintable_filenames = set([filename for filename in all_filenames
-                              if is_lintable(filename)])
 
-    unlintable_filenames = set(all_filenames) - lintable_filenames
+def get_batch_size(linter):
+    """ Returns the number of files the linter may be handed at once.
 
-    # Filter the linter config down to the selected ones.
+    A linter reading stdin is handed one file at a time, and a builtin,
+    unless told otherwise, every file at once.
+    """
+    if takes_stdin(linter.linter):
+        return 1
+    batch = linter.linter.get('batch', (is_builtin(linter.linter) and str(sys.maxsize)) or '1')
+    try:
+        return max(int(batch), 1)
+    except ValueError:
+        sys.exit(_('Syntax error in linter configuration for {} ').format(linter.name))
+
+
+def get_batch_pattern(linter, linter_name):
+    """ Returns the pattern that finds the filename in a line of batch output.
+
+    The filename is the group named 'filename'.  The default works for
+    linters that report in the common 'filename:line:column' form.
+    """
+    try:
+        pattern = re.compile(linter.get('batch-pattern', r'^(?P<filename>[^:]+):'))
+    except re.error:
+        pattern = None
+    if pattern is None or 'filename' not in pattern.groupindex:
+        sys.exit(_('Syntax error in linter configuration for {} ').format(linter_name))
+    return pattern
+
+
+def get_job_count(options):
+    """ Returns the number of linter jobs to run at once.
+
+    Defaults to the number of CPUs on the machine.
+    """
+    if 'jobs' not in options:
+        try:
+            return multiprocessing.cpu_count()
+        except NotImplementedError:
+            return 1
+
+    try:
+        return max(int(options['jobs']), 1)
+    except ValueError:
+        sys.exit(_('The --jobs option requires a number: {}').format(options['jobs']))
+
+
+def check_linter_configuration(linter):
+    """ Exits with a syntax error if any of the linter's settings can't be used
+
+    The settings are otherwise first read by the threads running the
+    jobs, where exiting would only end the thread.
+    """
+    get_batch_size(linter)
+    get_batch_pattern(linter.linter, linter.name)
+    get_output_cap(linter.linter, linter.name)
+    split_linter_command(linter.linter.get('stdin-filename', ''), linter.name)
+    if is_builtin(linter.linter):
+        try:
+            validate_builtin(linter.linter)
+        except ValueError:
+            sys.exit(_('Syntax error in linter configuration for {} ').format(linter.name))
+
+
+def select_linters(options, config):
+    """ Returns the linters chosen with --only or --exclude that can be run, and the names of those that can't
+
+    The linters that can be run have their settings checked, and their
+    executables resolved.
+    """
     if 'only' in options:
         config = [linter for linter in config
                   if linter.name in options['only']]
@@ -460,26 +1891,312 @@ def run_linters(options, config, extras=[]):
         raise RuntimeError('No linters left to run! Be less strict with --only and --exclude.')
 
     working_linter_names, broken_linter_names = get_linter_status(config)
+    for linter in config:
+        if linter.name in working_linter_names:
+            check_linter_configuration(linter)
+    return ([resolve_linter_command(linter) for linter in config
+             if linter.name in working_linter_names], broken_linter_names)
+
+
+def start_output(options):
+    """ Sets the limit on the output kept by the whole run, from --max-output
 
-    cant_lint_filter = MatchFilter(build_config_subset(
-        broken_linter_names))
-    cant_lint_filenames = [filename for filename in lintable_filenames
-                           if cant_lint_filter(filename)]
+    Output that doesn't fit goes to a directory of the run's own under
+    GIT_DIR/git-lint/output, kept for a day.
+    """
+    try:
+        (size, lines) = parse_output_cap(options.get('max-output', str(DEFAULT_MAX_TOTAL_OUTPUT)))
+    except ValueError:
+        sys.exit(_('The --max-output option requires a number of characters, of lines, or both: {}').format(
+            options['max-output']))
+    run_output.start(size, lines,
+                     repository.git_dir and os.path.abspath(os.path.join(repository.git_dir, 'git-lint', 'output')))
+
+
+def get_linted_range(options):
+    """ Returns the (start, end) of the revision range to be linted from the object store, or None """
+    if 'staging' in options or 'all' in options or 'revision' not in options:
+        return None
+    return repository.revision_range(options['revision'])
+
+
+def get_content_hashes(options, filenames):
+    """ Returns a dictionary of filename to the blob hash of the content that will be linted """
+    if get_linted_range(options) is None:
+        return get_blob_hashes(filenames, 'staging' in options)
+    changes = repository.changes(options['revision'])
+    paths = dict([(filename, os.path.relpath(os.path.abspath(filename), repository.base))
+                  for filename in filenames])
+    return dict([(filename, changes[path][1]) for (filename, path) in paths.items()
+                 if path in changes])
+
+
+def make_content_reader(options, filenames):
+    """ Returns the ContentReader for linters that take their input on stdin
+
+    When linting the staging area or a revision range, it reads from
+    the object store; otherwise, from the workspace.
+    """
+    if 'staging' in options or get_linted_range(options) is not None:
+        return ContentReader(get_content_hashes(options, filenames))
+    return ContentReader()
+
+
+def make_shared_cache(options):
+    """ Returns the SharedCache named with --shared-cache, or in GIT_LINT_SHARED_CACHE, or None
+
+    Its entries are signed with the secret in GIT_LINT_CACHE_SECRET,
+    without which it can't be used.
+    """
+    location = options.get('shared-cache', os.environ.get('GIT_LINT_SHARED_CACHE', None))
+    if not location:
+        return None
+    secret = os.environ.get('GIT_LINT_CACHE_SECRET', None)
+    if not secret:
+        sys.exit(_('A shared cache needs the secret its entries are signed with, in GIT_LINT_CACHE_SECRET.'))
+    return SharedCache(make_backend(location), secret.encode('utf-8'))
+
+
+def make_lint_cache(options, filenames):
+    """ Returns the LintCache for the files, unless caching is turned off """
+    if not repository.git_dir or 'no-cache' in options:
+        return None
+    return LintCache(ResultCache(os.path.join(repository.git_dir, 'git-lint', 'cache')),
+                     get_content_hashes(options, filenames),
+                     make_shared_cache(options))
+
+
+def make_job_history(options):
+    """ Returns the JobHistory used to schedule the longest jobs first.
+
+    Shards don't update the history; it still orders the jobs within
+    a shard, but never decides which shard a job is in.
+    """
+    if not repository.git_dir:
+        return None
+    return JobHistory(os.path.join(repository.git_dir, 'git-lint', 'durations.json'),
+                      readonly=('shard' in options))
+
+
+def select_shard(options, pairs):
+    """ Returns the (linter, filename) pairs in the shard chosen with --shard.
+
+    The pairs are divided among the shards by their expected cost: by
+    file size, unless --shard-history names a job history file that
+    every shard shares.  Each clone's own history differs, so it is
+    never used, and every machine given the same files, and the same
+    history file (or none), makes the same division.  The division's
+    digest is recorded in the options as 'partition', so shards can be
+    checked when merged.
+    """
+    (index, count) = parse_shard(options['shard'])
+    history = JobHistory(None)
+    if 'shard-history' in options:
+        if not os.path.isfile(options['shard-history']):
+            sys.exit(_('The shard history {} could not be found.').format(options['shard-history']))
+        history = JobHistory(options['shard-history'], readonly=True)
+    filenames = dict([(Linters.result_key(linter, filename), filename) for (linter, filename) in pairs])
+
+    def cost(key):
+        (trimmed_filename, linter_name) = key
+        return history.estimate(linter_name, trimmed_filename, Linters.file_size(filenames[key]))
+
+    shards = partition(sorted(filenames.keys()), count, cost)
+    options['partition'] = partition_digest(shards)
+    chosen = set(shards[index - 1])
+    return [(linter, filename) for (linter, filename) in pairs
+            if Linters.result_key(linter, filename) in chosen]
+
+
+def get_clean_tree(options, extras, working_config, broken_linter_names):
+    """Returns (store, tree, key) for remembering that the staging area linted clean.
+
+    The tree is what 'git write-tree' makes of the index, and the key
+    covers the configuration of every linter that can run, their
+    executables, and the linters that can't.  Only runs over the whole
+    staging area, from the base of the repository or with --base, with
+    the cache in use, are remembered; for anything else, returns None.
+    """
+    if ('staging' not in options or len(extras) or 'shard' in options or 'dryrun' in options or
+            'no-cache' in options or not repository.git_dir):
+        return None
+    if not ('base' in options or 'every' in options or os.path.samefile(os.getcwd(), repository.base)):
+        return None
+    tree = get_index_tree()
+    if tree is None:
+        return None
+    key = make_key([[linter.name, sorted(linter.linter.items()), LintCache.linter_identity(linter)]
+                    for linter in working_config], sorted(broken_linter_names))
+    return (CleanTreeStore(os.path.join(repository.git_dir, 'git-lint', 'clean-trees.json')), tree, key)
+
+
+def remember_if_clean(clean, results, cant_lint_filenames, unfindable_filenames):
+    if clean is None or len(cant_lint_filenames) or len(unfindable_filenames):
+        return
+    if all([result[2] == 0 for result in results]):
+        (store, tree, key) = clean
+        store.remember(tree, key)
+
+
+def lints_as_listed(options, extras, pool):
+    """ Returns true if the files may be linted while git is still listing them
+
+    The staging area is stashed or copied, and a revision range
+    copied, before any linter runs, and shards, streamed reports, dry
+    runs, and jobs handed to other machines all need every job known
+    from the start; those list every file first.
+    """
+    return not (len(extras) or pool is not None or 'staging' in options or
+                get_linted_range(options) is not None or
+                any([option in options for option in ['shard', 'stream', 'dryrun', 'serve-jobs']]))
+
+
+def lint_as_listed(options, config, working_config, broken_linter_names, dispatch=None):
+    """ Lints the workspace's files as git lists them, returning what run_linters does.
+
+    The files are taken from git's output a window at a time; each
+    window is classified, hashed and looked up in the cache, and its
+    jobs started, before the next is read, so linting starts with the
+    first files listed and only a window's worth of paths is held
+    beyond the results themselves.
+    """
+    dispatch = dispatch or DispatchIndex(config)
+    working_linters = dict([(linter.name, linter) for linter in working_config])
+    positions = dict([(linter.name, position) for (position, linter) in enumerate(config)])
+    (unlintable_filenames, cant_lint_filenames) = (set(), set())
+
+    linters = Linters(working_config, [], get_job_count(options))
+    linters.cache = make_lint_cache(options, [])
+    linters.history = make_job_history(options)
+    linters.content = ContentReader()
+
+    def windows():
+        listed = stream_filelist(options)
+        while True:
+            with tracer.span('get_filelist'):
+                window = sorted(islice(listed, PIPELINE_WINDOW))
+            if not len(window):
+                return
+            with tracer.span('classify', files=len(window)):
+                classification = dispatch.classify(window)
+            unlintable_filenames.update(classification.unlintable)
+            cant_lint_filenames.update([filename for (linter, filename) in classification.pairs
+                                        if linter.name in broken_linter_names])
+            pairs = [(working_linters[linter.name], filename)
+                     for (linter, filename) in classification.pairs
+                     if linter.name in working_linters]
+            if linters.cache is not None:
+                with tracer.span('hash_files', files=len(pairs)):
+                    linters.cache.hashes.update(
+                        get_blob_hashes(set([filename for (linter, filename) in pairs]), False, True))
+            yield pairs
+
+    with linters.content, tracer.span('lint'):
+        results = sorted(linters.pipeline(windows()),
+                         key=lambda result: (positions[result[1]], result[0]))
+    return (results, unlintable_filenames, sorted(cant_lint_filenames),
+            broken_linter_names, [])
+
+
+def run_linters(options, config, extras=[], dispatch=None, pool=None):
+    if 'pr' in options:
+        options.pop('pr')
+        options['revision'] = PR_REVISION
+
+    """ Runs the requested linters """
+    start_output(options)
+
+    # Filter the linter config down to the selected ones.
+    with tracer.span('select_linters'):
+        working_config, broken_linter_names = select_linters(options, config)
+
+    # A staging area already found clean, by the same linters, has nothing to report.
+    with tracer.span('clean_tree'):
+        clean = get_clean_tree(options, extras, working_config, broken_linter_names)
+    if clean is not None and clean[0].known(clean[1], clean[2]):
+        return (((('stream' in options) and ResultStream([], [])) or []),
+                set(), [], broken_linter_names, [])
+
+    if lints_as_listed(options, extras, pool):
+        return lint_as_listed(options, config, working_config, broken_linter_names, dispatch)
+
+    with tracer.span('get_filelist'):
+        all_filenames, unfindable_filenames = get_filelist(options, extras)
+
+    with tracer.span('classify', files=len(all_filenames)):
+        classification = (dispatch or DispatchIndex(config)).classify(sorted(set(all_filenames)))
+    lintable_filenames = set([filename for (linter, filename) in classification.pairs])
+    unlintable_filenames = set(classification.unlintable)
+
+    cant_lint_filenames = sorted(set([filename for (linter, filename) in classification.pairs
+                                      if linter.name in broken_linter_names]))
 
     runner = WorkspaceRunner
     if 'staging' in options:
-        runner = StagingRunner
-
-    linters = Linters(build_config_subset(working_linter_names),
-                      sorted(lintable_filenames))
+        runner = ('snapshot' in options and SnapshotRunner) or StagingRunner
+    if get_linted_range(options) is not None:
+        runner = partial(RevisionRunner, changes=repository.changes(options['revision']))
+
+    working_linters = dict([(linter.name, linter) for linter in working_config])
+    pairs = [(working_linters[linter.name], filename)
+             for (linter, filename) in classification.pairs
+             if linter.name in working_linters]
+    if 'shard' in options:
+        pairs = select_shard(options, pairs)
+        lintable_filenames = set([filename for (linter, filename) in pairs])
+
+    # Workers are handed the files' content by its hash; files with none can't be handed out.
+    if hasattr(pool, 'find'):
+        (pairs, missing) = pool.find(pairs)
+        lintable_filenames = set([filename for (linter, filename) in pairs])
+        unfindable_filenames = sorted(set(unfindable_filenames) | missing)
+
+    linters = Linters(working_config,
+                      sorted(lintable_filenames),
+                      get_job_count(options),
+                      pool=pool,
+                      pairs=pairs)
 
     if 'dryrun' in options:
         dryrun_results = linters.dryrun()
+        if 'stream' in options:
+            dryrun_results = ResultStream(dryrun_results, linters.expected())
         return (dryrun_results, unlintable_filenames, cant_lint_filenames,
                 broken_linter_names, unfindable_filenames)
 
-    with runner(lintable_filenames):
-        results = linters()
-
+    with tracer.span('hash_files', files=len(lintable_filenames)):
+        linters.cache = make_lint_cache(options, lintable_filenames)
+    linters.history = make_job_history(options)
+
+    # Linters reading stdin, and builtins, are handed staged or committed content
+    # straight from the object store, so only the files of the others need copying.
+    linters.content = make_content_reader(options, lintable_filenames)
+    copied_filenames = lintable_filenames
+    if linters.content.hashes is not None:
+        copied_filenames = set([filename for (linter, filename) in linters.pairs()
+                                if not reads_content(linter.linter)])
+        if not len(copied_filenames):
+            runner = WorkspaceRunner
+
+    def stream_results():
+        results = []
+        with runner(copied_filenames) as root, linters.content:
+            linters.root = root
+            with tracer.span('lint', jobs=len(linters.pairs())):
+                for result in linters.stream():
+                    results.append(result)
+                    yield result
+        remember_if_clean(clean, results, cant_lint_filenames, unfindable_filenames)
+
+    if 'stream' in options:
+        return (ResultStream(stream_results(), linters.expected()), unlintable_filenames,
+                cant_lint_filenames, broken_linter_names, unfindable_filenames)
+
+    with runner(copied_filenames) as root, linters.content:
+        linters.root = root
+        with tracer.span('lint', jobs=len(linters.pairs())):
+            results = linters()
+
+    remember_if_clean(clean, results, cant_lint_filenames, unfindable_filenames)
     return (results, unlintable_filenames, cant_lint_filenames,
             broken_linter_names, unfindable_filenames)
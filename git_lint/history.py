@@ -0,0 +1,115 @@
+# Copyright (C) 2016 Elf M. Sternberg
+# Author: Elf M. Sternberg
+
+import json
+import os
+import tempfile
+
+try:  # noqa: F401
+    from typing import Dict, List, Text, Any, Optional, Union, Callable, Tuple  # noqa: F401
+except:  # noqa: F401
+    pass  # noqa: F401
+
+
+MAX_ENTRIES = 50000
+DEFAULT_MS_PER_KB = 1.0
+DEFAULT_OVERHEAD_MS = 20.0
+
+
+#  _  _ _    _
+# | || (_)__| |_ ___ _ _ _  _
+# | __ | (_-<  _/ _ \ '_| || |
+# |_||_|_/__/\__\___/_|  \_, |
+#                        |__/
+
+class JobHistory(object):
+    """How long each linter took on each file, in earlier runs.
+
+    Kept as one small JSON file: for every linter, a map of repository
+    path to [milliseconds, bytes, run], where run is the number of the
+    run that last saw the path, so that when the store outgrows its
+    limit the entries not seen for longest are dropped.  Durations are
+    smoothed over runs, so one slow run on a busy machine doesn't
+    reorder everything after it.  A read-only history is used but
+    never written back.  Each linter's total time and bytes are kept
+    as entries change, so estimating a new file costs one lookup.
+    """
+
+    def __init__(self, path, max_entries=MAX_ENTRIES, readonly=False):
+        # type: (Optional[str], int, bool) -> None
+        self.path = path
+        self.max_entries = max_entries
+        self.readonly = readonly
+        (self.runs, self.linters) = self.load()
+        self.totals = dict([(linter_name, [sum([entry[0] for entry in entries.values()]),
+                                           sum([entry[1] for entry in entries.values()])])
+                            for (linter_name, entries) in self.linters.items()])
+        self.dirty = False
+
+    def count(self, linter_name, entry, sign):
+        totals = self.totals.setdefault(linter_name, [0.0, 0])
+        totals[0] = totals[0] + sign * entry[0]
+        totals[1] = totals[1] + sign * entry[1]
+
+    def load(self):
+        if self.path is None:
+            return (0, {})
+        try:
+            with open(self.path, 'r') as store:
+                saved = json.load(store)
+            return (int(saved['runs']), dict(saved['linters']))
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return (0, {})
+
+    def rate(self, linter_name):
+        # type: (str) -> float
+        """ Returns the linter's milliseconds per kilobyte, over every file it has been timed on """
+        (total_ms, total_bytes) = self.totals.get(linter_name, (0.0, 0))
+        if not total_bytes:
+            return DEFAULT_MS_PER_KB
+        return total_ms * 1024.0 / total_bytes
+
+    def estimate(self, linter_name, path, size):
+        # type: (str, str, int) -> float
+        """ Returns the milliseconds the linter is expected to take on the file.
+
+        Files linted before are expected to take what they took last
+        time; others are estimated from their size.
+        """
+        entry = self.linters.get(linter_name, {}).get(path, None)
+        if entry is not None:
+            return entry[0]
+        return DEFAULT_OVERHEAD_MS + self.rate(linter_name) * size / 1024.0
+
+    def record(self, linter_name, path, size, milliseconds):
+        # type: (str, str, int, float) -> None
+        entries = self.linters.setdefault(linter_name, {})
+        previous = entries.get(path, None)
+        if previous is not None:
+            milliseconds = (previous[0] + milliseconds) / 2.0
+            self.count(linter_name, previous, -1)
+        entries[path] = [round(milliseconds, 1), size, self.runs + 1]
+        self.count(linter_name, entries[path], 1)
+        self.dirty = True
+
+    def save(self):
+        # type: () -> None
+        """ Writes the store atomically; failures to write are not errors. """
+        if self.path is None or self.readonly or not self.dirty:
+            return
+        self.runs = self.runs + 1
+        entries = [(entry[2], linter_name, path) for (linter_name, paths) in self.linters.items()
+                   for (path, entry) in paths.items()]
+        if len(entries) > self.max_entries:
+            for (run, linter_name, path) in sorted(entries)[:len(entries) - self.max_entries]:
+                self.count(linter_name, self.linters[linter_name].pop(path), -1)
+        try:
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            (handle, temporary) = tempfile.mkstemp(dir=os.path.dirname(self.path))
+            with os.fdopen(handle, 'w') as store:
+                json.dump({'runs': self.runs, 'linters': self.linters}, store, separators=(',', ':'))
+            os.rename(temporary, self.path)
+            self.dirty = False
+        except (IOError, OSError):
+            pass
@@ -24,6 +24,8 @@ OPTIONS = [
            _('Scan the workspace'), ['staging']),
     Option('s', 'staging', False,
            _('Scan the staging area (useful for pre-commit).'), []),
+    Option(None, 'snapshot', False,
+           _('With --staging, lint a copy of the staged files instead of stashing the workspace'), []),
     #    ('g', 'changes', False,
     #     _("Report lint failures only for diff'd sections"), ['complete']),
     #    ('p', 'complete', False,
@@ -32,6 +34,41 @@ OPTIONS = [
            _('Group the reports by linter first as they appear in the config file [default]'), []),
     Option('f', 'byfile', False,
            _('Group the reports by file first'), []),
+    Option('j', 'jobs', True,
+           _('Number of linters to run at once [default: number of CPUs]'), []),
+    Option(None, 'no-cache', False,
+           _('Lint every file, ignoring results saved from earlier runs'), []),
+    Option(None, 'shared-cache', True,
+           _('Share results with other clones through a cache in DIRECTORY, or at an http(s) URL'), []),
+    Option(None, 'max-output', True,
+           _('Keep no more than SIZE characters (or "N lines") of linter output in the whole report'), []),
+    Option(None, 'stream', False,
+           _('Print each group of results as soon as it is complete'), []),
+    Option(None, 'daemon', False,
+           _('Stay running, serving lint requests for this repository'), []),
+    Option(None, 'no-daemon', False,
+           _('Lint in this process, even if a daemon is running'), []),
+    Option(None, 'watch', False,
+           _('Lint files again as they change, until interrupted'),
+           ['staging', 'revision', 'pr', 'dryrun', 'stream', 'daemon']),
+    Option(None, 'trace', True,
+           _('Write a trace of the run to FILE, in Chrome trace-event format'), []),
+    Option(None, 'timings', False,
+           _('After the report, list the linters and files that took the most time'), []),
+    Option(None, 'shard', True,
+           _('Lint only shard INDEX/COUNT of the work, printing the results as JSON'),
+           ['stream', 'watch', 'daemon']),
+    Option(None, 'shard-history', True,
+           _('Divide the shards by the durations in the job history FILE, which every shard must be given'), []),
+    Option(None, 'merge-results', False,
+           _('Combine the JSON results of every shard, named as arguments, into one report'),
+           ['shard', 'stream', 'watch', 'daemon']),
+    Option(None, 'serve-jobs', True,
+           _('Hand the lint jobs to workers that connect to ADDR (HOST:PORT), and report their results'),
+           ['watch', 'daemon', 'shard', 'stream']),
+    Option(None, 'worker', True,
+           _('Run lint jobs for the coordinator at ADDR (HOST:PORT) until it has none left'),
+           ['serve-jobs', 'watch', 'daemon', 'shard', 'stream']),
     Option('d', 'dryrun', False,
            _('Dry run - report what would be done, but do not run linters'), []),
     Option('c', 'config', True,
@@ -1,17 +1,61 @@
 from __future__ import print_function
 from functools import reduce
-from .git_lint import load_config, run_linters, git_base
+from .git_lint import load_config, run_linters, repository
+import json
 import operator
+import sys
 import gettext
 _ = gettext.gettext
 
 
+def base_file_cleaner(files):
+    if repository.base is None:
+        return files
+    return [file.replace(repository.base + '/', '', 1) for file in files]
+
+
+def get_grouping(options):
+    """ Returns the result field to group by, and the heading for each group """
+    if 'byfile' in options:
+        return (0, _('Filename: {}'))
+    return (1, _('Linter: {}'))
+
+
+def print_group(grouping, key, group):
+    messages = reduce(operator.add, [item[3] for item in group], [])
+    if len(messages) == 0:
+        return
+    print(grouping.format(key))
+    for (filename, lintername, returncode, text) in group:
+        if text:
+            print('\n'.join(base_file_cleaner(text)))
+            print('')
+    print ('')
+
+
+def print_trailer(unlintable_filenames, cant_lint_filenames,
+                  broken_linter_names, unfindable_filenames, options):
+    if len(broken_linter_names) and (len(cant_lint_filenames) or ('verbose' in options)):
+        print(_('Linters not found:'), ','.join(broken_linter_names))
+        if len(cant_lint_filenames):
+            print('  ' + _('Files not linted:'))
+            print('\n'.join(['    {}'.format(f) for f in cant_lint_filenames]))
+        print('')
+
+    if len(unlintable_filenames) and ('verbose' in options):
+        print(_('No recognizeable linters for:'))
+        print('\n'.join(['    {}'.format(f) for f in unlintable_filenames]))
+        print('')
+
+    if len(unfindable_filenames):
+        print(_('Files not found:'))
+        print('\n'.join(['    {}'.format(f) for f in unfindable_filenames]))
+        print('')
+
+
 def print_report(results, unlintable_filenames, cant_lint_filenames,
                  broken_linter_names, unfindable_filenames, options={'bylinter': True}):
 
-    def base_file_cleaner(files):
-        return [file.replace(git_base + '/', '', 1) for file in files]
-
     # ICK.  Mutation, references, and hidden assignment.
     def group_by(iterable, field_id):
         results = []
@@ -25,42 +69,53 @@ def print_report(results, unlintable_filenames, cant_lint_filenames,
             results.append((key, keys[key]))
         return results
 
-    sort_position = 1
-    grouping = _('Linter: {}')
-    if 'byfile' in options:
-        sort_position = 0
-        grouping = _('Filename: {}')
+    (sort_position, grouping) = get_grouping(options)
     grouped_results = group_by(results, sort_position)
 
     for group in grouped_results:
-        messages = reduce(operator.add, [item[3] for item in group[1]], [])
-        if len(messages) == 0:
+        print_group(grouping, group[0], group[1])
+
+    print_trailer(unlintable_filenames, cant_lint_filenames,
+                  broken_linter_names, unfindable_filenames, options)
+
+
+def stream_report(results, unlintable_filenames, cant_lint_filenames,
+                  broken_linter_names, unfindable_filenames, options={'bylinter': True}):
+    """Prints each group of results as soon as the last result in it arrives.
+
+    Takes a ResultStream.  Groups are printed in the order they are
+    completed, and the results within a group in report order.
+    Finishes with a summary, and returns every result received.
+    """
+
+    (sort_position, grouping) = get_grouping(options)
+    order = dict([(key, position) for (position, key) in enumerate(results.expected)])
+    remaining = {}
+    for key in results.expected:
+        remaining[key[sort_position]] = remaining.get(key[sort_position], 0) + 1
+
+    received = []
+    pending = {}
+    for result in results:
+        received.append(result)
+        key = result[sort_position]
+        pending.setdefault(key, []).append(result)
+        remaining[key] = remaining.get(key, 1) - 1
+        if remaining[key] > 0:
             continue
-        print(grouping.format(group[0]))
-        for (filename, lintername, returncode, text) in group[1]:
-            if text:
-                print('\n'.join(base_file_cleaner(text)))
-                print('')
-        print ('')
+        print_group(grouping, key, sorted(pending.pop(key),
+                                          key=lambda item: order.get((item[0], item[1]), 0)))
+        sys.stdout.flush()
 
-    if len(broken_linter_names) and (len(cant_lint_filenames) or ('verbose' in options)):
-        print(_('Linters not found:'), ','.join(broken_linter_names))
-        if len(cant_lint_filenames):
-            print('  ' + _('Files not linted:'))
-            print('\n'.join(['    {}'.format(f) for f in cant_lint_filenames]))
-        print('')
+    print_trailer(unlintable_filenames, cant_lint_filenames,
+                  broken_linter_names, unfindable_filenames, options)
 
-    if len(unlintable_filenames) and ('verbose' in options):
-        print(_('No recognizeable linters for:'))
-        print('\n'.join(['    {}'.format(f) for f in unlintable_filenames]))
-        print('')
+    failures = [result for result in received if result[2] != 0]
+    print(_('Ran {} checks on {} files: {} failed.').format(
+        len(received), len(set([result[0] for result in received])), len(failures)))
+    return received
 
-    if len(unfindable_filenames):
-        print(_('Files not found:'))
-        print('\n'.join(['    {}'.format(f) for f in unfindable_filenames]))
-        print('')
 
-        
 def print_help(options, name):
     print(_('Usage: {} [options] [filenames]').format(name))
     for item in options:
@@ -80,3 +135,25 @@ def print_linters(config, broken_linter_names):
                                    linter.linter.get('comment', '')))))
 
 
+def print_timings(jobs, limit=10):
+    """ Prints the linters and files that took the most time """
+    from .trace import summarize
+    print(_('Slowest linters:'))
+    print('  {:<40} {:>6} {:>10} {:>10}'.format(_('Linter'), _('Runs'), _('Wall (s)'), _('CPU (s)')))
+    for (name, count, wall, cpu) in summarize(jobs, 'linter')[:limit]:
+        print('  {:<40} {:>6} {:>10.3f} {:>10.3f}'.format(name, count, wall, cpu))
+    print('')
+    print(_('Slowest files:'))
+    print('  {:<40} {:>6} {:>10} {:>10}'.format(_('File'), _('Runs'), _('Wall (s)'), _('CPU (s)')))
+    for (filename, count, wall, cpu) in summarize(jobs, 'files')[:limit]:
+        print('  {:<40} {:>6} {:>10.3f} {:>10.3f}'.format(base_file_cleaner([filename])[0], count, wall, cpu))
+    print('')
+
+
+def print_shard_results(shard, digest, linter_names, results, unlintable_filenames,
+                        cant_lint_filenames, broken_linter_names, unfindable_filenames):
+    """ Prints one shard's results as JSON, for --merge-results """
+    from .shard import make_document
+    print(json.dumps(make_document(shard, digest, linter_names, results, unlintable_filenames,
+                                   cant_lint_filenames, broken_linter_names, unfindable_filenames),
+                     indent=1, sort_keys=True))
@@ -0,0 +1,124 @@
+# Copyright (C) 2016 Elf M. Sternberg
+# Author: Elf M. Sternberg
+
+import heapq
+import json
+import sys
+
+from .cache import make_key
+
+try:  # noqa: F401
+    from typing import Dict, List, Text, Any, Optional, Union, Callable, Tuple  # noqa: F401
+except:  # noqa: F401
+    pass  # noqa: F401
+
+import gettext
+_ = gettext.gettext
+
+
+#  ___ _                _ _
+# / __| |_  __ _ _ _ __| (_)_ _  __ _
+# \__ \ ' \/ _` | '_/ _` | | ' \/ _` |
+# |___/_||_\__,_|_| \__,_|_|_||_\__, |
+#                               |___/
+
+def parse_shard(value):
+    # type: (str) -> Tuple[int, int]
+    """ Parses 'i/n', returning (i, n); shards are numbered from 1 """
+    try:
+        (index, count) = [int(part) for part in value.split('/')]
+    except ValueError:
+        sys.exit(_('The --shard option requires INDEX/COUNT, as in 1/4: {}').format(value))
+    if not (count > 0 and 1 <= index <= count):
+        sys.exit(_('The --shard index must be between 1 and the count: {}').format(value))
+    return (index, count)
+
+
+def partition(keys, count, cost):
+    # type: (List[Tuple[str, str]], int, Callable[[Tuple[str, str]], float]) -> List[List[Tuple[str, str]]]
+    """Splits the (linter name, path) keys into count shards of about equal cost.
+
+    The most expensive keys are placed first, each on the shard with
+    the least cost so far (the lowest numbered, on a tie).  Ties in
+    cost are broken by the keys themselves, so that any machine with
+    the same keys and the same costs makes the same partition.
+    """
+    costs = dict([(key, cost(key)) for key in keys])
+    shards = [[] for i in range(count)]
+    loads = [(0.0, i) for i in range(count)]
+    for key in sorted(costs.keys(), key=lambda key: (-costs[key], key)):
+        (load, i) = heapq.heappop(loads)
+        shards[i].append(key)
+        heapq.heappush(loads, (load + costs[key], i))
+    return shards
+
+
+def partition_digest(shards):
+    # type: (List[List[Tuple[str, str]]]) -> str
+    """ Identifies a partition, so shards made from different partitions can be told apart """
+    return make_key([sorted(shard) for shard in shards])
+
+
+#  __  __                _
+# |  \/  |___ _ _ __ _ (_)_ _  __ _
+# | |\/| / -_) '_/ _` || | ' \/ _` |
+# |_|  |_\___|_| \__, ||_|_||_\__, |
+#                |___/        |___/
+
+def make_document(shard, digest, linter_names, results, unlintable_filenames,
+                  cant_lint_filenames, broken_linter_names, unfindable_filenames):
+    """ Returns the machine-readable record of one shard's run """
+    return {
+        'shard': list(shard),
+        'partition': digest,
+        'linters': list(linter_names),
+        'results': [list(result) for result in results],
+        'unlintable': sorted(unlintable_filenames),
+        'cant_lint': sorted(cant_lint_filenames),
+        'broken': sorted(broken_linter_names),
+        'unfindable': sorted(unfindable_filenames)
+    }
+
+
+def load_documents(paths):
+    def load(path):
+        try:
+            with open(path, 'r') as document:
+                return json.load(document)
+        except (IOError, OSError, ValueError) as error:
+            sys.exit(_('Could not read the shard results in {}: {}').format(path, error))
+    return [load(path) for path in paths]
+
+
+def merge_documents(documents):
+    """Combines the records of every shard of a run into one.
+
+    Returns what run_linters would have for the whole run: the results
+    in report order, then the unlintable files, the files that could
+    not be linted, the missing linters, and the files not found.
+    Exits if the shards don't make up one whole run.
+    """
+    if not len(documents):
+        sys.exit(_('No shard results were given to merge.'))
+    count = documents[0]['shard'][1]
+    digest = documents[0]['partition']
+    if any([document['shard'][1] != count or document['partition'] != digest
+            for document in documents]):
+        sys.exit(_('The shard results come from different partitions of the work, and cannot be merged.'))
+    present = sorted([document['shard'][0] for document in documents])
+    if present != list(range(1, count + 1)):
+        missing = sorted(set(range(1, count + 1)) - set(present))
+        sys.exit(_('Shard results are missing or repeated; expected shards 1 to {}, missing {}.').format(
+            count, ', '.join([str(i) for i in missing]) or _('none')))
+
+    linter_names = []
+    for document in documents:
+        linter_names = linter_names + [name for name in document['linters'] if name not in linter_names]
+    position = dict([(name, i) for (i, name) in enumerate(linter_names)])
+    results = sorted([tuple(result) for document in documents for result in document['results']],
+                     key=lambda result: (position.get(result[1], len(position)), result[0]))
+
+    def union(field):
+        return sorted(set([item for document in documents for item in document[field]]))
+
+    return (results, union('unlintable'), union('cant_lint'), union('broken'), union('unfindable'))
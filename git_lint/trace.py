@@ -0,0 +1,179 @@
+# Copyright (C) 2016 Elf M. Sternberg
+# Author: Elf M. Sternberg
+
+import json
+import os
+import threading
+import time
+
+try:  # noqa: F401
+    from typing import Dict, List, Text, Any, Optional, Union, Callable, Tuple  # noqa: F401
+except:  # noqa: F401
+    pass  # noqa: F401
+
+
+#  _____
+# |_   _| _ __ _ __ ___
+#   | || '_/ _` / _/ -_)
+#   |_||_| \__,_\__\___|
+#
+
+class Span(object):
+    """One timed stretch of work.
+
+    Spans are used as context managers; the arguments given when the
+    span is opened, and any added while it is open, are recorded with
+    it when it closes.
+    """
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def update(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        self.tracer.push(self)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.tracer.pop(self, time.time())
+
+
+class NullSpan(object):
+    """ The span handed out when nothing is being traced """
+
+    def update(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer(object):
+    """Records spans for phases of a run and for each linter job.
+
+    Until enabled, the tracer records nothing and costs close to
+    nothing.  Spans are kept per thread, so jobs run in parallel are
+    shown on their own tracks, and the innermost open span of a thread
+    can be annotated by code that doesn't know about it, such as the
+    resource usage of a linter's process.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.epoch = time.time()
+
+    def enable(self):
+        self.enabled = True
+        self.epoch = time.time()
+
+    def span(self, name, category='phase', **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, category, args)
+
+    def stack(self):
+        if not hasattr(self.local, 'spans'):
+            self.local.spans = []
+        return self.local.spans
+
+    def push(self, span):
+        self.stack().append(span)
+
+    def pop(self, span, end):
+        stack = self.stack()
+        if span in stack:
+            stack.remove(span)
+        with self.lock:
+            self.events.append({
+                'name': span.name,
+                'cat': span.category,
+                'ph': 'X',
+                'ts': int((span.start - self.epoch) * 1000000),
+                'dur': int((end - span.start) * 1000000),
+                'pid': os.getpid(),
+                'tid': threading.current_thread().ident,
+                'args': span.args
+            })
+
+    def annotate(self, **args):
+        """ Adds arguments to the innermost span open in this thread, if any """
+        stack = self.stack()
+        if stack:
+            stack[-1].update(**args)
+
+    def jobs(self):
+        return [event for event in self.events if event['cat'] == 'job']
+
+    def write(self, path):
+        """ Writes the spans as Chrome trace-event JSON, for Perfetto or chrome://tracing """
+        threads = sorted(set([event['tid'] for event in self.events]))
+        names = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+                  'args': {'name': ((tid == threads[0]) and 'git-lint') or 'worker {}'.format(n)}}
+                 for (n, tid) in enumerate(threads)]
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': names + sorted(self.events, key=lambda event: event['ts']),
+                       'displayTimeUnit': 'ms'}, trace_file)
+
+
+tracer = Tracer()
+
+
+def summarize(jobs, field):
+    """Totals the wall and child CPU time of the jobs by linter or by file, slowest first.
+
+    A job that linted several files at once is shared out evenly among them.
+    """
+    totals = {}
+    for job in jobs:
+        keys = job['args'].get(field, [])
+        keys = (isinstance(keys, list) and keys) or [keys]
+        for key in keys:
+            (count, wall, cpu) = totals.get(key, (0, 0, 0.0))
+            totals[key] = (count + 1, wall + float(job['dur']) / len(keys),
+                           cpu + job['args'].get('cpu_seconds', 0.0) / len(keys))
+    return sorted([(key, count, wall / 1000000.0, cpu) for (key, (count, wall, cpu)) in totals.items()],
+                  key=lambda total: (-total[2], total[0]))
+
+
+def read_output(process, read=None):
+    """ Reads a child's stdout and stderr to their ends, at once, returning (out, err)
+
+    Each stream is read with read, if given, and otherwise all at once.
+    """
+    read = read or (lambda stream: stream.read())
+    errors = []
+    reader = threading.Thread(target=lambda: errors.append(read(process.stderr)))
+    reader.start()
+    out = read(process.stdout)
+    reader.join()
+    process.stdout.close()
+    process.stderr.close()
+    return (out, errors[0])
+
+
+def communicate_with_usage(process, read=None):
+    """Reads a child's output and reaps it, returning (out, err, rusage).
+
+    Popen.wait() throws away the resource usage of the child, so the
+    child is reaped here with os.wait4, and its return code recorded
+    on the Popen as wait() would have.
+    """
+    (out, err) = read_output(process, read)
+    (pid, status, usage) = os.wait4(process.pid, 0)
+    process.returncode = (os.WIFSIGNALED(status) and -os.WTERMSIG(status)) or os.WEXITSTATUS(status)
+    return (out, err, usage)
@@ -0,0 +1,238 @@
+# Copyright (C) 2016 Elf M. Sternberg
+# Author: Elf M. Sternberg
+
+from __future__ import print_function
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from .git_lint import (repository, get_filelist, select_linters, make_lint_cache,
+                       make_job_history, get_git_response, run_git_command, get_job_count,
+                       DispatchIndex, Linters)
+from .reporters import print_report
+
+try:  # noqa: F401
+    from typing import Dict, List, Text, Any, Optional, Union, Callable, Tuple  # noqa: F401
+except:  # noqa: F401
+    pass  # noqa: F401
+
+import gettext
+_ = gettext.gettext
+
+
+DEBOUNCE_SECONDS = 0.2
+POLL_SECONDS = 1.0
+
+
+#  _  _     _   _  __ _         _   _
+# | \| |___| |_(_)/ _(_)__ __ _| |_(_)___ _ _  ___
+# | .` / _ \  _| |  _| / _/ _` |  _| / _ \ ' \(_-<
+# |_|\_\___/\__|_|_| |_\__\__,_|\__|_\___/_||_/__/
+#
+
+class PollingWatcher(object):
+    """ Reports that something may have changed, once per interval """
+
+    def __init__(self, interval=POLL_SECONDS):
+        self.interval = interval
+
+    def add(self, directory):
+        pass
+
+    def wait(self, timeout=None):
+        """ Waits for changes; returns the new directories found, if any """
+        time.sleep((timeout is None and self.interval) or min(timeout, self.interval))
+        return (timeout is None and True) or False
+
+
+class InotifyWatcher(object):
+    """Reports changes to a set of directories, using Linux's inotify.
+
+    Only the events that can change what there is to lint are asked
+    for: files written and closed, created, deleted, or moved.
+    """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_ISDIR = 0x40000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self.directories = {}
+
+    def add(self, directory):
+        watch = self.libc.inotify_add_watch(self.fd, directory.encode(sys.getfilesystemencoding()),
+                                            self.MASK)
+        if watch < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOENT:
+                return
+            raise OSError(error, os.strerror(error))
+        self.directories[watch] = directory
+
+    def wait(self, timeout=None):
+        """ Waits for changes; returns the new directories found, if any """
+        (readable, writable, exceptional) = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        data = os.read(self.fd, 65536)
+        created = []
+        offset = 0
+        while offset < len(data):
+            (watch, mask, cookie, length) = self.EVENT.unpack_from(data, offset)
+            name = data[offset + self.EVENT.size:offset + self.EVENT.size + length].rstrip(b'\0')
+            offset = offset + self.EVENT.size + length
+            if (mask & self.IN_ISDIR) and (mask & (self.IN_CREATE | self.IN_MOVED_TO)) and watch in self.directories:
+                created.append(os.path.join(self.directories[watch],
+                                            name.decode(sys.getfilesystemencoding())))
+        return created or True
+
+
+def make_watcher():
+    """ Returns an inotify watcher where the platform has one, or a polling one """
+    try:
+        return InotifyWatcher()
+    except (OSError, AttributeError):
+        return PollingWatcher()
+
+
+#  ___            _
+# / __| ___ _____(_)___ _ _
+# \__ \/ -_|_-<_-< / _ \ ' \
+# |___/\___/__/__/_\___/_||_|
+#
+
+class WatchSession(object):
+    """Keeps the results of the files being watched up to date.
+
+    Each time the workspace changes, the list of files is taken again,
+    just as 'git lint' would with the same options, so new untracked
+    files that a linter handles join the session.  Only the files that
+    are new, or whose size or modification time has changed, are
+    linted again; everything else keeps its last result.
+    """
+
+    def __init__(self, options, config, extras):
+        self.options = options
+        self.extras = extras
+        self.dispatch = DispatchIndex(config)
+        (self.working_config, self.broken_linter_names) = select_linters(options, config)
+        self.working_linters = dict([(linter.name, linter) for linter in self.working_config])
+        self.jobs = get_job_count(options)
+        self.stamps = {}
+        self.results = {}
+        self.order = []
+        self.report = (set(), [], set(), set())
+
+    @staticmethod
+    def stamp(filename):
+        try:
+            stats = os.stat(filename)
+        except OSError:
+            return None
+        return (stats.st_size, stats.st_mtime)
+
+    def update(self):
+        """ Lints whatever has changed; returns True if the report has changed """
+        repository.refresh()
+        (all_filenames, unfindable_filenames) = get_filelist(self.options, self.extras)
+        classification = self.dispatch.classify(sorted(set(all_filenames)))
+        lintable_filenames = set([filename for (linter, filename) in classification.pairs])
+        stamps = dict([(filename, WatchSession.stamp(filename)) for filename in lintable_filenames])
+        changed = set([filename for filename in lintable_filenames
+                       if stamps[filename] != self.stamps.get(filename, None)])
+        removed = set(self.stamps.keys()) - lintable_filenames
+        self.stamps = stamps
+
+        pairs = [(self.working_linters[linter.name], filename)
+                 for (linter, filename) in classification.pairs
+                 if linter.name in self.working_linters]
+        fresh = [(linter, filename) for (linter, filename) in pairs if filename in changed]
+        if len(fresh):
+            linters = Linters(self.working_config, sorted(changed), self.jobs, pairs=fresh)
+            linters.cache = make_lint_cache(self.options, changed)
+            linters.history = make_job_history(self.options)
+            for result in linters():
+                self.results[(result[0], result[1])] = result
+
+        expected = [Linters.result_key(linter, filename) for (linter, filename) in pairs]
+        self.results = dict([(key, self.results[key]) for key in expected if key in self.results])
+        self.order = expected
+        cant_lint_filenames = sorted(set([filename for (linter, filename) in classification.pairs
+                                          if linter.name in self.broken_linter_names]))
+        self.report = (set(classification.unlintable), cant_lint_filenames,
+                       self.broken_linter_names, unfindable_filenames)
+        return len(changed) > 0 or len(removed) > 0
+
+    def directories(self):
+        """ Returns every directory holding a file git tracks or would track """
+        listing = get_git_response(['-C', repository.base, 'ls-files', '-z', '--cached',
+                                    '--others', '--exclude-standard'])
+        directories = set([repository.base])
+        for path in listing.split(u'\x00'):
+            path = os.path.dirname(path)
+            while len(path):
+                directories.add(os.path.join(repository.base, path))
+                path = os.path.dirname(path)
+        return sorted(directories)
+
+    def print_report(self):
+        if sys.stdout.isatty():
+            sys.stdout.write('\x1b[2J\x1b[H')
+        results = [self.results[key] for key in self.order if key in self.results]
+        (unlintable_filenames, cant_lint_filenames,
+         broken_linter_names, unfindable_filenames) = self.report
+        print_report(results, unlintable_filenames, cant_lint_filenames,
+                     broken_linter_names, unfindable_filenames, self.options)
+        print(_('Watching {} files; last checked {}.  Press Ctrl-C to stop.').format(
+            len(self.stamps), time.strftime('%H:%M:%S')))
+        sys.stdout.flush()
+
+
+def is_ignored(path):
+    return run_git_command(['check-ignore', '-q', path]) == 0
+
+
+def watch(options, config, extras):
+    """ Lints, then re-lints as files change, until interrupted """
+    session = WatchSession(options, config, extras)
+    watcher = make_watcher()
+    try:
+        for directory in session.directories():
+            watcher.add(directory)
+    except OSError:
+        watcher = PollingWatcher()
+
+    session.update()
+    session.print_report()
+    try:
+        while True:
+            created = watcher.wait()
+            if not created:
+                continue
+            # Let a burst of changes, like a save or a checkout, settle first.
+            while True:
+                for directory in ((created is not True and created) or []):
+                    if os.path.basename(directory) != '.git' and not is_ignored(directory):
+                        watcher.add(directory)
+                created = watcher.wait(DEBOUNCE_SECONDS)
+                if not created:
+                    break
+            if session.update():
+                session.print_report()
+    except KeyboardInterrupt:
+        pass
+    return 0
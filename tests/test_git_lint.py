@@ -134,3 +134,1214 @@ def test_04_linters_present():
         assert ret.index('pep8') > 0
 
         
+stub_lint_src = """
+[stub]
+comment = A stand-in linter that fails every file it is handed
+command = %(repodir)s/stub-lint
+match = .py
+print = False
+condition = error
+"""
+
+stub_lint_script = """#!/bin/sh
+echo "bad: $(basename "$1")"
+exit 1
+"""
+
+
+def make_stub_repository(config=stub_lint_src, script=stub_lint_script):
+    with open(".git-lint", "w") as f:
+        f.write(config)
+    with open("stub-lint", "w") as f:
+        f.write(script)
+    os.chmod("stub-lint", 0o755)
+    shell('git init && git add . && git commit -m "Test"')
+
+
+def test_05_parallel_results_keep_their_order():
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository()
+        for name in ['d.py', 'b.py', 'c.py', 'a.py']:
+            with open(name, "w") as f:
+                f.write("x = 1\n")
+        (serial, stderr, rc) = fullshell('git lint -j 1')
+        (parallel, stderr, prc) = fullshell('git lint -j 4')
+        assert serial == parallel
+        assert rc == prc == 1
+        assert [line.strip() for line in parallel.splitlines() if 'bad' in line] == [
+            'bad: a.py', 'bad: b.py', 'bad: c.py', 'bad: d.py']
+
+
+batch_lint_src = """
+[stub]
+command = %(repodir)s/stub-lint
+match = .py
+batch = 10
+print = False
+condition = error
+"""
+
+batch_lint_script = """#!/bin/sh
+echo "$*" >> invocations
+status=0
+for f in "$@"; do
+    if grep -q bad "$f"; then echo "$f:1: bad"; status=1; fi
+done
+exit $status
+"""
+
+
+def test_06_batch_mode_splits_output_by_file():
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository(batch_lint_src, batch_lint_script)
+        for name in ['a.py', 'b.py', 'c.py']:
+            with open(name, "w") as f:
+                f.write((name == 'b.py' and "bad\n") or "good\n")
+        (stdout, stderr, rc) = fullshell('git lint -f')
+        with open("invocations") as f:
+            assert len(f.readlines()) == 1
+        assert rc == 1
+        assert 'Filename: b.py' in stdout
+        assert 'a.py' not in stdout and 'c.py' not in stdout
+
+
+counting_lint_script = """#!/bin/sh
+echo "$1" >> invocations
+echo "bad: $(basename "$1")"
+exit 1
+"""
+
+
+def test_07_results_are_cached_by_content():
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository(script=counting_lint_script)
+        for name in ['a.py', 'b.py']:
+            with open(name, "w") as f:
+                f.write("x = 1\n")
+
+        def invocations():
+            with open("invocations") as f:
+                lines = f.read().splitlines()
+            os.unlink("invocations")
+            return [os.path.basename(line) for line in lines]
+
+        (first, stderr, rc) = fullshell('git lint')
+        assert sorted(invocations()) == ['a.py', 'b.py']
+        (second, stderr, second_rc) = fullshell('git lint')
+        assert not os.path.exists("invocations")
+        assert first == second and rc == second_rc == 1
+
+        with open("b.py", "w") as f:
+            f.write("x = 2\n")
+        fullshell('git lint')
+        assert invocations() == ['b.py']
+
+        fullshell('git lint --no-cache')
+        assert sorted(invocations()) == ['a.py', 'b.py']
+
+
+def test_08_snapshot_lints_the_staged_content():
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository(batch_lint_src, batch_lint_script)
+        with open("a.py", "w") as f:
+            f.write("bad\n")
+        shell('git add a.py')
+        with open("a.py", "w") as f:
+            f.write("good\n")
+        before = os.stat("a.py").st_mtime
+        (stdout, stderr, rc) = fullshell('git lint -s --snapshot')
+        assert rc == 1
+        assert 'Linter: stub' in stdout
+        assert path not in stdout
+        with open("a.py") as f:
+            assert f.read() == "good\n"
+        assert os.stat("a.py").st_mtime == before
+        assert outshell('git stash list') == ''
+
+
+def test_09_help_starts_no_processes(monkeypatch, capsys):
+    def no_processes(*args, **kwargs):
+        raise AssertionError('A process was started: {}'.format(args))
+
+    from git_lint.__main__ import main
+    monkeypatch.setattr(subprocess, 'Popen', no_processes)
+    monkeypatch.setattr(subprocess, 'call', no_processes)
+    monkeypatch.setattr('sys.argv', ['git-lint', '--help'])
+    assert main() == 0
+    (out, err) = capsys.readouterr()
+    assert out.startswith('Usage:')
+
+
+def test_10_status_parser_handles_renames_and_long_lists():
+    entries = ['R  new.py', 'old.py', ' M changed.py', 'C  copy.py', 'orig.py', '?? new file.py']
+    assert list(git_lint.parse_porcelain_status(entries)) == [
+        ('R', ' ', 'new.py'), (' ', 'M', 'changed.py'),
+        ('C', ' ', 'copy.py'), ('?', '?', 'new file.py')]
+    many = ['?? file{}.py'.format(i) for i in range(5000)]
+    assert len(list(git_lint.parse_porcelain_status(many))) == 5000
+
+
+def test_11_submodules_are_not_linted():
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository()
+        head = outshell('git rev-parse HEAD').strip()
+        shell('git update-index --add --cacheinfo 160000,{},"sub module.py"'.format(head))
+        (stdout, stderr, rc) = fullshell('git lint -s --snapshot')
+        assert rc == 0 and 'sub module' not in stdout
+        shell('git commit -m "Add a submodule"')
+        (stdout, stderr, rc) = fullshell('git lint -a')
+        assert rc == 0 and 'sub module' not in stdout
+        (stdout, stderr, rc) = fullshell('git lint -r HEAD^')
+        assert rc == 0 and 'sub module' not in stdout
+
+
+def test_12_dispatch_index_classifies_by_extension():
+    from collections import namedtuple
+    Linter = namedtuple('Linter', ['name', 'linter'])
+    config = [Linter('js', {'match': '.js, jsx'}),
+              Linter('minified', {'match': 'min.js'}),
+              Linter('cpp', {'match': 'c(c|pp)'})]
+    index = git_lint.DispatchIndex(config)
+    classified = index.classify(['a.min.js', 'b.json', 'c.jsx', 'd.cpp', 'e.c', 'lib.js/f.py'])
+    assert [(linter.name, filename) for (linter, filename) in classified.pairs] == [
+        ('js', 'a.min.js'), ('js', 'c.jsx'), ('minified', 'a.min.js'), ('cpp', 'd.cpp')]
+    assert classified.unlintable == ['b.json', 'e.c', 'lib.js/f.py']
+
+
+slow_lint_src = """
+[fast]
+command = %(repodir)s/stub-lint
+match = .py
+condition = error
+
+[slow]
+command = sleep 2; true
+match = .py
+condition = error
+shell = true
+"""
+
+
+def test_13_stream_prints_results_as_they_finish():
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository(slow_lint_src)
+        with open("a.py", "w") as f:
+            f.write("x = 1\n")
+        process = subprocess.Popen('git lint --stream -j 2', shell=True, env=environment,
+                                   stdout=subprocess.PIPE, universal_newlines=True)
+        first = process.stdout.readline()
+        assert first.startswith('Linter: fast')
+        assert process.poll() is None
+        (rest, err) = process.communicate()
+        assert 'Ran 2 checks on 1 files: 1 failed.' in rest
+        assert process.returncode == 1
+
+
+def test_14_linter_locations_are_remembered():
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository(git_lint_src.replace('pep8 -r --ignore=E501,W293,W391', 'stub-lint'))
+        os.mkdir("bin")
+        os.rename("stub-lint", "bin/stub-lint")
+        env = dict(environment, PATH=os.path.join(path, 'bin') + ':' + environment['PATH'])
+        with open("a.py", "w") as f:
+            f.write("x = 1\n")
+        (stdout, stderr, rc) = fullshell('git lint', env)
+        assert rc == 1 and 'bad: a.py' in stdout
+        import json
+        with open(".git/git-lint/linters.json") as f:
+            state = json.load(f)
+        assert state['commands']['stub-lint'] == os.path.join(path, 'bin', 'stub-lint')
+
+        os.unlink("bin/stub-lint")
+        (stdout, stderr, rc) = fullshell('git lint', env)
+        assert rc == 0 and 'bad: a.py' not in stdout
+
+
+daemon_lint_script = """#!/bin/sh
+if [ -n "$LINTED_BY_DAEMON" ]; then
+    echo "bad: $(basename "$1")"
+    exit 1
+fi
+"""
+
+
+def start_daemon(env):
+    import time
+    daemon = subprocess.Popen('exec git lint --daemon -j 2', shell=True, env=env)
+    for i in range(100):
+        if os.path.exists('.git/git-lint/daemon.sock'):
+            break
+        time.sleep(0.05)
+    return daemon
+
+
+def test_15_daemon_lints_for_clients():
+    import time
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository(git_lint_src.replace('pep8 -r --ignore=E501,W293,W391', 'stub-lint'),
+                             daemon_lint_script)
+        os.mkdir("bin")
+        os.rename("stub-lint", "bin/stub-lint")
+        with open("a.py", "w") as f:
+            f.write("x = 1\n")
+
+        # Only the daemon's own environment fails a.py; the client's PATH finds the linter.
+        env = dict(environment, PATH=os.path.join(path, 'bin') + ':' + environment['PATH'])
+        daemon = start_daemon(dict(env, LINTED_BY_DAEMON='1'))
+        try:
+            (stdout, stderr, rc) = fullshell('git lint', env)
+            assert rc == 1 and 'bad: a.py' in stdout
+            (stdout, stderr, rc) = fullshell('git lint --stream', env)
+            assert rc == 1 and 'Ran 1 checks on 1 files: 1 failed.' in stdout
+            (stdout, stderr, rc) = fullshell('git lint --no-daemon --no-cache', env)
+            assert rc == 0
+            # Without the linter on the client's PATH, the daemon can't find it either.
+            (stdout, stderr, rc) = fullshell('git lint --no-cache')
+            assert rc == 0 and 'bad: a.py' not in stdout
+
+            time.sleep(0.01)
+            with open(".git-lint", "a") as f:
+                f.write("\n[other]\ncommand = stub-lint\nmatch = .txt\n")
+            with open("b.txt", "w") as f:
+                f.write("text\n")
+            (stdout, stderr, rc) = fullshell('git lint', env)
+            assert 'bad: b.txt' in stdout
+        finally:
+            daemon.terminate()
+            daemon.wait()
+        assert not os.path.exists('.git/git-lint/daemon.sock')
+
+
+def test_16_watch_relints_only_what_changes():
+    import time
+    import signal
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository(script=counting_lint_script)
+        os.mkdir("src")
+        for name in ['a.py', 'src/b.py']:
+            with open(name, "w") as f:
+                f.write("x = 1\n")
+
+        def wait_for(name, lines):
+            for i in range(100):
+                if os.path.exists(name):
+                    with open(name) as f:
+                        if len(f.read().splitlines()) >= lines:
+                            return
+                time.sleep(0.05)
+
+        output = open(os.path.join(path, '.git', 'watch-output'), 'w')
+        watcher = subprocess.Popen('exec git lint --watch --no-cache', shell=True, env=environment,
+                                   stdout=output)
+        try:
+            wait_for('invocations', 2)
+            time.sleep(0.5)
+            with open("src/b.py", "w") as f:
+                f.write("x = 2\n")
+            wait_for('invocations', 3)
+            with open("src/c.py", "w") as f:
+                f.write("x = 3\n")
+            wait_for('invocations', 4)
+            time.sleep(0.5)
+        finally:
+            watcher.send_signal(signal.SIGINT)
+            watcher.wait()
+            output.close()
+        with open("invocations") as f:
+            linted = [os.path.relpath(line, path) for line in f.read().splitlines()]
+        assert sorted(linted[:2]) == ['a.py', os.path.join('src', 'b.py')]
+        assert linted[2:] == [os.path.join('src', 'b.py'), os.path.join('src', 'c.py')]
+
+
+def test_17_trace_records_phases_and_jobs():
+    import json
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository()
+        for name in ['a.py', 'b.py']:
+            with open(name, "w") as f:
+                f.write("x = 1\n")
+        (stdout, stderr, rc) = fullshell('git lint --no-cache --timings --trace trace.json')
+        assert rc == 1
+        assert 'Slowest linters:' in stdout and 'Slowest files:' in stdout
+        with open("trace.json") as f:
+            events = json.load(f)['traceEvents']
+        spans = [event for event in events if event['ph'] == 'X']
+        names = set([event['name'] for event in spans if event['cat'] == 'phase'])
+        assert set(['load_config', 'get_filelist', 'classify', 'lint', 'report']) <= names
+        jobs = [event for event in spans if event['cat'] == 'job']
+        assert sorted([os.path.basename(job['args']['files'][0]) for job in jobs]) == ['a.py', 'b.py']
+        for job in jobs:
+            assert job['args']['linter'] == 'stub'
+            assert job['args']['returncode'] == 1
+            assert job['args']['output_bytes'] == len('bad: a.py\n')
+            assert job['args']['cpu_seconds'] >= 0
+
+
+shell_lint_src = stub_lint_src + """
+[piped]
+command = test -n "$HOME" && %(repodir)s/stub-lint
+match = .py
+print = False
+condition = error
+shell = true
+"""
+
+
+def test_18_linters_get_filenames_as_arguments():
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository(shell_lint_src)
+        for name in ['say "$HOME".py', "it's.py"]:
+            with open(name, "w") as f:
+                f.write("x = 1\n")
+        (stdout, stderr, rc) = fullshell('git lint --no-cache')
+        assert rc == 1
+        assert 'Linter: piped' in stdout
+        assert stdout.count('bad: say "$HOME".py') == 2 and stdout.count("bad: it's.py") == 2
+
+
+def test_19_longest_jobs_are_run_first():
+    import json
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository(script=counting_lint_script)
+        for (name, size) in [('a.py', 1), ('b.py', 100000), ('c.py', 1)]:
+            with open(name, "w") as f:
+                f.write("x = 1\n" * size)
+        (first, stderr, rc) = fullshell('git lint -j 1 --no-cache')
+        with open("invocations") as f:
+            assert [os.path.basename(line.strip()) for line in f] == ['b.py', 'a.py', 'c.py']
+        with open(".git/git-lint/durations.json") as f:
+            history = json.load(f)
+        assert sorted(history['linters']['stub'].keys()) == ['a.py', 'b.py', 'c.py']
+
+        # What was slow last time goes first, whatever its size.
+        for (name, milliseconds) in [('a.py', 1), ('b.py', 1000), ('c.py', 1000000)]:
+            history['linters']['stub'][name][0] = milliseconds
+        with open(".git/git-lint/durations.json", "w") as f:
+            json.dump(history, f)
+        os.unlink("invocations")
+        (second, stderr, rc) = fullshell('git lint -j 1 --no-cache')
+        with open("invocations") as f:
+            assert [os.path.basename(line.strip()) for line in f] == ['c.py', 'b.py', 'a.py']
+        assert first == second
+
+
+def test_20_shards_divide_the_work_and_merge_back():
+    import json
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository(script=counting_lint_script)
+        for (name, size) in [('a.py', 1), ('b.py', 5000), ('c.py', 1), ('d.py', 1), ('e.py', 2000)]:
+            with open(name, "w") as f:
+                f.write("x = 1\n" * size)
+        (whole, stderr, whole_rc) = fullshell('git lint --no-cache')
+        os.unlink("invocations")
+
+        def run_shards(arguments=''):
+            shards = []
+            for i in [1, 2, 3]:
+                fullshell('git lint --no-cache {} --shard {}/3 > shard-{}.json'.format(arguments, i, i))
+                with open('shard-{}.json'.format(i)) as f:
+                    shards.append(json.load(f))
+            return shards
+
+        # This clone's own history is left out, so every clone divides the work alike.
+        shards = run_shards()
+        names = [sorted([result[0] for result in shard['results']]) for shard in shards]
+        assert sorted(sum(names, [])) == ['a.py', 'b.py', 'c.py', 'd.py', 'e.py']
+        # By size, the largest files are the most costly, and are spread out.
+        assert names[0] == ['b.py'] and 'e.py' in names[1]
+        with open("invocations") as f:
+            assert len(f.readlines()) == 5
+        os.unlink(".git/git-lint/durations.json")
+        assert [shard['partition'] for shard in run_shards()] == [shards[0]['partition']] * 3
+
+        # A shared history file says a.py is the costly one.
+        with open("history.json", "w") as f:
+            json.dump({'runs': 1, 'linters': {'stub': dict(
+                [(name, [10.0, 6, 1]) for name in ['b.py', 'c.py', 'd.py', 'e.py']] +
+                [('a.py', [100000.0, 6, 1])])}}, f)
+        shared = run_shards('--shard-history history.json')
+        assert sorted([result[0] for result in shared[0]['results']]) == ['a.py']
+        (stdout, stderr, rc) = fullshell('git lint --shard 1/3 --shard-history missing.json')
+        assert rc != 0 and 'missing.json' in stderr
+
+        (merged, stderr, merged_rc) = fullshell('git lint --merge-results shard-1.json shard-2.json shard-3.json')
+        assert merged == whole and merged_rc == whole_rc == 1
+        (stdout, stderr, rc) = fullshell('git lint --merge-results shard-1.json shard-3.json')
+        assert rc != 0 and 'missing 2' in stderr
+
+
+def test_21_workers_run_jobs_for_a_coordinator():
+    import hashlib
+    import hmac
+    import json
+    import socket
+    secret = 'shared by the team'
+    secured = dict(environment, GIT_LINT_JOBS_SECRET=secret)
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository(script=counting_lint_script)
+        for name in ['a.py', 'b.py', 'c.py']:
+            with open(name, "w") as f:
+                f.write("x = 1\n")
+        (local, stderr, local_rc) = fullshell('git lint --no-cache')
+        os.unlink("invocations")
+
+        (stdout, stderr, rc) = fullshell('git lint --serve-jobs localhost:0')
+        assert rc != 0 and 'GIT_LINT_JOBS_SECRET' in stderr
+
+        coordinator = subprocess.Popen('exec git lint --no-cache --serve-jobs localhost:0', shell=True,
+                                       env=secured, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                       universal_newlines=True)
+        try:
+            address = coordinator.stderr.readline().split()[-1]
+            (host, port) = address.rsplit(':', 1)
+
+            def prove(role, challenge):
+                return hmac.new(secret.encode('utf-8'), (role + ':' + challenge).encode('utf-8'),
+                                hashlib.sha256).hexdigest()
+
+            # Without the secret, no job is handed out.
+            stranger = socket.create_connection((host, int(port)))
+            replies = stranger.makefile('r')
+            json.loads(replies.readline())
+            stranger.sendall(b'{"hello": "guess", "challenge": "x"}\n')
+            assert 'error' in json.loads(replies.readline())
+            replies.close()
+            stranger.close()
+            (stdout, stderr, rc) = fullshell('git lint --worker ' + address,
+                                             dict(environment, GIT_LINT_JOBS_SECRET='wrong'))
+            assert rc != 0 and 'secret' in stderr
+
+            # A worker that takes a job and dies; its job must go to another.
+            dying = socket.create_connection((host, int(port)))
+            replies = dying.makefile('r')
+            challenge = json.loads(replies.readline())['challenge']
+            hello = {'hello': prove('worker', challenge), 'challenge': 'mine'}
+            dying.sendall((json.dumps(hello) + '\n').encode('utf-8'))
+            assert json.loads(replies.readline())['hello'] == prove('coordinator', 'mine')
+            job = None
+            while job is None:
+                dying.sendall(b'{"want": "job"}\n')
+                reply = json.loads(replies.readline())
+                job = reply.get('job', None)
+            replies.close()
+            dying.close()
+
+            os.mkdir("elsewhere")
+            os.chdir("elsewhere")
+            (stdout, stderr, rc) = fullshell('git lint --worker ' + address, secured)
+            os.chdir(path)
+            assert rc == 0
+            (remote, errors) = coordinator.communicate()
+        finally:
+            if coordinator.poll() is None:
+                coordinator.kill()
+        assert remote == local and coordinator.returncode == local_rc == 1
+        # The worker ran the linter from its own copy of the repository's files.
+        assert not os.path.exists("invocations")
+
+
+passing_lint_script = """#!/bin/sh
+echo "$1" >> invocations
+grep -q bad "$1" && echo "bad: $(basename "$1")" && exit 1
+exit 0
+"""
+
+
+def test_22_clean_staging_areas_are_remembered():
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository(script=passing_lint_script)
+        with open(".gitignore", "w") as f:
+            f.write("invocations\n")
+        with open("a.py", "w") as f:
+            f.write("good\n")
+        shell('git add a.py .gitignore')
+
+        def lint():
+            (stdout, stderr, rc) = fullshell('git lint -s --snapshot')
+            linted = os.path.exists("invocations")
+            if linted:
+                os.unlink("invocations")
+            return (rc, linted)
+
+        assert lint() == (0, True)
+        # The same index, with the same linters, isn't linted again, whatever the workspace holds.
+        with open("a.py", "w") as f:
+            f.write("bad\n")
+        assert lint() == (0, False)
+
+        shell('git add a.py')
+        assert lint() == (1, True)
+        assert lint()[0] == 1
+
+        shell('git checkout HEAD -- a.py 2>/dev/null || git rm -q --cached a.py')
+        with open("a.py", "w") as f:
+            f.write("good\n")
+        shell('git add a.py')
+        assert lint() == (0, False)
+
+        # Linting only what's staged under a subdirectory says nothing about the rest of the tree.
+        os.mkdir("sub")
+        with open(os.path.join("sub", "c.py"), "w") as f:
+            f.write("good\n")
+        with open("b.py", "w") as f:
+            f.write("bad\n")
+        shell('git add sub/c.py b.py')
+        os.chdir("sub")
+        assert fullshell('git lint -s --snapshot')[2] == 0
+        assert fullshell('git lint -s -b --snapshot')[2] == 1
+        os.chdir(path)
+        assert lint()[0] == 1
+
+
+def test_23_revision_ranges_are_linted_from_the_object_store():
+    with gittemp() as path:
+        os.chdir(path)
+        os.mkdir("work")
+        os.chdir("work")
+        config = stub_lint_src.replace('%(repodir)s', os.path.join(path, 'bin'))
+        make_stub_repository(config)
+        os.mkdir(os.path.join(path, 'bin'))
+        shutil.copy("stub-lint", os.path.join(path, 'bin', 'stub-lint'))
+        with open("a.py", "w") as f:
+            f.write("x = 1\n")
+        shell('git add a.py && git commit -q -m "Add a.py"')
+        # What's in the workspace isn't what the commit holds, and isn't linted.
+        os.unlink("a.py")
+        with open("b.py", "w") as f:
+            f.write("x = 2\n")
+
+        (stdout, stderr, rc) = fullshell('git lint --pr')
+        assert rc == 1
+        assert 'a.py' in stdout
+        assert 'b.py' not in stdout
+        (stdout, stderr, rc) = fullshell('git lint -r HEAD~1..HEAD --no-cache')
+        assert rc == 1
+        assert 'bad: a.py' in stdout
+
+        shell('git clone -q --bare . ../bare.git')
+        os.chdir(os.path.join(path, 'bare.git'))
+        (stdout, stderr, rc) = fullshell('git lint --pr')
+        assert rc == 1
+        assert 'bad: a.py' in stdout
+        assert os.listdir(os.path.join(path, 'bare.git')).count('a.py') == 0
+        (stdout, stderr, rc) = fullshell('git lint')
+        assert 'bare repository' in stderr
+
+
+stdin_lint_src = """
+[stdin]
+command = %(repodir)s/stdin-lint --lint
+match = .py
+print = False
+condition = error
+stdin = true
+stdin-filename = --name={filename}
+"""
+
+stdin_lint_script = """#!/bin/sh
+read line
+if [ "$line" != "good" ]; then
+    echo "bad: $(basename "${2#--name=}") ($#)"
+    exit 1
+fi
+"""
+
+
+def test_24_stdin_linters_are_piped_the_content():
+    import json
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository(stdin_lint_src, stdin_lint_script)
+        shell('git mv stub-lint stdin-lint && git commit -q -m "Rename"')
+        with open("a.py", "w") as f:
+            f.write("bad\n")
+        with open("b.py", "w") as f:
+            f.write("good\n")
+        (stdout, stderr, rc) = fullshell('git lint --no-cache')
+        assert rc == 1
+        assert 'bad: a.py (2)' in stdout
+        assert 'b.py' not in stdout
+
+        # Staged content is read from the object store; nothing is stashed or copied.
+        shell('git add b.py')
+        with open("b.py", "w") as f:
+            f.write("bad\n")
+        (stdout, stderr, rc) = fullshell('git lint -s --no-cache --trace trace.json')
+        assert rc == 0
+        with open("trace.json") as f:
+            names = set([event['name'] for event in json.load(f)['traceEvents']])
+        assert not (set(['stash', 'snapshot']) & names)
+        with open("b.py") as f:
+            assert f.read() == "bad\n"
+
+
+def test_25_results_are_shared_between_clones():
+    import json
+    import threading
+    try:
+        from http.server import HTTPServer, BaseHTTPRequestHandler
+    except ImportError:
+        from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+    entries = {}
+
+    class StandIn(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in entries:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(entries[self.path])
+
+        def do_PUT(self):
+            entries[self.path] = self.rfile.read(int(self.headers['Content-Length']))
+            self.send_response(201)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), StandIn)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    env = dict(environment)
+    env['GIT_LINT_CACHE_SECRET'] = 'team secret'
+    url = 'http://127.0.0.1:{}/lint'.format(server.server_address[1])
+
+    def invocations():
+        if not os.path.exists("invocations"):
+            return []
+        with open("invocations") as f:
+            return [os.path.basename(line.strip()) for line in f]
+
+    try:
+        with gittemp() as path:
+            os.chdir(path)
+            os.mkdir("origin")
+            os.chdir("origin")
+            make_stub_repository(script=counting_lint_script)
+            with open(".gitignore", "w") as f:
+                f.write("invocations\n")
+            with open("a.py", "w") as f:
+                f.write("x = 1\n")
+            shell('git add . && git commit -q -m "Add a.py"')
+
+            for (clone, location) in [('first', url), ('second', url),
+                                      ('third', os.path.join(path, 'shared')),
+                                      ('fourth', os.path.join(path, 'shared'))]:
+                os.chdir(path)
+                shell('git clone -q origin ' + clone)
+                os.chdir(clone)
+                (stdout, stderr, rc) = fullshell('git lint -a --shared-cache ' + location, env)
+                assert rc == 1
+                assert 'bad: a.py' in stdout
+                linted = invocations()
+                assert linted == ((clone in ['first', 'third'] and ['a.py']) or [])
+
+            # An entry not signed with the secret is no entry at all.
+            for key in entries:
+                entry = json.loads(entries[key].decode('utf-8'))
+                entry['result'][2] = 0
+                entry['result'][3] = []
+                entries[key] = json.dumps(entry).encode('utf-8')
+            os.chdir(path)
+            shell('git clone -q origin fifth')
+            os.chdir('fifth')
+            (stdout, stderr, rc) = fullshell('git lint -a --shared-cache ' + url, env)
+            assert rc == 1
+            assert invocations() == ['a.py']
+
+            (stdout, stderr, rc) = fullshell('git lint -a --shared-cache ' + url)
+            assert 'GIT_LINT_CACHE_SECRET' in stderr
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+builtin_lint_src = """
+[grepped]
+command = grep -n debugger
+match = .js
+print = True
+condition = output
+
+[builtin]
+command = builtin:regex
+pattern = debugger
+match = .js
+print = True
+condition = output
+"""
+
+
+def test_26_builtin_regex_reports_as_grep_does():
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository(builtin_lint_src)
+        with open("a.js", "w") as f:
+            f.write("var x = 1;\ndebugger; debugger;\n\nfunction f() { debugger }")
+        with open("b.js", "w") as f:
+            f.write("var y = 2;\n")
+        with open("c.js", "w") as f:
+            pass
+        (stdout, stderr, rc) = fullshell('git lint --no-cache --trace trace.json')
+        assert rc == 1
+        (grepped, builtin) = stdout.split('Linter: builtin')
+        assert grepped.replace('Linter: grepped', '').strip() == builtin.strip()
+        assert '   a.js: 2:debugger; debugger;' in builtin
+        assert '   a.js: 4:function f() { debugger }' in builtin
+
+        import json
+        with open("trace.json") as f:
+            jobs = [event for event in json.load(f)['traceEvents']
+                    if event.get('cat') == 'job' and event['name'] == 'builtin']
+        assert len(jobs) == 1
+
+        # As with grep, a match can't run on from one line to the next.
+        from git_lint.builtins import regex
+        content = b'debugger\n  x = 1\n'
+        assert regex({'pattern': r'debugger\s+x'}, 'a.js', content) == ('', '', 1)
+        assert regex({'pattern': r'[^;]x'}, 'a.js', content) == ('2:  x = 1\n', '', 0)
+
+        # A pattern that can't be used stops the run before any file is linted.
+        for setting in ['', 'pattern = (']:
+            with open(".git-lint", "w") as f:
+                f.write(builtin_lint_src.replace('pattern = debugger', setting))
+            (stdout, stderr, rc) = fullshell('git lint --no-cache')
+            assert rc == 1 and 'Syntax error in linter configuration for builtin' in stderr
+
+
+def test_27_builtins_can_be_registered(tmpdir):
+    from collections import namedtuple
+    from git_lint import builtins
+    from git_lint.git_lint import Linters
+    Linter = namedtuple('Linter', ['name', 'linter'])
+
+    def shout(linter, filename, content):
+        found = content[:].upper() == content[:]
+        return ((not found and 'not shouting\n') or '', '', 0)
+
+    builtins.register('shout', shout)
+    try:
+        for (name, content) in [('loud.txt', b'HELLO\n'), ('quiet.txt', b'hello\n')]:
+            tmpdir.join(name).write_binary(content)
+        linter = Linter('shout', {'command': 'builtin:shout', 'condition': 'output'})
+        results = Linters.run_job((linter, [str(tmpdir.join('loud.txt')), str(tmpdir.join('quiet.txt'))]),
+                                  str(tmpdir))
+        assert results == [('loud.txt', 'shout', 0, []),
+                           ('quiet.txt', 'shout', 1, ['  not shouting'])]
+        assert git_lint.linter_exists('builtin:shout', 'shout') == os.path.abspath(__file__)
+        assert git_lint.linter_exists('builtin:whisper', 'whisper') is False
+    finally:
+        builtins.registry.pop('shout')
+
+
+def test_28_linting_starts_before_the_listing_ends(tmpdir):
+    from collections import namedtuple
+    from git_lint import builtins
+    from git_lint.git_lint import Linters
+    Linter = namedtuple('Linter', ['name', 'linter'])
+    events = []
+
+    def note(linter, filename, content):
+        events.append('linted ' + os.path.basename(filename))
+        return ('', '', 0)
+
+    builtins.register('note', note)
+    try:
+        linter = Linter('note', {'command': 'builtin:note', 'batch': '1'})
+        names = ['{}.txt'.format(i) for i in range(12)]
+        for name in names:
+            tmpdir.join(name).write('x\n')
+
+        def windows():
+            for start in range(0, len(names), 4):
+                events.append('listed {}'.format(start))
+                yield [(linter, str(tmpdir.join(name))) for name in names[start:start + 4]]
+
+        for jobs in [1, 2]:
+            del events[:]
+            results = list(Linters([linter], [], jobs).pipeline(windows()))
+            assert sorted([os.path.basename(result[0]) for result in results]) == sorted(names)
+            assert all([result[2] == 0 for result in results])
+        # One at a time, each window is linted before the next is listed.
+        del events[:]
+        list(Linters([linter], [], 1).pipeline(windows()))
+        assert events.index('linted 3.txt') < events.index('listed 4')
+        assert events.index('linted 7.txt') < events.index('listed 8')
+    finally:
+        builtins.registry.pop('note')
+
+
+noisy_lint_src = """
+[noisy]
+command = %(repodir)s/noisy-lint
+match = .py
+print = False
+condition = error
+max-output = 5 lines
+"""
+
+noisy_lint_script = """#!/bin/sh
+echo "$1" >> invocations
+for i in $(seq 1 1000); do
+    echo "bad line $i"
+done
+exit 1
+"""
+
+
+def test_29_linter_output_is_capped():
+    import time
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository(noisy_lint_src, noisy_lint_script)
+        shell('git mv stub-lint noisy-lint && git commit -q -m "Rename"')
+        with open(".gitignore", "w") as f:
+            f.write("invocations\n")
+        for name in ['a.py', 'b.py']:
+            with open(name, "w") as f:
+                f.write("x = 1\n")
+
+        (stdout, stderr, rc) = fullshell('git lint a.py')
+        assert rc == 1
+        lines = [line.strip() for line in stdout.splitlines() if line.startswith('  ')]
+        assert lines[:5] == ['bad line {}'.format(i) for i in range(1, 6)]
+        assert 'bad line 6' not in stdout
+        assert lines[5].startswith('[git-lint: ')
+        spill = os.path.join(path, lines[5].split(' all of it is in ')[1].rstrip(']'))
+        output = os.path.join(path, '.git', 'git-lint', 'output')
+        assert os.path.dirname(os.path.dirname(spill)) == output
+        with open(spill) as f:
+            assert f.read().splitlines() == ['bad line {}'.format(i) for i in range(1, 1001)]
+        # A report with output left out isn't cached, so the file is linted again.
+        fullshell('git lint a.py')
+        with open("invocations") as f:
+            assert len(f.read().splitlines()) == 2
+        # Each run spills into a directory of its own, so reports made at
+        # the same time point at output that's still there.
+        assert os.path.exists(spill)
+        assert len(os.listdir(output)) == 2
+        # What runs spilled more than a day ago is removed.
+        old = time.time() - 2 * 24 * 60 * 60
+        os.utime(os.path.dirname(spill), (old, old))
+        fullshell('git lint a.py')
+        assert not os.path.exists(spill)
+        assert len(os.listdir(output)) == 2
+
+        # The whole run keeps no more than --max-output.
+        (stdout, stderr, rc) = fullshell('git lint --no-cache --max-output "7 lines"')
+        assert rc == 1
+        assert len([line for line in stdout.splitlines() if 'bad line' in line]) == 7
+        assert len([line for line in stdout.splitlines() if '[git-lint: ' in line]) == 2
+        (stdout, stderr, rc) = fullshell('git lint --max-output lots')
+        assert '--max-output' in stderr
+
+
+batched_noisy_lint_src = """
+[noisy]
+command = %(repodir)s/noisy-lint
+match = .py
+print = True
+condition = error
+batch = 10
+max-output = 5 lines
+"""
+
+batched_noisy_lint_script = """#!/bin/sh
+for file in "$@"; do
+    echo "$file" >> invocations
+    count=$(cat "$file")
+    for i in $(seq 1 $count); do
+        echo "$file:$i: bad"
+    done
+done
+exit 1
+"""
+
+
+def test_30_batches_with_output_left_out_are_run_file_by_file():
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository(batched_noisy_lint_src, batched_noisy_lint_script)
+        shell('git mv stub-lint noisy-lint && git commit -q -m "Rename"')
+        with open(".gitignore", "w") as f:
+            f.write("invocations\n")
+        for (name, count) in [('a.py', 20), ('b.py', 1)]:
+            with open(name, "w") as f:
+                f.write("{}\n".format(count))
+
+        for run in range(2):
+            (stdout, stderr, rc) = fullshell('git lint')
+            assert rc == 1
+            assert 'b.py:1: bad' in stdout
+            assert len([line for line in stdout.splitlines() if 'a.py:' in line and ': bad' in line]) == 5
+            assert len([line for line in stdout.splitlines() if '[git-lint: ' in line]) == 1
+
+
+def test_31_errors_in_jobs_do_not_hang_the_pool(tmpdir):
+    import sys
+    from collections import namedtuple
+    from git_lint import builtins
+    from git_lint.git_lint import Linters
+    Linter = namedtuple('Linter', ['name', 'linter'])
+
+    def leave(linter, filename, content):
+        sys.exit('leaving')
+
+    builtins.register('leave', leave)
+    try:
+        linter = Linter('leave', {'command': 'builtin:leave', 'batch': '1'})
+        filenames = [str(tmpdir.join('{}.txt'.format(i))) for i in range(4)]
+        for filename in filenames:
+            with open(filename, 'w') as f:
+                f.write('x\n')
+        with pytest.raises(SystemExit):
+            list(Linters([linter], filenames, 4,
+                         pairs=[(linter, filename) for filename in filenames]).stream())
+        with pytest.raises(SystemExit):
+            list(Linters([linter], [], 4).pipeline(iter([[(linter, filename) for filename in filenames]])))
+    finally:
+        builtins.registry.pop('leave')
+
+    # Settings that can't be used are reported before any job is started.
+    for setting in ['max-output = lots', 'batch = 1\nbatch-pattern = (', 'stdin-filename = "']:
+        with gittemp() as path:
+            os.chdir(path)
+            make_stub_repository(stub_lint_src + setting + '\n')
+            for name in ['a.py', 'b.py', 'c.py']:
+                with open(name, "w") as f:
+                    f.write("x = 1\n")
+            (stdout, stderr, rc) = fullshell('timeout 60 git lint -j 4')
+            assert rc == 1
+            assert 'Syntax error in linter configuration for stub' in stderr
+
+
+def test_32_listed_files_are_hashed_a_window_at_a_time(monkeypatch):
+    from collections import namedtuple
+    from git_lint.git_lint import Linters, Repository, get_blob_hashes
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository()
+        for name in ['same.py', 'changed.py', 'spaced name.py']:
+            with open(name, "w") as f:
+                f.write("x = 1\n")
+        shell('git add . && git commit -q -m "More"')
+        with open('changed.py', "w") as f:
+            f.write("x = 2\n")
+        with open('new.py', "w") as f:
+            f.write("x = 3\n")
+        filenames = [os.path.join(path, name) for name in ['same.py', 'changed.py', 'spaced name.py', 'new.py']]
+
+        # Only the files asked about are looked up; the index isn't read whole.
+        monkeypatch.setattr(git_lint, 'repository', Repository())
+        listed = get_blob_hashes(filenames, False, True)
+        assert 'index' not in git_lint.repository.__dict__
+        assert 'modified' not in git_lint.repository.__dict__
+        assert listed == get_blob_hashes(filenames, False)
+        assert len(set(listed.values())) == 3
+        assert get_blob_hashes([], False, True) == {}
+
+    # Each file's hash is forgotten once every linter's result for it has come.
+    from git_lint import builtins
+    Linter = namedtuple('Linter', ['name', 'linter'])
+    Cache = namedtuple('Cache', ['hashes', 'fetch', 'get', 'put', 'close'])
+    seen = []
+    cache = Cache({}, lambda pairs: None, lambda linter, filename: None,
+                  lambda linter, filename, result: seen.append(len(cache.hashes)), lambda: None)
+    linters = [Linter(name, {'command': 'builtin:pass', 'batch': '1'}) for name in ['one', 'two']]
+    builtins.register('pass', lambda linter, filename, content: ('', '', 0))
+    try:
+        with gittemp() as path:
+            names = [os.path.join(path, '{}.txt'.format(i)) for i in range(6)]
+            for name in names:
+                with open(name, "w") as f:
+                    f.write("x\n")
+
+            def windows():
+                for start in range(0, len(names), 2):
+                    cache.hashes.update(dict([(name, 'sha') for name in names[start:start + 2]]))
+                    yield [(linter, name) for linter in linters for name in names[start:start + 2]]
+
+            running = Linters(linters, [], 1, cache)
+            assert len(list(running.pipeline(windows()))) == 12
+            assert cache.hashes == {}
+            assert running.held == {}
+            assert max(seen) <= 2
+    finally:
+        builtins.registry.pop('pass')
+
+
+def test_33_daemon_lints_the_index_the_hook_is_given():
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository()
+        daemon = start_daemon(environment)
+        try:
+            assert os.path.exists('.git/git-lint/daemon.sock')
+            # As 'git commit -a' does, stage a.py in a temporary index only.
+            with open("a.py", "w") as f:
+                f.write("x = 1\n")
+            shell('cp .git/index .git/next-index')
+            hook = dict(environment, GIT_INDEX_FILE=os.path.join(path, '.git', 'next-index'))
+            shell('git add a.py', hook)
+            (stdout, stderr, rc) = fullshell('git lint --no-daemon -s', hook)
+            assert rc == 1 and 'bad: a.py' in stdout
+            (stdout, stderr, rc) = fullshell('git lint -s', hook)
+            assert rc == 1 and 'bad: a.py' in stdout
+            (stdout, stderr, rc) = fullshell('git lint -s')
+            assert rc == 0
+
+            # A run that fails in any way is reported, and the daemon goes on serving.
+            import json
+            import socket
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect('.git/git-lint/daemon.sock')
+            client.sendall((json.dumps({'cwd': path, 'options': {}, 'filenames': 5}) + '\n').encode('utf-8'))
+            reply = json.loads(client.makefile('r').readline())
+            client.close()
+            assert reply['status'] == 1 and reply['error']
+            (stdout, stderr, rc) = fullshell('git lint -s', hook)
+            assert rc == 1 and 'bad: a.py' in stdout
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+
+def test_34_jobs_that_cannot_run_on_workers_fail_without_stopping_them():
+    import hashlib
+    import hmac
+    import json
+    import socket
+    secret = 'shared by the team'
+    secured = dict(environment, GIT_LINT_JOBS_SECRET=secret)
+
+    def serve(arguments, env):
+        coordinator = subprocess.Popen('exec git lint --no-cache --serve-jobs localhost:0 ' + arguments,
+                                       shell=True, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                       universal_newlines=True)
+        return (coordinator, coordinator.stderr.readline().split()[-1])
+
+    def take_a_job_and_drop_it(address):
+        (host, port) = address.rsplit(':', 1)
+        connection = socket.create_connection((host, int(port)))
+        replies = connection.makefile('r')
+        challenge = json.loads(replies.readline())['challenge']
+        hello = hmac.new(secret.encode('utf-8'), ('worker:' + challenge).encode('utf-8'), hashlib.sha256)
+        connection.sendall((json.dumps({'hello': hello.hexdigest(), 'challenge': 'x'}) + '\n').encode('utf-8'))
+        replies.readline()
+        reply = {}
+        while 'job' not in reply:
+            connection.sendall(b'{"want": "job"}\n')
+            reply = json.loads(replies.readline())
+        replies.close()
+        connection.close()
+
+    with gittemp() as path:
+        os.chdir(path)
+        make_stub_repository(git_lint_src.replace('pep8 -r --ignore=E501,W293,W391', 'stub-lint'))
+        os.mkdir("bin")
+        os.rename("stub-lint", "bin/stub-lint")
+        for name in ['a.py', 'b.py']:
+            with open(name, "w") as f:
+                f.write("x = 1\n")
+        found = dict(secured, PATH=os.path.join(path, 'bin') + ':' + environment['PATH'])
+
+        # Only the coordinator can find the linter; the worker fails its jobs, and goes on.
+        (coordinator, address) = serve('', found)
+        try:
+            (stdout, stderr, rc) = fullshell('git lint --worker ' + address, secured)
+            assert rc == 0
+            (report, errors) = coordinator.communicate()
+        finally:
+            if coordinator.poll() is None:
+                coordinator.kill()
+        assert coordinator.returncode == 1
+        assert 'stub-lint' in report and 'bad: a.py' not in report
+
+        # A job whose every worker stops is given up on.
+        (coordinator, address) = serve('a.py', found)
+        try:
+            for i in range(3):
+                take_a_job_and_drop_it(address)
+            (report, errors) = coordinator.communicate()
+        finally:
+            if coordinator.poll() is None:
+                coordinator.kill()
+        assert coordinator.returncode == 1 and '3 in all, stopped' in report
+
+        # Files with no content to hand out are unfindable, and not handed out.
+        with open("untracked.py", "w") as f:
+            f.write("x = 1\n")
+        (coordinator, address) = serve('-s untracked.py', found)
+        (report, errors) = coordinator.communicate()
+        assert 'untracked.py' in report and 'bad: untracked.py' not in report
+
+
+def test_35_the_cache_is_walked_only_when_it_outgrows_its_limit(tmpdir, monkeypatch):
+    import json
+    from git_lint import cache
+    from git_lint.cache import ResultCache
+    walks = []
+    walk = os.walk
+    monkeypatch.setattr(cache.os, 'walk', lambda path: walks.append(path) or walk(path))
+    path = str(tmpdir.join('cache'))
+    result = ('a.py', 'stub', 1, ['x' * 100])
+
+    def run(keys, max_bytes=2000):
+        store = ResultCache(path, max_bytes)
+        for key in keys:
+            store.put(key, result)
+        store.prune()
+
+    # The first run has no total to go on, so it measures the store.
+    run(['{:040x}'.format(1)])
+    assert len(walks) == 1
+    with open(os.path.join(path, 'size.json')) as f:
+        size = json.load(f)['bytes']
+    # After that, runs that stay under the limit only add to the total.
+    run(['{:040x}'.format(2)])
+    run(['{:040x}'.format(2)])
+    assert len(walks) == 1
+    with open(os.path.join(path, 'size.json')) as f:
+        assert json.load(f)['bytes'] == 2 * size
+    # Going over the limit walks the store, dropping the least recently used.
+    run(['{:040x}'.format(key) for key in range(3, 30)])
+    assert len(walks) == 2
+    with open(os.path.join(path, 'size.json')) as f:
+        assert json.load(f)['bytes'] <= 2000
+    assert ResultCache(path).get('{:040x}'.format(1)) is None
+    assert ResultCache(path).get('{:040x}'.format(29)) == result
+
+
+def test_36_new_files_are_estimated_from_running_totals(tmpdir):
+    from git_lint.history import JobHistory
+    history = JobHistory(str(tmpdir.join('durations.json')), max_entries=2)
+    history.record('stub', 'a.py', 1024, 10.0)
+    history.record('stub', 'b.py', 3072, 30.0)
+    assert history.estimate('stub', 'new.py', 1024) == 20.0 + 10.0
+    history.record('stub', 'b.py', 3072, 50.0)
+    assert history.estimate('stub', 'new.py', 4096) == 20.0 + 50.0 * 4096 / 4096
+    history.record('stub', 'c.py', 1024, 90.0)
+    history.save()
+    # Entries dropped when the store is pruned no longer count, and a reloaded history agrees.
+    assert history.estimate('stub', 'new.py', 1024) == 20.0 + 130.0 / 4
+    assert JobHistory(history.path).estimate('stub', 'new.py', 1024) == 20.0 + 130.0 / 4